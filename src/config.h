@@ -27,6 +27,8 @@
 #define MQTT_PASSWORD "admin"
 #define MQTT_RECONNECT_INTERVAL 5000
 #define MQTT_MAX_RETRIES 10
+// Presence (retained, LWT "offline") and heartbeat go to MQTT_TOPIC_PREFIX/display/<client id>/...
+#define DISPLAY_HEARTBEAT_INTERVAL 60000
 
 /* -----------------------------------------------------------------------------
  * Tool
@@ -9,6 +9,7 @@
 #include <lvgl.h>
 #include <PubSubClient.h>
 #include <ArduinoJson.h>
+#include <rom/crc.h>
 #include "config.h"
 #include "hardware.h"
 
@@ -17,6 +18,16 @@
 String mqtt_topic_status = String(MQTT_TOPIC_PREFIX) + "/" + String(TARGET_TOOL_ID) + "/status";
 String mqtt_topic_overall = String(MQTT_TOPIC_PREFIX) + "/overall";
 
+// Fleet presence: retained online/offline (offline is the LWT) and a periodic heartbeat
+String mqtt_topic_presence = String(MQTT_TOPIC_PREFIX) + "/display/" + String(MQTT_CLIENT_ID) + "/presence";
+String mqtt_topic_heartbeat = String(MQTT_TOPIC_PREFIX) + "/display/" + String(MQTT_CLIENT_ID) + "/heartbeat";
+String presence_online = String("{\"state\":\"online\",\"tool_id\":") + String(TARGET_TOOL_ID) + "}";
+String presence_offline = String("{\"state\":\"offline\",\"tool_id\":") + String(TARGET_TOOL_ID) + "}";
+
+// CRC-32 of the last status payload applied, reported in heartbeats so the server can spot missed updates
+uint32_t appliedStatusCrc = 0;
+bool haveAppliedStatus = false;
+
 // Display configuration (TFT 480x320)
 TFT_eSPI tft = TFT_eSPI();
 
@@ -55,6 +66,7 @@ void create_simple_ui();
 String capitalizeToolName(const char* toolName);
 void updateConnectionStatus();
 void updateStatusIndicator(bool isEnabled);
+void publishHeartbeat();
 
 void setup() {
   Serial.begin(9600);
@@ -120,6 +132,7 @@ void loop() {
     static unsigned long lastWifiAttempt = 0;
     static unsigned long lastMqttAttempt = 0;
     static unsigned long lastStatusUpdate = 0;
+    static unsigned long lastHeartbeat = 0;
     unsigned long now = millis();
 
     // Periodically try to (re)connect WiFi if not connected
@@ -143,6 +156,11 @@ void loop() {
     // Run MQTT client loop when connected
     if (mqttClient.connected()) {
       mqttClient.loop();
+      
+      if (now - lastHeartbeat >= DISPLAY_HEARTBEAT_INTERVAL) {
+        lastHeartbeat = now;
+        publishHeartbeat();
+      }
     }
     
     // Periodically refresh the consolidated WiFi/MQTT status label
@@ -332,11 +350,13 @@ void connectMQTT() {
   if (!mqttClient.connected()) {
     Serial.print("Attempting MQTT connection...");
 
+    // LWT: the broker marks this display offline if the connection drops without a clean disconnect
     bool connected = false;
     if (mqtt_username && mqtt_username[0] != '\0' && mqtt_password && mqtt_password[0] != '\0') {
-      connected = mqttClient.connect(mqtt_client_id, mqtt_username, mqtt_password);
+      connected = mqttClient.connect(mqtt_client_id, mqtt_username, mqtt_password,
+                                     mqtt_topic_presence.c_str(), 1, true, presence_offline.c_str());
     } else {
-      connected = mqttClient.connect(mqtt_client_id);
+      connected = mqttClient.connect(mqtt_client_id, mqtt_topic_presence.c_str(), 1, true, presence_offline.c_str());
     }
 
     if (connected) {
@@ -362,6 +382,10 @@ void connectMQTT() {
       Serial.print("Subscribed to: ");
       Serial.println(mqtt_topic_overall);
       
+      // Announce after subscribing so the server's targeted resync reaches this session
+      mqttClient.publish(mqtt_topic_presence.c_str(), presence_online.c_str(), true);
+      publishHeartbeat();
+      
       // Update status
       updateConnectionStatus();
     } else {
@@ -407,6 +431,24 @@ void mqttCallback(char* topic, byte* payload, unsigned int length) {
   Serial.println(" bytes");
   
   processMQTTMessage(topic, message);
+  
+  if (strcmp(topic, mqtt_topic_status.c_str()) == 0) {
+    appliedStatusCrc = crc32_le(0, payload, length);
+    haveAppliedStatus = true;
+  }
+}
+
+// Heartbeat: uptime, signal strength and which status payload is on screen
+void publishHeartbeat() {
+  char heartbeat[160];
+  char applied[9] = "";
+  if (haveAppliedStatus) {
+    snprintf(applied, sizeof(applied), "%08lx", (unsigned long)appliedStatusCrc);
+  }
+  snprintf(heartbeat, sizeof(heartbeat),
+           "{\"tool_id\":%d,\"uptime_s\":%lu,\"rssi\":%d,\"applied\":\"%s\"}",
+           TARGET_TOOL_ID, (unsigned long)(millis() / 1000), (int)WiFi.RSSI(), applied);
+  mqttClient.publish(mqtt_topic_heartbeat.c_str(), heartbeat);
 }
 
 // Process MQTT Message
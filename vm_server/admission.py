@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Ingest admission control for the NEMO Tool Display VM server
+Bounded two-lane queue between the NEMO MQTT client and message processing,
+with per-tool and global rate limits and explicit load-shedding policies
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Events that change what a display shows go first and are never rate-shed or superseded;
+# a lost end would leave a display showing "in use" with nothing later to correct it
+HIGH_PRIORITY_EVENTS = ("disabled", "start", "end")
+# Events where only the newest queued copy per tool matters
+SUPERSEDABLE_EVENTS = ("enabled", "overall")
+
+# Per-tool state key: (source, tool id) for messages from a named source, else the bare tool id
+ToolKey = Union[str, Tuple[object, str]]
+
+LANE_HIGH = "high"
+LANE_NORMAL = "normal"
+
+
+def classify_topic(topic: str) -> Tuple[Optional[str], Optional[str]]:
+    """Return (tool_key, event_type) for a NEMO topic.
+
+    nemo/tools/<id>/<event> -> (<id>, <event>); nemo/tools/overall -> ("overall", "overall");
+    anything else -> (None, None).
+    """
+    if topic == "nemo/tools/overall":
+        return "overall", "overall"
+    parts = topic.split("/")
+    if len(parts) >= 4 and parts[0] == "nemo" and parts[1] == "tools":
+        return parts[2], parts[3]
+    return None, None
+
+
+class IngestMessage:
+    """One queued inbound message"""
+
+    __slots__ = ("topic", "payload", "source", "tool_key", "event_type", "lane", "received_at", "dropped")
+
+    def __init__(self, topic: str, payload: bytes, source, tool_key, event_type: Optional[str], lane: str):
+        self.topic = topic
+        self.payload = payload
+        self.source = source
+        self.tool_key = tool_key
+        self.event_type = event_type
+        self.lane = lane
+        self.received_at = time.monotonic()
+        self.dropped = False
+
+
+class AdmissionController:
+    """Admit, shed and schedule inbound NEMO messages.
+
+    Shedding policies, applied in this order when a message is offered:
+      1. superseded: a queued ``enabled``/``overall`` for the same tool is replaced in place
+         by the newer one; queued normal-lane events for a tool are dropped when a newer
+         high-priority event for that tool arrives (the newer state wins).
+      2. tool_rate: an ``enabled``/``overall`` beyond the per-tool rate takes the place of the
+         tool's newest queued message, or is held as the tool's single deferred message and
+         queued once the tool's rate allows, so the latest state always gets through; other
+         normal-lane messages beyond the per-tool rate are dropped.
+      3. overflow: when the queue is full, the oldest normal-lane message is dropped;
+         then a deferred one; if only high-priority messages are queued the incoming
+         message is rejected.
+    The worker thread drains the high lane before the normal lane, paced by the global rate.
+    Messages carry the upstream ``source`` they came from; per-tool state is kept per
+    source, so the same tool id from two NEMO instances never supersedes the other.
+    The handler is called as ``handler(topic, payload, source, received_at)``; ``on_shed``
+    (optional) is called as ``on_shed(source)`` once for every message counted by shed_total().
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[str, bytes, object, float], None],
+        queue_size: int = 1000,
+        global_rate: float = 0,
+        global_burst: Optional[float] = None,
+        tool_rate: float = 0,
+        tool_burst: Optional[float] = None,
+        on_shed: Optional[Callable[[object], None]] = None,
+    ):
+        self.handler = handler
+        self.on_shed = on_shed
+        self.queue_size = queue_size
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.tool_rate = tool_rate
+        self.tool_burst = tool_burst
+        self._tool_buckets: Dict[ToolKey, TokenBucket] = {}
+
+        self._lanes = {LANE_HIGH: deque(), LANE_NORMAL: deque()}
+        # tool_key -> live normal-lane messages for that tool, oldest first
+        self._pending_normal: Dict[ToolKey, List[IngestMessage]] = {}
+        # tool_key -> newest over-rate enabled/overall, waiting for a tool token
+        self._deferred: Dict[ToolKey, IngestMessage] = {}
+        self._live = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+        self.stats = {
+            "offered": 0,
+            "admitted_high": 0,
+            "admitted_normal": 0,
+            "processed": 0,
+            "shed_superseded": 0,
+            "shed_tool_rate": 0,
+            "deferred_tool_rate": 0,
+            "shed_overflow": 0,
+            "rejected_full": 0,
+            "handler_errors": 0,
+            "max_queue_depth": 0,
+            "max_queue_delay_ms": 0.0,
+        }
+
+    # ----- producer side (paho network thread) -----
+
+    def offer(self, topic: str, payload: bytes, source=None) -> bool:
+        """Offer a message; returns False if it was shed or rejected"""
+        tool_key, event_type = classify_topic(topic)
+        if tool_key is not None and source is not None:
+            tool_key = (source, tool_key)
+        lane = LANE_HIGH if event_type in HIGH_PRIORITY_EVENTS else LANE_NORMAL
+
+        with self._cond:
+            self.stats["offered"] += 1
+
+            if lane == LANE_HIGH:
+                if tool_key is not None:
+                    # Consume a token so bursts still count against the tool, but never shed
+                    self._tool_bucket(tool_key).try_acquire()
+                    self._supersede_pending(tool_key)
+            else:
+                if tool_key is not None and event_type in SUPERSEDABLE_EVENTS:
+                    pending = self._pending_normal.get(tool_key)
+                    if pending and pending[-1].event_type == event_type:
+                        # Newest queued event for this tool is the same kind: replace it in place
+                        last = pending[-1]
+                        last.topic = topic
+                        last.payload = payload
+                        self._shed("shed_superseded", source)
+                        return True
+                if tool_key is not None and not self._tool_bucket(tool_key).try_acquire():
+                    if event_type in SUPERSEDABLE_EVENTS:
+                        return self._defer(topic, payload, source, tool_key, event_type)
+                    self._shed("shed_tool_rate", source)
+                    logger.debug(f"[admission] Shed (tool rate) topic={topic}")
+                    return False
+                if event_type in SUPERSEDABLE_EVENTS and tool_key in self._deferred:
+                    # The deferred message is older than this one
+                    self._drop_deferred(tool_key, "shed_superseded")
+
+            if self._live >= self.queue_size and not self._shed_oldest_normal():
+                self._shed("rejected_full", source)
+                logger.debug(f"[admission] Rejected (queue full) topic={topic}")
+                return False
+
+            msg = IngestMessage(topic, payload, source, tool_key, event_type, lane)
+            self._lanes[lane].append(msg)
+            if lane == LANE_NORMAL and tool_key is not None:
+                self._pending_normal.setdefault(tool_key, []).append(msg)
+            self._live += 1
+            self.stats["admitted_" + lane] += 1
+            if self._live > self.stats["max_queue_depth"]:
+                self.stats["max_queue_depth"] = self._live
+            self._cond.notify()
+            return True
+
+    def _defer(self, topic: str, payload: bytes, source, tool_key: ToolKey, event_type: str) -> bool:
+        """Keep an over-rate enabled/overall as the tool's only waiting message (caller holds the lock)"""
+        pending = self._pending_normal.get(tool_key)
+        if pending:
+            # Already queued with a token: the newest queued message carries the new state
+            last = pending[-1]
+            last.topic, last.payload, last.event_type = topic, payload, event_type
+            self._shed("shed_superseded", source)
+            return True
+        held = self._deferred.get(tool_key)
+        if held is not None:
+            held.topic, held.payload, held.event_type, held.source = topic, payload, event_type, source
+            self._shed("shed_superseded", source)
+            return True
+        if self._live >= self.queue_size and not self._shed_oldest_normal():
+            self._shed("rejected_full", source)
+            logger.debug(f"[admission] Rejected (queue full) topic={topic}")
+            return False
+        self._deferred[tool_key] = IngestMessage(topic, payload, source, tool_key, event_type, LANE_NORMAL)
+        self._live += 1
+        self.stats["deferred_tool_rate"] += 1
+        if self._live > self.stats["max_queue_depth"]:
+            self.stats["max_queue_depth"] = self._live
+        self._cond.notify()
+        logger.debug(f"[admission] Deferred (tool rate) topic={topic}")
+        return True
+
+    def _drop_deferred(self, tool_key: ToolKey, counter: str):
+        """Shed a tool's deferred message (caller holds the lock)"""
+        msg = self._deferred.pop(tool_key)
+        self._live -= 1
+        self._shed(counter, msg.source)
+
+    def _shed(self, counter: str, source):
+        """Count one shed message against its source (caller holds the lock)"""
+        self.stats[counter] += 1
+        if self.on_shed is not None:
+            self.on_shed(source)
+
+    def _tool_bucket(self, tool_key: ToolKey) -> TokenBucket:
+        bucket = self._tool_buckets.get(tool_key)
+        if bucket is None:
+            bucket = TokenBucket(self.tool_rate, self.tool_burst)
+            self._tool_buckets[tool_key] = bucket
+        return bucket
+
+    def set_tool_rate(self, rate: float, burst: Optional[float] = None):
+        """Change the per-tool limit for existing and future tool buckets"""
+        with self._cond:
+            self.tool_rate = rate
+            self.tool_burst = burst
+            for bucket in self._tool_buckets.values():
+                bucket.set_rate(rate, burst)
+            self._cond.notify()  # deferred messages may be due sooner
+
+    def _supersede_pending(self, tool_key: ToolKey):
+        """Drop queued and deferred normal-lane messages for a tool (caller holds the lock)"""
+        if tool_key in self._deferred:
+            self._drop_deferred(tool_key, "shed_superseded")
+        pending = self._pending_normal.pop(tool_key, None)
+        if not pending:
+            return
+        for msg in pending:
+            msg.dropped = True
+            self._live -= 1
+            self._shed("shed_superseded", msg.source)
+        self._compact_if_needed(LANE_NORMAL)
+
+    def _shed_oldest_normal(self) -> bool:
+        """Drop the oldest live normal-lane message, else the oldest deferred one (caller holds the lock)"""
+        lane = self._lanes[LANE_NORMAL]
+        while lane:
+            msg = lane.popleft()
+            if msg.dropped:
+                continue
+            self._forget_pending(msg)
+            self._live -= 1
+            self._shed("shed_overflow", msg.source)
+            logger.debug(f"[admission] Shed (overflow) topic={msg.topic}")
+            return True
+        if self._deferred:
+            tool_key = next(iter(self._deferred))
+            logger.debug(f"[admission] Shed (overflow) topic={self._deferred[tool_key].topic}")
+            self._drop_deferred(tool_key, "shed_overflow")
+            return True
+        return False
+
+    def _forget_pending(self, msg: IngestMessage):
+        if msg.lane != LANE_NORMAL or msg.tool_key is None:
+            return
+        pending = self._pending_normal.get(msg.tool_key)
+        if pending:
+            try:
+                pending.remove(msg)
+            except ValueError:
+                pass
+            if not pending:
+                del self._pending_normal[msg.tool_key]
+
+    def _compact_if_needed(self, lane_name: str):
+        """Purge dropped entries once they dominate a lane"""
+        lane = self._lanes[lane_name]
+        if len(lane) > 2 * max(self.queue_size, 1):
+            self._lanes[lane_name] = deque(m for m in lane if not m.dropped)
+
+    # ----- consumer side (worker thread) -----
+
+    def _pop_lane(self, lane_name: str) -> Optional[IngestMessage]:
+        lane = self._lanes[lane_name]
+        while lane:
+            msg = lane.popleft()
+            if msg.dropped:
+                continue
+            self._forget_pending(msg)
+            self._live -= 1
+            return msg
+        return None
+
+    def _pop_deferred(self) -> Tuple[Optional[IngestMessage], Optional[float]]:
+        """A deferred message whose tool has a token, else seconds until the first one will"""
+        wait = None
+        for tool_key in list(self._deferred):
+            bucket = self._tool_bucket(tool_key)
+            if bucket.try_acquire():
+                self._live -= 1
+                return self._deferred.pop(tool_key), None
+            delay = bucket.delay_until_available()
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _next(self, timeout: float) -> Optional[IngestMessage]:
+        with self._cond:
+            deadline = time.monotonic() + timeout
+            while self._running:
+                msg = self._pop_lane(LANE_HIGH)
+                wait = None
+                if msg is None and self._deferred:
+                    msg, wait = self._pop_deferred()
+                if msg is None:
+                    msg = self._pop_lane(LANE_NORMAL)
+                if msg is not None:
+                    return msg
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining if wait is None else min(remaining, max(wait, 0.001)))
+            return None
+
+    def _run(self):
+        while self._running:
+            msg = self._next(timeout=0.5)
+            if msg is None:
+                continue
+            self.global_bucket.acquire()
+            delay_ms = (time.monotonic() - msg.received_at) * 1000.0
+            if delay_ms > self.stats["max_queue_delay_ms"]:
+                self.stats["max_queue_delay_ms"] = delay_ms
+            try:
+                self.handler(msg.topic, msg.payload, msg.source, msg.received_at)
+            except Exception as e:
+                self.stats["handler_errors"] += 1
+                logger.error(f"[admission] Handler error for {msg.topic}: {e}")
+            self.stats["processed"] += 1
+
+    def start(self):
+        """Start the worker thread"""
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="ingest-admission", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        """Stop the worker thread; queued messages are discarded"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def depth(self) -> int:
+        """Number of live queued messages"""
+        with self._cond:
+            return self._live
+
+    def shed_total(self) -> int:
+        """Total messages shed or rejected so far"""
+        s = self.stats
+        return s["shed_superseded"] + s["shed_tool_rate"] + s["shed_overflow"] + s["rejected_full"]
+
+    def snapshot(self) -> dict:
+        """Copy of counters plus current queue depth"""
+        with self._cond:
+            snap = dict(self.stats)
+            snap["queue_depth"] = self._live
+        return snap
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Publish path benchmark for the NEMO Tool Display VM server
+Compares building each nemo/esp32/<tool_id>/status payload from a dict with
+codec.dumps against the per-tool pre-serialized templates (time, CPU and transient
+memory per event), checks both give identical bytes, and times the whole
+process_tool_status path without a broker
+"""
+
+import argparse
+import logging
+import random
+import sys
+import time
+import tracemalloc
+
+import codec
+from templates import STATE_LABELS, StatusTemplates, status_message
+
+USER_NAMES = ["Alex Denton", "JC Denton", "Anna Navarre", "Paul Denton", "José Müller"]
+TIMESTAMPS = ["Oct 14, 12:15 PM", "Oct 14, 01:02 PM", "Oct 15, 09:45 AM"]
+
+
+def make_events(count: int, tools: int, seed: int):
+    rng = random.Random(seed)
+    states = list(STATE_LABELS)
+    return [
+        (9000 + rng.randrange(tools), rng.choice(states), rng.choice(TIMESTAMPS), rng.choice(USER_NAMES))
+        for _ in range(count)
+    ]
+
+
+def render_dict(events):
+    """The dict path: message dict, codec.dumps, f-string topic"""
+    out = None
+    for tool_id, state, timestamp, user_name in events:
+        message = status_message(state, timestamp, user_name, f"tool-{tool_id}")
+        out = (f"nemo/esp32/{tool_id}/status", codec.dumps(message))
+    return out
+
+
+def render_templates(events, templates=None):
+    templates = StatusTemplates() if templates is None else templates
+    out = None
+    for tool_id, state, timestamp, user_name in events:
+        out = templates.render(tool_id, f"tool-{tool_id}", state, timestamp, user_name)
+    return out
+
+
+def measure(name: str, func, events, rounds: int):
+    """Best-of-rounds wall and CPU time per event, plus peak transient bytes for one event"""
+    best_wall = best_cpu = float("inf")
+    for _ in range(rounds):
+        wall, cpu = time.perf_counter(), time.process_time()
+        func(events)
+        best_wall = min(best_wall, time.perf_counter() - wall)
+        best_cpu = min(best_cpu, time.process_time() - cpu)
+    tracemalloc.start()
+    peaks = []
+    for event in events[:200]:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        func([event])
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    per_event = {
+        "wall_ns": best_wall / len(events) * 1e9,
+        "cpu_ns": best_cpu / len(events) * 1e9,
+        "peak_bytes": sum(peaks) / len(peaks),
+    }
+    print(f"  {name:<22} {per_event['wall_ns']:>9.0f} ns  {per_event['cpu_ns']:>9.0f} ns cpu  "
+          f"{per_event['peak_bytes']:>7.0f} B peak/event")
+    return per_event
+
+
+def check_identical(events) -> bool:
+    templates = StatusTemplates()
+    for event in events:
+        if render_dict([event]) != render_templates([event], templates):
+            print(f"  ✗ payloads differ for {event}")
+            return False
+    print(f"  ✓ {len(events)} payloads byte-identical")
+    return True
+
+
+def bench_server(events, rounds: int):
+    """process_tool_status end to end (no broker: publishes go to the retry queue, logging off)"""
+    import main
+    config = main.load_config({'HISTORY_DIR': '', 'BOOTSTRAP_WINDOW_SECONDS': '0'})
+    event_types = {"active": "start", "enabled": "end", "disabled": "disabled"}
+    best = float("inf")
+    logging.disable(logging.CRITICAL)
+    try:
+        for _ in range(rounds):
+            server = main.NEMOToolServer(config)
+            calls = [
+                (str(tool_id), {"tool_id": tool_id, "tool_name": f"tool-{tool_id}", "usage_id": i + 1,
+                                "user_name": f"{user_name} (user)", "timestamp": "2025-10-14T19:15:14+00:00",
+                                "start_time": "2025-10-14T19:15:14+00:00", "end_time": "2025-10-14T19:15:14+00:00"},
+                 event_types[state])
+                for i, (tool_id, state, _timestamp, user_name) in enumerate(events)
+            ]
+            started = time.perf_counter()
+            for identifier, data, event_type in calls:
+                server.process_tool_status(identifier, data, event_type)
+            best = min(best, time.perf_counter() - started)
+    finally:
+        logging.disable(logging.NOTSET)
+    print(f"  {'process_tool_status':<22} {best / len(events) * 1e9:>9.0f} ns")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark status payload serialization on the publish path")
+    parser.add_argument("--events", type=int, default=50000, help="Events per round (default 50000)")
+    parser.add_argument("--tools", type=int, default=100, help="Distinct tools (default 100)")
+    parser.add_argument("--rounds", type=int, default=5, help="Rounds; the best is reported (default 5)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-server", action="store_true", help="Skip the process_tool_status benchmark")
+    args = parser.parse_args(argv)
+    if args.events < 1 or args.tools < 1 or args.rounds < 1:
+        parser.error("--events, --tools and --rounds must be positive")
+    return args
+
+
+def main():
+    args = parse_args()
+    events = make_events(args.events, args.tools, args.seed)
+    print(f"Publish path: {args.events} events over {args.tools} tools, best of {args.rounds}")
+    if not check_identical(events[:2000]):
+        return 1
+    legacy = measure(f"dict + {codec.backend}", render_dict, events, args.rounds)
+    warm = StatusTemplates()
+    render_templates(events, warm)
+    templated = measure("templates", lambda batch: render_templates(batch, warm), events, args.rounds)
+    print(f"  templates: {legacy['cpu_ns'] / templated['cpu_ns']:.1f}x less CPU, "
+          f"{legacy['peak_bytes'] - templated['peak_bytes']:.0f} B less transient memory per event")
+    if not args.no_server:
+        bench_server(events[:min(len(events), 20000)], args.rounds)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Warm-start bootstrap for the NEMO Tool Display VM server
+Reads the retained nemo/esp32/+/status payloads already held by the broker so
+per-tool state (e.g. "Last User") survives server restarts without local disk state
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict
+
+import codec
+
+logger = logging.getLogger(__name__)
+
+STATUS_FILTER = "nemo/esp32/+/status"
+
+
+class RetainedStateBootstrap:
+    """Collect retained messages for a bounded window.
+
+    Subscribes ``client`` to ``topic_filter`` and records retained deliveries until
+    either ``window`` seconds pass or no message has arrived for ``quiet`` seconds
+    (the broker sends all retained messages in one burst right after SUBACK). Then
+    unsubscribes, leaving the client as it was.
+    """
+
+    def __init__(self, client, topic_filter: str = STATUS_FILTER, window: float = 3.0, quiet: float = 0.5):
+        self.client = client
+        self.topic_filter = topic_filter
+        self.window = window
+        self.quiet = quiet
+        self._retained: Dict[str, str] = {}
+        self._last_message_at = None
+        self._lock = threading.Lock()
+
+    def _on_message(self, client, userdata, msg):
+        if not msg.retain:
+            return
+        with self._lock:
+            self._retained[msg.topic] = msg.payload.decode(errors="replace")
+            self._last_message_at = time.monotonic()
+
+    async def run(self) -> Dict[str, str]:
+        """Collect and return retained payloads (topic -> payload string)"""
+        started = time.monotonic()
+        self.client.message_callback_add(self.topic_filter, self._on_message)
+        try:
+            result, _mid = self.client.subscribe(self.topic_filter, qos=1)
+            if result != 0:
+                logger.warning(f"⚠️ Bootstrap subscribe to {self.topic_filter} failed: rc={result}")
+                return {}
+            while True:
+                await asyncio.sleep(0.05)
+                now = time.monotonic()
+                if now - started >= self.window:
+                    break
+                with self._lock:
+                    last = self._last_message_at
+                if last is not None and now - last >= self.quiet:
+                    break
+            self.client.unsubscribe(self.topic_filter)
+        finally:
+            self.client.message_callback_remove(self.topic_filter)
+        with self._lock:
+            retained = dict(self._retained)
+        logger.info(
+            f"🌅 Bootstrap: {len(retained)} retained topic(s) from {self.topic_filter} "
+            f"in {time.monotonic() - started:.2f}s"
+        )
+        return retained
+
+
+def last_users_from_retained(retained: Dict[str, str]) -> Dict[str, str]:
+    """Extract tool_id -> user_name from retained nemo/esp32/<id>/status payloads"""
+    users = {}
+    for topic, payload in retained.items():
+        parts = topic.split("/")
+        if len(parts) != 4:
+            continue
+        try:
+            data = codec.loads(payload)
+        except ValueError:
+            continue
+        if isinstance(data, dict) and data.get("user_name"):
+            users[parts[2]] = data["user_name"]
+    return users
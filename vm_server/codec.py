@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+JSON codec for the NEMO Tool Display VM server and tools
+loads/dumps go through the fastest installed backend (orjson, then msgspec, then
+the stdlib json module), chosen with JSON_CODEC. Whatever the backend, decoding
+gives the same values as json.loads (input a fast backend rejects is retried with
+the stdlib), so the signed "payload" string of an HMAC envelope is the exact string
+NEMO signed. Output is compact UTF-8 JSON for every backend: the one encoding
+used for everything the server publishes, including the status templates
+"""
+
+import json
+import logging
+from typing import Any, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("orjson", "msgspec", "json")
+CHOICES = ("auto",) + BACKENDS
+
+stats = {"typed": 0, "untyped": 0}
+
+
+def _json_loads(data):
+    return json.loads(data)
+
+
+def _json_dumps(obj) -> str:
+    # The canonical encoding: what orjson and msgspec produce natively
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _orjson_loads(data):
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        # NaN, integers beyond 64 bits, lone surrogates: valid for json.loads, so keep its answer
+        return json.loads(data)
+
+
+def _orjson_dumps(obj) -> str:
+    try:
+        return orjson.dumps(obj).decode("utf-8")
+    except TypeError:
+        return _json_dumps(obj)  # e.g. non-str dict keys
+
+
+if msgspec is not None:
+    _msgspec_decoder = msgspec.json.Decoder()
+    _msgspec_encoder = msgspec.json.Encoder()
+    _UNSET = msgspec.UNSET
+
+    class NemoToolEvent(msgspec.Struct):
+        """Typed nemo/tools/<id>/<event> payload (the fields the server reads); absent fields stay UNSET"""
+        event: Union[Optional[str], msgspec.UnsetType] = _UNSET
+        usage_id: Union[Optional[int], msgspec.UnsetType] = _UNSET
+        user_id: Union[Optional[int], msgspec.UnsetType] = _UNSET
+        user_name: Union[Optional[str], msgspec.UnsetType] = _UNSET
+        tool_id: Union[Optional[int], str, msgspec.UnsetType] = _UNSET
+        tool_name: Union[Optional[str], msgspec.UnsetType] = _UNSET
+        start_time: Union[Optional[str], msgspec.UnsetType] = _UNSET
+        end_time: Union[Optional[str], msgspec.UnsetType] = _UNSET
+        timestamp: Union[Optional[str], msgspec.UnsetType] = _UNSET
+        enabled_at: Union[Optional[str], msgspec.UnsetType] = _UNSET
+        disabled_at: Union[Optional[str], msgspec.UnsetType] = _UNSET
+        updated_at: Union[Optional[str], msgspec.UnsetType] = _UNSET
+
+    _tool_event_decoder = msgspec.json.Decoder(NemoToolEvent)
+
+    def _msgspec_loads(data):
+        try:
+            return _msgspec_decoder.decode(data)
+        except msgspec.DecodeError:
+            return json.loads(data)
+
+    def _msgspec_dumps(obj) -> str:
+        try:
+            return _msgspec_encoder.encode(obj).decode("utf-8")
+        except TypeError:
+            return _json_dumps(obj)
+
+    def _msgspec_tool_event(data):
+        try:
+            event = _tool_event_decoder.decode(data)
+        except msgspec.ValidationError:
+            return None  # not an object, or a field of another type
+        except msgspec.DecodeError:
+            return None  # left to the stdlib fallback in loads()
+        return {field: getattr(event, field) for field in event.__struct_fields__
+                if getattr(event, field) is not _UNSET}
+
+
+_IMPLEMENTATIONS = {
+    "json": (_json_loads, _json_dumps),
+    "orjson": (_orjson_loads, _orjson_dumps) if orjson is not None else None,
+    "msgspec": (_msgspec_loads, _msgspec_dumps) if msgspec is not None else None,
+}
+
+backend = "json"
+loads = _json_loads
+dumps = _json_dumps
+
+
+def available():
+    return [name for name in BACKENDS if _IMPLEMENTATIONS[name] is not None]
+
+
+def use(name: str = "auto") -> str:
+    """Select the backend ("auto" = fastest installed); a missing one falls back to the stdlib"""
+    global backend, loads, dumps
+    if name not in CHOICES:
+        raise ValueError(f"JSON codec must be one of {', '.join(CHOICES)}")
+    chosen = available()[0] if name == "auto" else name
+    if _IMPLEMENTATIONS[chosen] is None:
+        logger.warning(f"⚠️ JSON codec {chosen} is not installed, using the stdlib json module")
+        chosen = "json"
+    backend = chosen
+    loads, dumps = _IMPLEMENTATIONS[chosen]
+    return chosen
+
+
+def loads_tool_event(data) -> Any:
+    """Decode a tool event payload.
+
+    With msgspec the known fields are decoded straight into a typed NemoToolEvent
+    (unknown fields are dropped), for signed and unsigned events alike; payloads that
+    do not fit the schema, and every payload with the other backends, are decoded as
+    plain JSON. Raises ValueError for invalid JSON.
+    """
+    if backend == "msgspec":
+        event = _msgspec_tool_event(data)
+        if event is not None:
+            stats["typed"] += 1
+            return event
+    stats["untyped"] += 1
+    return loads(data)
+
+
+use("auto")
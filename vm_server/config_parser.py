@@ -6,16 +6,19 @@ Reads configuration from src/config.h to ensure consistency between ESP32 and VM
 
 import re
 import os
+import threading
 from pathlib import Path
 
+DEFAULT_CONFIG_H = Path(__file__).parent.parent / "src" / "config.h"
+DEFINE_PATTERN = re.compile(r'#define\s+(\w+)\s+(.+)')
+
 class ConfigParser:
     """Parse configuration from src/config.h file"""
     
     def __init__(self, config_h_path=None):
         if config_h_path is None:
-            # Default to include/config.h relative to this script
-            script_dir = Path(__file__).parent
-            config_h_path = script_dir.parent / "src" / "config.h"
+            # Default to src/config.h relative to this script
+            config_h_path = DEFAULT_CONFIG_H
         
         self.config_h_path = Path(config_h_path)
         self._config = {}
@@ -30,8 +33,7 @@ class ConfigParser:
             content = f.read()
         
         # Parse #define statements
-        define_pattern = r'#define\s+(\w+)\s+(.+)'
-        matches = re.findall(define_pattern, content)
+        matches = DEFINE_PATTERN.findall(content)
         
         for key, value in matches:
             # Remove quotes and convert to appropriate type
@@ -73,13 +75,34 @@ class ConfigParser:
             'rotation': self.get('DISPLAY_ROTATION', 1)
         }
 
-# Global config instance
-config = ConfigParser()
+# Parsed config.h per path, reparsed only when the file's mtime changes: (mtime_ns, parser)
+_parser_cache = {}
+_parser_lock = threading.Lock()
+
+def get_config_parser(config_h_path=None):
+    """Get a ConfigParser for config.h, parsing it on first use and again only if it changed"""
+    path = Path(config_h_path) if config_h_path is not None else DEFAULT_CONFIG_H
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Config file not found: {path}")
+    with _parser_lock:
+        cached = _parser_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, ConfigParser(path))
+            _parser_cache[path] = cached
+        return cached[1]
+
+def __getattr__(name):
+    # Backwards compatibility: config_parser.config is parsed lazily
+    if name == 'config':
+        return get_config_parser()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Convenience functions
 def get_mqtt_ports():
     """Get MQTT port configuration"""
-    return config.get_mqtt_ports()
+    return get_config_parser().get_mqtt_ports()
 
 def get_esp32_port():
     """Get ESP32 MQTT port (env MQTT_PORT_ESP32 overrides config.h)"""
@@ -89,7 +112,7 @@ def get_esp32_port():
             return int(val)
         except ValueError:
             pass
-    return config.get('MQTT_PORT_ESP32', 1883)
+    return get_config_parser().get('MQTT_PORT_ESP32', 1883)
 
 def get_nemo_port():
     """Get NEMO MQTT port (env MQTT_PORT overrides config.h)"""
@@ -99,11 +122,11 @@ def get_nemo_port():
             return int(val)
         except ValueError:
             pass
-    return config.get('MQTT_PORT_NEMO', 1886)
+    return get_config_parser().get('MQTT_PORT_NEMO', 1886)
 
 def get_mqtt_broker():
     """Get MQTT broker address"""
-    return config.get('MQTT_BROKER', 'localhost')
+    return get_config_parser().get('MQTT_BROKER', 'localhost')
 
 if __name__ == "__main__":
     # Test the parser
@@ -111,5 +134,5 @@ if __name__ == "__main__":
     print(f"  ESP32 Port: {get_esp32_port()}")
     print(f"  NEMO Port: {get_nemo_port()}")
     print(f"  Broker: {get_mqtt_broker()}")
-    print(f"  Topic Prefix: {config.get_topic_prefix()}")
-    print(f"  Display: {config.get_display_config()}")
+    print(f"  Topic Prefix: {get_config_parser().get_topic_prefix()}")
+    print(f"  Display: {get_config_parser().get_display_config()}")
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Display fleet registry for the NEMO Tool Display VM server
+Tracks which ESP32 displays are online from their presence/LWT and heartbeat
+topics and from broker connect/disconnect log lines, and keeps a compact
+last-seen / last-delivered record per display so only displays that reconnected
+or fell out of sync need a resync
+"""
+
+import logging
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional
+
+import codec
+
+logger = logging.getLogger(__name__)
+
+# nemo/esp32/display/<client_id>/presence: retained {"state": "online", "tool_id": N}, LWT "offline"
+PRESENCE_FILTER = "nemo/esp32/display/+/presence"
+# nemo/esp32/display/<client_id>/heartbeat: {"tool_id": N, "uptime_s": S, "rssi": R, "applied": "<crc32 hex>"}
+HEARTBEAT_FILTER = "nemo/esp32/display/+/heartbeat"
+
+# Broker log events that end a display's connection
+OFFLINE_EVENTS = ("disconnect", "timeout", "socket_error")
+
+
+def payload_digest(payload: str) -> str:
+    """CRC-32 of a status payload as 8 hex digits (what displays report as "applied")"""
+    return f"{zlib.crc32(payload.encode('utf-8')) & 0xFFFFFFFF:08x}"
+
+
+def display_client_id(topic: str) -> Optional[str]:
+    """client id from nemo/esp32/display/<client_id>/<kind>"""
+    parts = topic.split("/")
+    return parts[3] if len(parts) == 5 and parts[2] == "display" else None
+
+
+class DisplayRecord:
+    """What the server knows about one display"""
+
+    __slots__ = ("client_id", "tool_id", "online", "last_seen", "online_since", "connects",
+                 "delivered", "delivered_at", "applied", "applied_at", "resynced_at")
+
+    def __init__(self, client_id: str):
+        self.client_id = client_id
+        self.tool_id: Optional[str] = None
+        self.online = False
+        self.last_seen = 0.0  # wall clock
+        self.online_since = 0.0
+        self.connects = 0
+        self.delivered: Optional[str] = None  # digest of the last status published to its topic
+        self.delivered_at = 0.0
+        self.applied: Optional[str] = None  # digest the display last reported applying
+        self.applied_at = 0.0
+        self.resynced_at = 0.0
+
+    @property
+    def status_topic(self) -> Optional[str]:
+        return f"nemo/esp32/{self.tool_id}/status" if self.tool_id is not None else None
+
+    def in_sync(self) -> Optional[bool]:
+        """None until both sides are known"""
+        if self.delivered is None or self.applied is None:
+            return None
+        return self.delivered == self.applied
+
+    def to_dict(self) -> dict:
+        return {
+            "client_id": self.client_id,
+            "tool_id": self.tool_id,
+            "online": self.online,
+            "last_seen": self.last_seen,
+            "connects": self.connects,
+            "delivered": self.delivered,
+            "applied": self.applied,
+            "in_sync": self.in_sync(),
+        }
+
+
+class FleetRegistry:
+    """Presence and delivery state per display client id.
+
+    Feed it with on_presence/on_heartbeat (ESP32 broker messages), on_broker_event
+    (parsed mosquitto.log lines) and record_delivery (every status publish).
+    on_presence returns True for every "online" announcement (displays send one per
+    MQTT session, after subscribing) and on_heartbeat when a display that was
+    offline or stale is heard from again: that is when it should get a targeted resync.
+    """
+
+    def __init__(self, client_prefix: str = "nemo_display_", stale_after: float = 180.0):
+        self.client_prefix = client_prefix
+        self.stale_after = stale_after
+        self.displays: Dict[str, DisplayRecord] = {}
+        self._lock = threading.Lock()
+        self.stats = {"presence": 0, "heartbeats": 0, "broker_events": 0, "reconnects": 0, "went_stale": 0}
+
+    def _record(self, client_id: str) -> DisplayRecord:
+        record = self.displays.get(client_id)
+        if record is None:
+            record = self.displays[client_id] = DisplayRecord(client_id)
+        return record
+
+    def _seen(self, record: DisplayRecord, now: float) -> bool:
+        record.last_seen = now
+        if record.online:
+            return False
+        record.online = True
+        record.online_since = now
+        record.connects += 1
+        if record.connects > 1:
+            self.stats["reconnects"] += 1
+        return True
+
+    @staticmethod
+    def _tool_id(data: dict) -> Optional[str]:
+        tool_id = data.get("tool_id")
+        return str(tool_id) if tool_id is not None else None
+
+    def on_presence(self, client_id: str, payload: bytes, now: Optional[float] = None) -> bool:
+        """Retained presence or LWT; payload is JSON with "state", or a bare online/offline"""
+        now = time.time() if now is None else now
+        text = payload.decode("utf-8", errors="replace").strip()
+        try:
+            data = codec.loads(text)
+        except ValueError:
+            data = {"state": text}
+        if not isinstance(data, dict):
+            data = {"state": str(data)}
+        with self._lock:
+            self.stats["presence"] += 1
+            record = self._record(client_id)
+            record.tool_id = self._tool_id(data) or record.tool_id
+            if data.get("state") == "online":
+                self._seen(record, now)
+                return True
+            record.online = False
+            return False
+
+    def on_heartbeat(self, client_id: str, payload: bytes, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        try:
+            data = codec.loads(payload)
+        except ValueError:
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+        with self._lock:
+            self.stats["heartbeats"] += 1
+            record = self._record(client_id)
+            record.tool_id = self._tool_id(data) or record.tool_id
+            applied = data.get("applied")
+            if isinstance(applied, str) and applied:
+                record.applied = applied.lower()
+                record.applied_at = now
+            return self._seen(record, now)
+
+    def on_broker_event(self, event, now: Optional[float] = None) -> bool:
+        """A monitor_log.LogEvent; only client ids with the display prefix are tracked"""
+        if not event.client or not event.client.startswith(self.client_prefix):
+            return False
+        now = event.timestamp or (time.time() if now is None else now)
+        with self._lock:
+            if event.kind == "connect":
+                self.stats["broker_events"] += 1
+                return self._seen(self._record(event.client), now)
+            if event.kind in OFFLINE_EVENTS and event.client in self.displays:
+                self.stats["broker_events"] += 1
+                self.displays[event.client].online = False
+            return False
+
+    def record_delivery(self, topic: str, payload: str, now: Optional[float] = None):
+        """Remember what was last published to each display's status topic"""
+        now = time.time() if now is None else now
+        digest = None
+        with self._lock:
+            for record in self.displays.values():
+                if record.status_topic == topic:
+                    digest = digest or payload_digest(payload)
+                    record.delivered = digest
+                    record.delivered_at = now
+
+    def expire(self, now: Optional[float] = None) -> List[str]:
+        """Mark displays offline that have not been seen for stale_after seconds"""
+        now = time.time() if now is None else now
+        stale = []
+        with self._lock:
+            for record in self.displays.values():
+                if record.online and now - record.last_seen > self.stale_after:
+                    record.online = False
+                    stale.append(record.client_id)
+            self.stats["went_stale"] += len(stale)
+        return stale
+
+    def get(self, client_id: str) -> Optional[DisplayRecord]:
+        with self._lock:
+            return self.displays.get(client_id)
+
+    def displays_for_tool(self, tool_id) -> List[str]:
+        with self._lock:
+            return [r.client_id for r in self.displays.values() if r.tool_id == str(tool_id)]
+
+    def tools_without_display(self, tool_ids) -> List[str]:
+        """Tool ids (from published state) that no known display shows"""
+        with self._lock:
+            shown = {r.tool_id for r in self.displays.values()}
+        return sorted(str(t) for t in tool_ids if str(t) not in shown)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            records = [r.to_dict() for r in self.displays.values()]
+            stats = dict(self.stats)
+        stats["known"] = len(records)
+        stats["online"] = sum(1 for r in records if r["online"])
+        stats["out_of_sync"] = sum(1 for r in records if r["in_sync"] is False)
+        stats["displays"] = records
+        return stats
+
+    def summary(self) -> str:
+        snap = self.snapshot()
+        return (f"{snap['online']}/{snap['known']} displays online, {snap['out_of_sync']} out of sync, "
+                f"{snap['reconnects']} reconnects, {snap['went_stale']} went stale")
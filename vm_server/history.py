@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Tool event history for the NEMO Tool Display VM server
+Every tool transition the server forwards (start, end, enabled, disabled) is
+appended to a segmented, append-only log of compact binary records. Each segment
+has a sidecar index (sparse time index + record offsets per tool) so time-range
+and per-tool queries read only the matching records through mmap; segments older
+than the retention period are deleted. Run this file to query the history:
+
+    python history.py --tool 12 --since 2025-10-14 --until 2025-10-15
+"""
+
+import argparse
+import bisect
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+import codec
+
+logger = logging.getLogger(__name__)
+
+# Record: length (whole record), recorded_at, event_time (NaN = unknown), usage_id, user_id,
+# event code, then byte lengths of tool_id, user_name, tool_name; the three UTF-8 strings follow
+RECORD = struct.Struct("<HddIIBBBB")
+EVENT_CODES = {"start": 1, "end": 2, "enabled": 3, "disabled": 4, "idle": 5}
+EVENT_NAMES = {code: name for name, code in EVENT_CODES.items()}
+# One (recorded_at, offset) entry in the sparse time index per this many records
+TIME_INDEX_STRIDE = 64
+SEGMENT_NAME = re.compile(r"^events-(\d+)\.seg$")
+
+
+class HistoryEvent(NamedTuple):
+    recorded_at: float  # server wall clock when appended (records are ordered by it)
+    event_time: Optional[float]  # NEMO timestamp of the event, if it had one
+    tool_id: str
+    event: str
+    usage_id: Optional[int]
+    user_id: Optional[int]
+    user_name: str
+    tool_name: str
+
+    def to_dict(self) -> dict:
+        return self._asdict()
+
+
+def _text(value, limit: int = 255) -> bytes:
+    """UTF-8 bytes cut to ``limit`` without splitting a character"""
+    data = ("" if value is None else str(value)).encode("utf-8")
+    return data if len(data) <= limit else data[:limit].decode("utf-8", "ignore").encode("utf-8")
+
+
+def _uint(value) -> int:
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return 0
+    return value if 0 < value < 2 ** 32 else 0
+
+
+def encode_record(recorded_at: float, event_time: Optional[float], tool_id, event: str, usage_id=None,
+                  user_id=None, user_name: str = "", tool_name: str = "") -> bytes:
+    tool, user, name = _text(tool_id), _text(user_name), _text(tool_name)
+    size = RECORD.size + len(tool) + len(user) + len(name)
+    header = RECORD.pack(size, recorded_at, math.nan if event_time is None else event_time,
+                         _uint(usage_id), _uint(user_id), EVENT_CODES[event], len(tool), len(user), len(name))
+    return header + tool + user + name
+
+
+def decode_record(buf, offset: int) -> Optional[HistoryEvent]:
+    """Record at ``offset``, or None if the buffer ends mid-record (torn write)"""
+    if offset + RECORD.size > len(buf):
+        return None
+    size, recorded_at, event_time, usage_id, user_id, code, tool_len, user_len, name_len = RECORD.unpack_from(buf, offset)
+    if size != RECORD.size + tool_len + user_len + name_len or offset + size > len(buf) or code not in EVENT_NAMES:
+        return None
+    pos = offset + RECORD.size
+    tool = bytes(buf[pos:pos + tool_len]).decode("utf-8")
+    pos += tool_len
+    user = bytes(buf[pos:pos + user_len]).decode("utf-8")
+    pos += user_len
+    name = bytes(buf[pos:pos + name_len]).decode("utf-8")
+    return HistoryEvent(recorded_at, None if math.isnan(event_time) else event_time, tool, EVENT_NAMES[code],
+                        usage_id or None, user_id or None, user, name)
+
+
+class SegmentIndex:
+    """Time bounds, sparse time index and per-tool record offsets of one segment"""
+
+    def __init__(self, path: str, created: float):
+        self.path = path
+        self.created = created
+        self.first = None  # recorded_at of the first / last record
+        self.last = None
+        self.count = 0
+        self.size = 0  # bytes of complete records
+        self.times: List[float] = []
+        self.offsets: List[int] = []
+        self.tools: Dict[str, List[int]] = {}
+
+    @property
+    def index_path(self) -> str:
+        return self.path[:-len(".seg")] + ".idx"
+
+    def add(self, recorded_at: float, tool_id: str, offset: int, size: int):
+        if self.count % TIME_INDEX_STRIDE == 0:
+            self.times.append(recorded_at)
+            self.offsets.append(offset)
+        if self.first is None:
+            self.first = recorded_at
+        self.last = recorded_at
+        self.tools.setdefault(tool_id, []).append(offset)
+        self.count += 1
+        self.size = offset + size
+
+    def overlaps(self, since: Optional[float], until: Optional[float]) -> bool:
+        if self.count == 0:
+            return False
+        return (since is None or self.last >= since) and (until is None or self.first <= until)
+
+    def start_offset(self, since: Optional[float]) -> int:
+        """Offset of the last indexed record before ``since``; scanning from there finds every match"""
+        if since is None or not self.times:
+            return 0
+        return self.offsets[max(bisect.bisect_left(self.times, since) - 1, 0)]
+
+    def save(self):
+        data = {"created": self.created, "first": self.first, "last": self.last, "count": self.count,
+                "size": self.size, "times": self.times, "offsets": self.offsets, "tools": self.tools}
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(codec.dumps(data))
+        os.replace(tmp, self.index_path)
+
+    @classmethod
+    def load(cls, path: str, created: float) -> Optional["SegmentIndex"]:
+        """Saved index of a sealed segment; None if missing or not matching the segment file"""
+        index = cls(path, created)
+        try:
+            with open(index.index_path, encoding="utf-8") as f:
+                data = codec.loads(f.read())
+            if data["size"] != os.path.getsize(path):
+                return None
+            index.first, index.last, index.count = data["first"], data["last"], data["count"]
+            index.size, index.times, index.offsets, index.tools = data["size"], data["times"], data["offsets"], data["tools"]
+        except (OSError, ValueError, KeyError):
+            return None
+        return index
+
+    @classmethod
+    def scan(cls, path: str, created: float) -> "SegmentIndex":
+        """Rebuild the index from the records (stops at a torn last record)"""
+        index = cls(path, created)
+        with open(path, "rb") as f:
+            data = f.read()
+        offset = 0
+        while True:
+            event = decode_record(data, offset)
+            if event is None:
+                break
+            size = RECORD.unpack_from(data, offset)[0]
+            index.add(event.recorded_at, event.tool_id, offset, size)
+            offset += size
+        return index
+
+
+class EventHistory:
+    """Append-only tool event log in ``directory``.
+
+    Writes go to ``events-<created_ms>.seg``; a segment is sealed (index saved next to
+    it) once it reaches ``segment_bytes`` or ``segment_seconds``, and sealed segments
+    whose newest record is older than ``retention_seconds`` (0 = keep forever) are
+    deleted when a new one starts. With ``readonly`` nothing on disk is changed, so
+    queries can run from another process while the server writes.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 16 * 1024 * 1024, segment_seconds: float = 86400,
+                 retention_seconds: float = 0, readonly: bool = False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.retention_seconds = retention_seconds
+        self.readonly = readonly
+        self._lock = threading.Lock()
+        self._fd = None
+        self._active: Optional[SegmentIndex] = None
+        self.segments: List[SegmentIndex] = []
+        self.stats = {"appended": 0, "segments_sealed": 0, "segments_expired": 0, "write_errors": 0}
+        self._open()
+
+    def _open(self):
+        if not self.readonly:
+            os.makedirs(self.directory, exist_ok=True)
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            names = []
+        found = sorted((int(m.group(1)), m.group(0)) for m in map(SEGMENT_NAME.match, names) if m)
+        for created_ms, name in found:
+            path = os.path.join(self.directory, name)
+            created = created_ms / 1000
+            index = SegmentIndex.load(path, created)
+            if index is None:
+                # Left open by a previous run (or index lost): rebuild, then seal it
+                index = SegmentIndex.scan(path, created)
+                if not self.readonly:
+                    if index.size != os.path.getsize(path):
+                        logger.warning(f"📚 History: dropping torn record at the end of {name}")
+                        os.truncate(path, index.size)
+                    index.save()
+            self.segments.append(index)
+        if not self.readonly:
+            self.expire()
+
+    # ----- writing (admission worker thread) -----
+
+    def _roll(self, now: float):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._active.save()
+            self.stats["segments_sealed"] += 1
+            self.expire(now)
+        created_ms = int(now * 1000)
+        if self.segments and created_ms <= int(self.segments[-1].created * 1000):
+            created_ms = int(self.segments[-1].created * 1000) + 1
+        path = os.path.join(self.directory, f"events-{created_ms}.seg")
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._active = SegmentIndex(path, created_ms / 1000)
+        self.segments.append(self._active)
+
+    def append(self, tool_id, event: str, event_time: Optional[float] = None, usage_id=None, user_id=None,
+               user_name: str = "", tool_name: str = "", now: Optional[float] = None) -> bool:
+        """Record one transition; False (and logged) if it could not be written"""
+        if self.readonly or event not in EVENT_CODES:
+            return False
+        now = time.time() if now is None else now
+        record = encode_record(now, event_time, tool_id, event, usage_id, user_id, user_name, tool_name)
+        with self._lock:
+            try:
+                active = self._active
+                if (active is None or active.size + len(record) > self.segment_bytes
+                        or now - active.created >= self.segment_seconds):
+                    self._roll(now)
+                offset = self._active.size
+                os.write(self._fd, record)
+            except OSError as e:
+                self.stats["write_errors"] += 1
+                if self.stats["write_errors"] == 1 or self.stats["write_errors"] % 100 == 0:
+                    logger.error(f"❌ History write failed ({self.stats['write_errors']} so far): {e}")
+                return False
+            self._active.add(now, _text(tool_id).decode("utf-8"), offset, len(record))
+            self.stats["appended"] += 1
+        return True
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Delete sealed segments that only hold records older than the retention period"""
+        if not self.retention_seconds or self.readonly:
+            return 0
+        cutoff = (time.time() if now is None else now) - self.retention_seconds
+        expired = [s for s in self.segments
+                   if s is not self._active and (s.last if s.last is not None else s.created) < cutoff]
+        for segment in expired:
+            for path in (segment.path, segment.index_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.segments.remove(segment)
+        if expired:
+            self.stats["segments_expired"] += len(expired)
+            logger.info(f"📚 History: expired {len(expired)} segment(s) older than {self.retention_seconds / 86400:g} days")
+        return len(expired)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+                self._active.save()
+                self._active = None
+
+    # ----- queries -----
+
+    def query(self, since: Optional[float] = None, until: Optional[float] = None, tool_id=None,
+              limit: Optional[int] = None) -> List[HistoryEvent]:
+        """Events recorded in [since, until] (epoch seconds), oldest first, optionally for one tool"""
+        return list(self.iter_events(since, until, tool_id, limit))
+
+    def iter_events(self, since=None, until=None, tool_id=None, limit=None) -> Iterator[HistoryEvent]:
+        tool = None if tool_id is None else str(tool_id)
+        with self._lock:
+            # Offsets/sizes copied now; records appended later are simply not part of this query
+            plan = []
+            for segment in self.segments:
+                if not segment.overlaps(since, until) or (tool is not None and tool not in segment.tools):
+                    continue
+                offsets = list(segment.tools[tool]) if tool is not None else None
+                plan.append((segment.path, segment.size, offsets, segment.start_offset(since)))
+        found = 0
+        for path, size, offsets, start in plan:
+            for event in self._read_segment(path, size, offsets, start, since, until):
+                yield event
+                found += 1
+                if limit is not None and found >= limit:
+                    return
+
+    @staticmethod
+    def _read_segment(path, size, offsets, start, since, until) -> Iterator[HistoryEvent]:
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return  # expired since the plan was made
+        with f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as buf:
+            if offsets is not None:
+                # Per-tool offsets are in time order: stop at the first record past ``until``
+                for offset in offsets:
+                    event = decode_record(buf, offset)
+                    if event is None or (until is not None and event.recorded_at > until):
+                        break
+                    if since is None or event.recorded_at >= since:
+                        yield event
+                return
+            offset = start
+            while offset < size:
+                event = decode_record(buf, offset)
+                if event is None or (until is not None and event.recorded_at > until):
+                    break
+                if since is None or event.recorded_at >= since:
+                    yield event
+                offset += RECORD.unpack_from(buf, offset)[0]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snap = dict(self.stats)
+            snap["segments"] = len(self.segments)
+            snap["records"] = sum(s.count for s in self.segments)
+            snap["bytes"] = sum(s.size for s in self.segments)
+        return snap
+
+
+def _parse_time(value: str) -> float:
+    """Local ISO date/datetime (or epoch seconds) -> epoch seconds"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def parse_args(argv=None):
+    """Parse command line options (history directory defaults to HISTORY_DIR from config.env)"""
+    parser = argparse.ArgumentParser(description="Query the NEMO tool event history")
+    parser.add_argument("--dir", default=os.getenv('HISTORY_DIR', 'history') or 'history', help="History directory")
+    parser.add_argument("--tool", default=None, help="Only events for this tool id")
+    parser.add_argument("--since", type=_parse_time, default=None, help="Start (local ISO date/time or epoch seconds)")
+    parser.add_argument("--until", type=_parse_time, default=None, help="End (local ISO date/time or epoch seconds)")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many events")
+    parser.add_argument("--json", action="store_true", help="One JSON object per line")
+    return parser.parse_args(argv)
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv('config.env')
+    codec.use(os.getenv('JSON_CODEC', 'auto').strip().lower() or 'auto')
+    args = parse_args()
+    history = EventHistory(args.dir, readonly=True)
+    for event in history.iter_events(args.since, args.until, args.tool, args.limit):
+        if args.json:
+            print(codec.dumps(event.to_dict()))
+            continue
+        when = datetime.fromtimestamp(event.event_time or event.recorded_at).strftime("%Y-%m-%d %H:%M:%S")
+        usage = f"  usage {event.usage_id}" if event.usage_id else ""
+        print(f"{when}  tool {event.tool_id} ({event.tool_name})  {event.event:<8} {event.user_name}{usage}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
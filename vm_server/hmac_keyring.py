@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+HMAC keys for the NEMO Tool Display VM server
+Holds the current MQTT_HMAC_KEY plus any previous key still accepted during a
+rotation window, and signs/verifies NEMO envelopes
+"""
+
+import hashlib
+import hmac as hmac_lib
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+def key_id(key: str) -> str:
+    """Short public identifier for a key (first 8 hex chars of its SHA-256).
+
+    Senders may put this in the envelope as "kid" so the verifier picks the right
+    key directly instead of trying each accepted key.
+    """
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:8]
+
+
+def sign_payload(key: str, payload: str, algo: str = "sha256", include_kid: bool = True) -> dict:
+    """Build the envelope NEMO publishes: {"payload", "hmac", "algo"[, "kid"]}"""
+    digest = hmac_lib.new(key.strip().encode("utf-8"), payload.encode("utf-8"), digestmod=algo).hexdigest()
+    envelope = {"payload": payload, "hmac": digest, "algo": algo}
+    if include_kid:
+        envelope["kid"] = key_id(key.strip())
+    return envelope
+
+
+class HmacKeyring:
+    """Accepted HMAC keys.
+
+    ``current`` is always accepted. ``previous`` keys are accepted until their expiry
+    (monotonic seconds; None = until removed from config). Instances are immutable:
+    rotation returns a new keyring so readers can swap it atomically.
+    """
+
+    def __init__(self, current: str, previous: Optional[List[Tuple[str, Optional[float]]]] = None):
+        self.current = (current or "").strip()
+        self._keys: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        for key, expires_at in previous or []:
+            key = (key or "").strip()
+            if key and key != self.current:
+                self._keys[key_id(key)] = (key.encode("utf-8"), expires_at)
+        if self.current:
+            self._keys[key_id(self.current)] = (self.current.encode("utf-8"), None)
+
+    @property
+    def enabled(self) -> bool:
+        """True when HMAC verification is required"""
+        return bool(self.current)
+
+    @property
+    def current_id(self) -> Optional[str]:
+        """Key id of the current key (None when HMAC is disabled)"""
+        return key_id(self.current) if self.current else None
+
+    def _active(self, now: float) -> Dict[str, bytes]:
+        return {
+            kid: key
+            for kid, (key, expires_at) in self._keys.items()
+            if expires_at is None or expires_at > now
+        }
+
+    def candidates(self, kid: Optional[str] = None) -> List[bytes]:
+        """Keys to try for an envelope; with a kid hint at most one key is returned"""
+        active = self._active(time.monotonic())
+        if kid:
+            key = active.get(kid.strip().lower())
+            return [key] if key is not None else []
+        # No hint: current key first, then any previous key still in its window
+        current = [active[key_id(self.current)]] if self.current else []
+        return current + [k for kid_, k in active.items() if kid_ != key_id(self.current)]
+
+    def verify(self, payload: str, received_hex: str, algo: str, kid: Optional[str] = None) -> Optional[str]:
+        """Return the id of the key that signed ``payload``, or None"""
+        message = payload.encode("utf-8")
+        received = received_hex.strip().lower()
+        for key in self.candidates(kid):
+            expected = hmac_lib.new(key, message, digestmod=algo).hexdigest()
+            if hmac_lib.compare_digest(expected, received):
+                return key_id(key.decode("utf-8"))
+        return None
+
+    def rotated(self, new_current: str, window_seconds: float, explicit_previous: str = "") -> "HmacKeyring":
+        """Keyring for a new current key; the old current key stays valid for ``window_seconds``"""
+        now = time.monotonic()
+        previous = []
+        if self.current and self.current != (new_current or "").strip() and window_seconds > 0:
+            previous.append((self.current, now + window_seconds))
+        # Keep earlier rotations that are still inside their window
+        for kid, (key, expires_at) in self._keys.items():
+            if kid != key_id(self.current) and expires_at is not None and expires_at > now:
+                previous.append((key.decode("utf-8"), expires_at))
+        if explicit_previous:
+            previous.append((explicit_previous, None))
+        return HmacKeyring(new_current, previous)
+
+    def describe(self) -> str:
+        """Key ids and remaining windows, for logs (never the keys themselves)"""
+        now = time.monotonic()
+        parts = []
+        for kid, (_key, expires_at) in self._keys.items():
+            if expires_at is not None and expires_at <= now:
+                continue
+            if kid == key_id(self.current):
+                parts.append(f"{kid} (current)")
+            elif expires_at is None:
+                parts.append(f"{kid} (previous)")
+            else:
+                parts.append(f"{kid} (previous, {expires_at - now:.0f}s left)")
+        return ", ".join(parts) or "none"
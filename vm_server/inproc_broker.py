@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+In-process MQTT broker stand-in for hermetic tests
+A small MQTT 3.1/3.1.1 broker on an asyncio loop in a background thread: QoS 0/1
+(QoS 2 publishes are accepted and delivered at QoS 1), retained messages, + and #
+wildcards, username/password auth, last will, and several listeners sharing one
+state the way mosquitto's listeners do. Sessions are always clean (no persistence)
+"""
+
+import asyncio
+import logging
+import struct
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+CONNACK_ACCEPTED = 0
+CONNACK_BAD_PROTOCOL = 1
+CONNACK_ID_REJECTED = 2
+CONNACK_BAD_CREDENTIALS = 4
+CONNACK_NOT_AUTHORIZED = 5
+
+MAX_GRANTED_QOS = 1
+
+
+class ProtocolError(Exception):
+    """Malformed or disallowed packet; the connection is closed"""
+
+
+def valid_filter(topic_filter: str) -> bool:
+    if not topic_filter:
+        return False
+    levels = topic_filter.split("/")
+    for i, level in enumerate(levels):
+        if "#" in level and (level != "#" or i != len(levels) - 1):
+            return False
+        if "+" in level and level != "+":
+            return False
+    return True
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """MQTT filter match; wildcards in the first level never match $-topics"""
+    if topic.startswith("$") and topic_filter[:1] in ("+", "#"):
+        return False
+    f_levels = topic_filter.split("/")
+    t_levels = topic.split("/")
+    for i, f in enumerate(f_levels):
+        if f == "#":
+            return True
+        if i >= len(t_levels):
+            return False
+        if f != "+" and f != t_levels[i]:
+            return False
+    return len(f_levels) == len(t_levels)
+
+
+def _encode_length(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = n % 128
+        n //= 128
+        out.append(byte | 0x80 if n else byte)
+        if not n:
+            return bytes(out)
+
+
+def _string(data: bytes, pos: int) -> Tuple[bytes, int]:
+    if pos + 2 > len(data):
+        raise ProtocolError("truncated string")
+    (length,) = struct.unpack_from("!H", data, pos)
+    end = pos + 2 + length
+    if end > len(data):
+        raise ProtocolError("truncated string")
+    return data[pos + 2:end], end
+
+
+def _publish_packet(topic: str, payload: bytes, qos: int, retain: bool, mid: int) -> bytes:
+    topic_bytes = topic.encode("utf-8")
+    body = struct.pack("!H", len(topic_bytes)) + topic_bytes
+    if qos:
+        body += struct.pack("!H", mid)
+    body += payload
+    header = (PUBLISH << 4) | (qos << 1) | (1 if retain else 0)
+    return bytes((header,)) + _encode_length(len(body)) + body
+
+
+class _Session:
+    __slots__ = ("client_id", "writer", "listener", "subscriptions", "will", "keepalive",
+                 "_next_mid", "qos2_pending", "clean_exit")
+
+    def __init__(self, client_id: str, writer, listener: int, keepalive: int, will):
+        self.client_id = client_id
+        self.writer = writer
+        self.listener = listener
+        self.subscriptions: Dict[str, int] = {}
+        self.will = will  # (topic, payload, qos, retain) or None
+        self.keepalive = keepalive
+        self._next_mid = 0
+        self.qos2_pending = set()
+        self.clean_exit = False
+
+    def next_mid(self) -> int:
+        self._next_mid = self._next_mid % 65535 + 1
+        return self._next_mid
+
+    def send(self, packet: bytes):
+        if not self.writer.is_closing():
+            self.writer.write(packet)
+
+
+class InProcessBroker:
+    """Minimal MQTT broker for tests; all listeners share sessions, subscriptions and retained state.
+
+    ``users`` maps username -> password. A listener with ``allow_anonymous=False`` requires
+    a matching username/password; with credentials configured, wrong ones are always refused.
+    """
+
+    def __init__(self, users: Optional[Dict[str, str]] = None, allow_anonymous: bool = True,
+                 host: str = "127.0.0.1"):
+        self.users = dict(users or {})
+        self.allow_anonymous = allow_anonymous
+        self.host = host
+        self.retained: Dict[str, Tuple[bytes, int]] = {}
+        self.stats = {"connections": 0, "refused": 0, "received": 0, "delivered": 0, "wills": 0}
+        self._sessions: Dict[str, _Session] = {}
+        self._servers: Dict[int, asyncio.AbstractServer] = {}
+        self._handlers: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()  # guards what other threads read: sessions, retained, stats
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # ----- lifecycle (called from test threads) -----
+
+    def start(self, ports: List[int] = (0,)) -> List[int]:
+        """Start the loop thread and one listener per port (0 = any free port); returns bound ports"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            ready.set()
+            self._loop.run_forever()
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="inproc-broker", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return [self.add_listener(port) for port in ports]
+
+    def add_listener(self, port: int = 0, allow_anonymous: Optional[bool] = None) -> int:
+        """Open another listener on the shared broker state; returns its port"""
+        anonymous = self.allow_anonymous if allow_anonymous is None else allow_anonymous
+        future = asyncio.run_coroutine_threadsafe(self._listen(port, anonymous), self._loop)
+        return future.result(5)
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+        self._loop = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ----- inspection helpers for tests -----
+
+    def subscriptions(self) -> Dict[str, List[str]]:
+        """client id -> subscribed filters"""
+        with self._lock:
+            return {cid: list(s.subscriptions) for cid, s in self._sessions.items()}
+
+    def wait_for_subscription(self, topic_filter: str, timeout: float = 2.0) -> bool:
+        """Block until some client has subscribed to ``topic_filter``"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if any(topic_filter in filters for filters in self.subscriptions().values()):
+                return True
+            time.sleep(0.005)
+        return False
+
+    def retained_messages(self) -> Dict[str, bytes]:
+        with self._lock:
+            return {topic: payload for topic, (payload, _qos) in self.retained.items()}
+
+    # ----- loop side -----
+
+    async def _listen(self, port: int, allow_anonymous: bool) -> int:
+        server = await asyncio.start_server(
+            lambda r, w: self._serve(r, w, allow_anonymous), self.host, port)
+        bound = server.sockets[0].getsockname()[1]
+        self._servers[bound] = server
+        return bound
+
+    async def _shutdown(self):
+        for server in self._servers.values():
+            server.close()
+        for session in list(self._sessions.values()):
+            session.clean_exit = True
+            session.writer.close()
+        # Closed sockets end every handler; wait for them so none is left pending when the loop stops
+        if self._handlers:
+            await asyncio.wait(self._handlers, timeout=2)
+        for server in self._servers.values():
+            await server.wait_closed()
+        self._servers.clear()
+
+    async def _read_packet(self, reader) -> Tuple[int, int, bytes]:
+        first = (await reader.readexactly(1))[0]
+        length, multiplier = 0, 1
+        for _ in range(4):
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        else:
+            raise ProtocolError("bad remaining length")
+        body = await reader.readexactly(length) if length else b""
+        return first >> 4, first & 0x0F, body
+
+    async def _serve(self, reader, writer, allow_anonymous: bool):
+        listener = writer.get_extra_info("sockname")[1]
+        session = None
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            ptype, _flags, body = await asyncio.wait_for(self._read_packet(reader), 10)
+            if ptype != CONNECT:
+                raise ProtocolError("first packet must be CONNECT")
+            session = self._connect(body, writer, listener, allow_anonymous)
+            if session is None:
+                await writer.drain()
+                return
+            while True:
+                timeout = session.keepalive * 1.5 if session.keepalive else None
+                ptype, flags, body = await asyncio.wait_for(self._read_packet(reader), timeout)
+                if ptype == DISCONNECT:
+                    session.clean_exit = True
+                    break
+                self._handle(session, ptype, flags, body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        except (ProtocolError, IndexError, struct.error, UnicodeDecodeError) as e:
+            logger.debug(f"[broker] protocol error from {session.client_id if session else '?'}: {e}")
+        finally:
+            if session is not None:
+                self._disconnect(session)
+            writer.close()
+            self._handlers.discard(task)
+
+    def _connect(self, body: bytes, writer, listener: int, allow_anonymous: bool) -> Optional[_Session]:
+        name, pos = _string(body, 0)
+        level, flags = body[pos], body[pos + 1]
+        (keepalive,) = struct.unpack_from("!H", body, pos + 2)
+        pos += 4
+
+        def refuse(rc: int):
+            writer.write(bytes((CONNACK << 4, 2, 0, rc)))
+            with self._lock:
+                self.stats["refused"] += 1
+            return None
+
+        if (name, level) not in ((b"MQTT", 4), (b"MQIsdp", 3)):
+            return refuse(CONNACK_BAD_PROTOCOL)
+        clean = bool(flags & 0x02)
+        client_id_bytes, pos = _string(body, pos)
+        will = None
+        if flags & 0x04:
+            will_topic, pos = _string(body, pos)
+            will_payload, pos = _string(body, pos)
+            will = (will_topic.decode("utf-8"), will_payload, (flags >> 3) & 0x03, bool(flags & 0x20))
+        username = password = None
+        if flags & 0x80:
+            raw, pos = _string(body, pos)
+            username = raw.decode("utf-8")
+        if flags & 0x40:
+            raw, pos = _string(body, pos)
+            password = raw.decode("utf-8")
+
+        if username is not None:
+            if self.users.get(username) != password:
+                return refuse(CONNACK_BAD_CREDENTIALS)
+        elif not allow_anonymous:
+            return refuse(CONNACK_NOT_AUTHORIZED)
+
+        client_id = client_id_bytes.decode("utf-8")
+        if not client_id:
+            if not clean:
+                return refuse(CONNACK_ID_REJECTED)
+            client_id = f"auto-{uuid.uuid4().hex[:12]}"
+
+        session = _Session(client_id, writer, listener, keepalive, will)
+        with self._lock:
+            old = self._sessions.get(client_id)
+            self._sessions[client_id] = session
+            self.stats["connections"] += 1
+        if old is not None:
+            # Session takeover: the old connection goes away without its will
+            old.clean_exit = True
+            old.writer.close()
+        writer.write(bytes((CONNACK << 4, 2, 0, CONNACK_ACCEPTED)))
+        return session
+
+    def _disconnect(self, session: _Session):
+        with self._lock:
+            if self._sessions.get(session.client_id) is session:
+                del self._sessions[session.client_id]
+        if not session.clean_exit and session.will is not None:
+            topic, payload, qos, retain = session.will
+            with self._lock:
+                self.stats["wills"] += 1
+            self._route(topic, payload, qos, retain)
+
+    def _handle(self, session: _Session, ptype: int, flags: int, body: bytes):
+        if ptype == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            retain = bool(flags & 0x01)
+            topic_bytes, pos = _string(body, 0)
+            topic = topic_bytes.decode("utf-8")
+            if not topic or "+" in topic or "#" in topic or qos == 3:
+                raise ProtocolError(f"invalid PUBLISH topic={topic!r} qos={qos}")
+            mid = None
+            if qos:
+                (mid,) = struct.unpack_from("!H", body, pos)
+                pos += 2
+            payload = body[pos:]
+            if qos == 1:
+                session.send(bytes((PUBACK << 4, 2)) + struct.pack("!H", mid))
+            elif qos == 2:
+                session.send(bytes((PUBREC << 4, 2)) + struct.pack("!H", mid))
+                if mid in session.qos2_pending:
+                    return  # duplicate before PUBREL
+                session.qos2_pending.add(mid)
+            with self._lock:
+                self.stats["received"] += 1
+            self._route(topic, payload, qos, retain)
+        elif ptype == PUBREL:
+            (mid,) = struct.unpack_from("!H", body, 0)
+            session.qos2_pending.discard(mid)
+            session.send(bytes((PUBCOMP << 4, 2)) + struct.pack("!H", mid))
+        elif ptype in (PUBACK, PUBREC, PUBCOMP):
+            pass  # deliveries are not retried, so acknowledgements need no bookkeeping
+        elif ptype == SUBSCRIBE:
+            (mid,) = struct.unpack_from("!H", body, 0)
+            pos, granted, new_filters = 2, [], []
+            while pos < len(body):
+                raw, pos = _string(body, pos)
+                requested = body[pos] & 0x03
+                pos += 1
+                topic_filter = raw.decode("utf-8")
+                if not valid_filter(topic_filter):
+                    granted.append(0x80)
+                    continue
+                qos = min(requested, MAX_GRANTED_QOS)
+                with self._lock:
+                    session.subscriptions[topic_filter] = qos
+                granted.append(qos)
+                new_filters.append((topic_filter, qos))
+            session.send(bytes((SUBACK << 4,)) + _encode_length(2 + len(granted)) + struct.pack("!H", mid) + bytes(granted))
+            # Retained messages for the new subscriptions, flagged as retained
+            with self._lock:
+                retained = list(self.retained.items())
+            for topic, (payload, stored_qos) in retained:
+                for topic_filter, qos in new_filters:
+                    if topic_matches(topic_filter, topic):
+                        delivery_qos = min(qos, stored_qos)
+                        session.send(_publish_packet(topic, payload, delivery_qos, True, session.next_mid() if delivery_qos else 0))
+                        break
+        elif ptype == UNSUBSCRIBE:
+            (mid,) = struct.unpack_from("!H", body, 0)
+            pos = 2
+            while pos < len(body):
+                raw, pos = _string(body, pos)
+                with self._lock:
+                    session.subscriptions.pop(raw.decode("utf-8"), None)
+            session.send(bytes((UNSUBACK << 4, 2)) + struct.pack("!H", mid))
+        elif ptype == PINGREQ:
+            session.send(bytes((PINGRESP << 4, 0)))
+        else:
+            raise ProtocolError(f"unexpected packet type {ptype}")
+
+    def _route(self, topic: str, payload: bytes, qos: int, retain: bool):
+        """Store retained state and deliver to every matching subscriber once, at the best granted QoS"""
+        qos = min(qos, MAX_GRANTED_QOS)
+        with self._lock:
+            if retain:
+                if payload:
+                    self.retained[topic] = (payload, qos)
+                else:
+                    self.retained.pop(topic, None)
+            sessions = list(self._sessions.values())
+        delivered = 0
+        for session in sessions:
+            best = -1
+            for topic_filter, granted in session.subscriptions.items():
+                if granted > best and topic_matches(topic_filter, topic):
+                    best = granted
+            if best < 0:
+                continue
+            delivery_qos = min(qos, best)
+            session.send(_publish_packet(topic, payload, delivery_qos, False, session.next_mid() if delivery_qos else 0))
+            delivered += 1
+        if delivered:
+            with self._lock:
+                self.stats["delivered"] += delivered
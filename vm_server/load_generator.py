@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Load generator for the NEMO Tool Display VM server
+Publishes realistic nemo/tools/<id>/{enabled,start,end,disabled} sequences, HMAC-signed
+the way NEMO signs them, at an open-loop target rate over several connections, and
+reports achieved rate, publish errors and PUBACK latency corrected for coordinated omission
+"""
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import paho.mqtt.client as mqtt
+from dotenv import load_dotenv
+
+import codec
+from hmac_keyring import sign_payload
+from metrics import LogHistogram
+
+# Load configuration from config.env
+load_dotenv('config.env')
+codec.use(os.getenv('JSON_CODEC', 'auto').strip().lower() or 'auto')
+
+USER_NAMES = ["Alex Denton (admin)", "JC Denton (user)", "Anna Navarre (staff)", "Paul Denton (user)", "Tracer Tong (staff)"]
+PERCENTILES = (50, 90, 99, 99.9)
+# Seconds to wait for outstanding PUBACKs after the last publish
+DRAIN_SECONDS = 5.0
+
+
+class ToolSimulator:
+    """Cycles one tool through enabled -> start -> end, occasionally disabled -> enabled"""
+
+    def __init__(self, tool_id: int, rng: random.Random, disable_probability: float = 0.1):
+        self.tool_id = tool_id
+        self.tool_name = f"loadtest-tool-{tool_id}"
+        self.rng = rng
+        self.disable_probability = disable_probability
+        self.state = "disabled"
+        self.usage_id = tool_id * 1_000_000
+        self.user = None
+        self.started_at = None
+
+    def next_event(self):
+        """(event_type, payload dict) for the next transition"""
+        now = datetime.now(timezone.utc)
+        if self.state in ("disabled", "idle"):
+            self.state = "enabled"
+            return "enabled", self._base("tool_enabled", timestamp=now.isoformat())
+        if self.state == "enabled":
+            if self.rng.random() < self.disable_probability:
+                self.state = "disabled"
+                return "disabled", self._base("tool_disabled", timestamp=now.isoformat())
+            self.state = "active"
+            self.usage_id += 1
+            self.user = self.rng.randrange(len(USER_NAMES))
+            self.started_at = now
+            return "start", self._usage("tool_usage_start", end_time=None)
+        # active -> end, stamped with the real send time like every other event: a future
+        # end_time would make the server treat the tool's following events as stale
+        self.state = "idle"
+        return "end", self._usage("tool_usage_end", end_time=now.isoformat())
+
+    def _base(self, event: str, **extra) -> dict:
+        return {"event": event, "tool_id": self.tool_id, "tool_name": self.tool_name, **extra}
+
+    def _usage(self, event: str, end_time):
+        return self._base(
+            event,
+            usage_id=self.usage_id,
+            user_id=self.user + 1,
+            user_name=USER_NAMES[self.user],
+            start_time=self.started_at.isoformat(),
+            end_time=end_time,
+        )
+
+
+class Connection:
+    """One publishing client with PUBACK tracking"""
+
+    def __init__(self, index: int, args, report):
+        self.index = index
+        self.report = report
+        self.client = mqtt.Client(client_id=f"nemo-loadgen-{os.getpid()}-{index}")
+        if args.username and args.password:
+            self.client.username_pw_set(args.username, args.password)
+        self.client.max_inflight_messages_set(args.inflight)
+        self.client.max_queued_messages_set(0)
+        self.client.on_publish = self.on_publish
+        self.connected = threading.Event()
+        self.client.on_connect = lambda c, u, f, rc: rc == 0 and self.connected.set()
+        self._lock = threading.Lock()
+        self._outstanding = {}  # mid -> (intended, sent)
+        self._acked_early = {}  # mid -> ack time, when PUBACK beats publish() returning
+
+    def on_publish(self, client, userdata, mid):
+        acked = time.perf_counter()
+        with self._lock:
+            times = self._outstanding.pop(mid, None)
+            if times is None:
+                self._acked_early[mid] = acked
+                return
+        self.report.acked(times[0], times[1], acked)
+
+    def publish(self, topic: str, payload: str, qos: int, intended: float):
+        sent = time.perf_counter()
+        info = self.client.publish(topic, payload, qos=qos, retain=False)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS and info.rc != mqtt.MQTT_ERR_NO_CONN:
+            self.report.error(mqtt.error_string(info.rc))
+            return
+        if qos == 0:
+            self.report.acked(intended, sent, time.perf_counter())
+            return
+        with self._lock:
+            acked = self._acked_early.pop(info.mid, None)
+            if acked is None:
+                self._outstanding[info.mid] = (intended, sent)
+        if acked is not None:
+            self.report.acked(intended, sent, acked)
+
+    def outstanding(self) -> int:
+        with self._lock:
+            return len(self._outstanding)
+
+
+class LoadReport:
+    """Counters and latency histograms (microseconds)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.acked_count = 0
+        self.errors = {}
+        self.corrected = LogHistogram()  # ack - intended send time (includes time spent behind schedule)
+        self.service = LogHistogram()  # ack - actual send time
+        self.max_lag = 0.0  # worst scheduler lag behind the intended send time
+
+    def acked(self, intended: float, sent: float, acked: float):
+        with self._lock:
+            self.acked_count += 1
+            self.corrected.add(int((acked - intended) * 1_000_000))
+            self.service.add(int((acked - sent) * 1_000_000))
+
+    def error(self, name: str):
+        with self._lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    @staticmethod
+    def _line(label: str, hist: LogHistogram) -> str:
+        parts = [f"p{p:g} {hist.percentile(p) / 1000:.2f}" for p in PERCENTILES]
+        return f"  {label:<22} " + " | ".join(parts) + f" | max {hist.max / 1000:.2f} ms"
+
+    def print(self, target_rate: float, elapsed: float, unacked: int):
+        print("\n" + "=" * 80)
+        print("📊 LOAD GENERATOR RESULTS")
+        print("=" * 80)
+        print(f"  Target rate:   {target_rate:.1f} msg/s")
+        print(f"  Achieved rate: {self.sent / elapsed:.1f} msg/s sent, {self.acked_count / elapsed:.1f} msg/s acknowledged")
+        print(f"  Sent: {self.sent} | Acknowledged: {self.acked_count} | Unacknowledged: {unacked}")
+        print(f"  Max scheduler lag: {self.max_lag * 1000:.1f} ms")
+        if self.errors:
+            print("  ❌ Publish errors: " + ", ".join(f"{name}: {count}" for name, count in sorted(self.errors.items())))
+        else:
+            print("  ✅ No publish errors")
+        print("  Latency (PUBACK):")
+        print(self._line("corrected (intended)", self.corrected))
+        print(self._line("service (actual send)", self.service))
+        print("=" * 80)
+
+
+def run(args) -> LoadReport:
+    rng = random.Random(args.seed)
+    tools = [ToolSimulator(args.first_tool_id + i, rng) for i in range(args.tools)]
+    report = LoadReport()
+    connections = [Connection(i, args, report) for i in range(args.connections)]
+
+    print(f"🔌 Connecting {len(connections)} client(s) to {args.broker}:{args.port}...")
+    for conn in connections:
+        conn.client.connect(args.broker, args.port, 60)
+        conn.client.loop_start()
+    for conn in connections:
+        if not conn.connected.wait(10):
+            raise SystemExit(f"❌ Connection {conn.index} did not connect within 10s")
+
+    signing = "HMAC-signed" if args.hmac_key else "unsigned (MQTT_HMAC_KEY not set)"
+    print(f"🚀 {args.rate:g} msg/s for {args.duration:g}s over {args.tools} tools, QoS {args.qos}, {signing}")
+
+    # Open loop: message i is due at start + i / rate whether or not earlier ones finished.
+    # Latency is measured from that intended time, so falling behind shows up in the results.
+    interval = 1.0 / args.rate
+    total = int(args.rate * args.duration)
+    start = time.perf_counter()
+    tool_cycle = itertools.cycle(range(len(tools)))
+    for i in range(total):
+        intended = start + i * interval
+        delay = intended - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            report.max_lag = max(report.max_lag, -delay)
+        tool_index = rng.randrange(len(tools)) if args.random_tools else next(tool_cycle)
+        tool = tools[tool_index]
+        event_type, data = tool.next_event()
+        body = codec.dumps(data)
+        if args.hmac_key:
+            # Signed over the exact body string, as NEMO signs its own serialization
+            body = codec.dumps(sign_payload(args.hmac_key, body, include_kid=not args.no_kid))
+        # Tools stick to one connection so each tool's events stay in order
+        connections[tool_index % len(connections)].publish(f"nemo/tools/{tool.tool_id}/{event_type}", body, args.qos, intended)
+        report.sent += 1
+    send_elapsed = time.perf_counter() - start
+
+    deadline = time.monotonic() + DRAIN_SECONDS
+    while time.monotonic() < deadline and any(conn.outstanding() for conn in connections):
+        time.sleep(0.05)
+    unacked = sum(conn.outstanding() for conn in connections)
+    for conn in connections:
+        conn.client.disconnect()
+        conn.client.loop_stop()
+
+    report.print(args.rate, send_elapsed, unacked)
+    return report
+
+
+def parse_args(argv=None):
+    """Parse command line options (connection defaults come from config.env)"""
+    parser = argparse.ArgumentParser(description="Signed NEMO traffic load generator")
+    parser.add_argument("--broker", default=os.getenv('MQTT_BROKER', 'localhost'))
+    parser.add_argument("--port", type=int, default=int(os.getenv('MQTT_PORT', '1886')), help="NEMO listener port")
+    parser.add_argument("--username", default=os.getenv('MQTT_USERNAME', ''))
+    parser.add_argument("--password", default=os.getenv('MQTT_PASSWORD', ''))
+    parser.add_argument("--hmac-key", default=os.getenv('MQTT_HMAC_KEY', ''),
+                        help="Key used to sign envelopes (default MQTT_HMAC_KEY; empty = unsigned JSON)")
+    parser.add_argument("--no-kid", action="store_true", help="Omit the key id hint from envelopes")
+    parser.add_argument("--rate", type=float, default=100.0, help="Target messages/sec (default 100)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to publish for (default 10)")
+    parser.add_argument("--connections", type=int, default=4, help="Publishing connections (default 4)")
+    parser.add_argument("--tools", type=int, default=50, help="Simulated tools (default 50)")
+    parser.add_argument("--first-tool-id", type=int, default=9000,
+                        help="Tool id of the first simulated tool (default 9000, away from real tools)")
+    parser.add_argument("--random-tools", action="store_true", help="Pick tools at random instead of round-robin")
+    parser.add_argument("--qos", type=int, choices=(0, 1), default=1)
+    parser.add_argument("--inflight", type=int, default=20, help="Max in-flight QoS 1 messages per connection")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible sequences")
+    args = parser.parse_args(argv)
+    if args.rate <= 0 or args.duration <= 0 or args.connections < 1 or args.tools < 1:
+        parser.error("--rate, --duration, --connections and --tools must be positive")
+    return args
+
+
+def main():
+    args = parse_args()
+    report = run(args)
+    sys.exit(1 if report.errors else 0)
+
+
+if __name__ == "__main__":
+    main()
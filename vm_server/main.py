@@ -7,42 +7,152 @@ Main application that receives tool status via MQTT and distributes to ESP32 dis
 
 import asyncio
 import hashlib
-import hmac as hmac_lib
-import json
 import logging
 import os
 import signal
 import sys
 import socket
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
 import paho.mqtt.client as mqtt
-from dotenv import load_dotenv
+from dotenv import load_dotenv, dotenv_values
 from config_parser import get_mqtt_ports, get_esp32_port, get_nemo_port, get_mqtt_broker
+from admission import AdmissionController
+from outbound import OutboundPublisher
+from resync import ResyncEngine
+from bootstrap import RetainedStateBootstrap, last_users_from_retained
+from hmac_keyring import HmacKeyring
+from profiler import SamplingProfiler
+from tracing import NULL_TRACE, SpanTracer
+from fleet import FleetRegistry, HEARTBEAT_FILTER, PRESENCE_FILTER, display_client_id
+from monitor_log import LogTailer
+from sources import DEFAULT_SOURCE, NemoSource, event_age_seconds, source_configs
+from history import EventHistory
+from utilization import DAYS as UTILIZATION_DAYS, UtilizationTracker
+from ordering import APPLY as ORDER_APPLY, EventOrderGuard
+from templates import ESP32_ACTIVE, ESP32_DISABLED, ESP32_ENABLED, StatusTemplates
+import codec
 
-# Load environment variables
-load_dotenv('config.env')
+CONFIG_ENV_PATH = 'config.env'
+LOG_FILE = 'nemo_server.log'
+# Signed like NEMO tool events; payload {"seconds": N} is optional
+ADMIN_PROFILE_TOPIC = 'nemo/server/admin/profile'
+# Signed; writes the span ring buffer to a trace file
+ADMIN_TRACE_TOPIC = 'nemo/server/admin/trace'
+# Only subscribed, and only acted on, when the source has an HMAC key: unsigned admin messages never start anything
+ADMIN_TOPICS = (ADMIN_PROFILE_TOPIC, ADMIN_TRACE_TOPIC)
+# A display's heartbeat may lag a publish by this much before it counts as out of sync
+DISPLAY_SYNC_GRACE_SECONDS = 10
+# How often per-source throughput/lag is logged when several NEMO sources are configured
+SOURCE_REPORT_INTERVAL = 60
+# Retained utilization reports: all tools (summary) and one per tool on the ESP32 broker
+UTILIZATION_TOPIC = 'nemo/server/stats/utilization'
+UTILIZATION_TOOL_TOPIC = 'nemo/esp32/{tool_id}/utilization'
+# Not retained, QoS 0: a NEMO event handled without a display publish (unchanged or out of order),
+# so the monitor's forwarding correlator does not report it as lost
+SUPPRESSED_TOPIC = 'nemo/server/suppressed/{tool_id}'
+
+# Importing this module has no side effects: config.env, validation and logging
+# are set up on first use (get_config) or by the entry point (main/setup_logging).
+_CONFIG = None
+_CONFIG_LOCK = threading.Lock()
+# Process environment before config.env is applied; real env vars keep precedence on reload
+_PROCESS_ENV = None
+
+# Settings that only take effect on restart (connections and queue sizes are built once)
+RESTART_REQUIRED_KEYS = (
+    'mqtt_broker', 'mqtt_port_esp32', 'mqtt_port_nemo', 'mqtt_username', 'mqtt_password', 'ingest_queue_size',
+    'outbound_max_inflight', 'outbound_retry_queue_size', 'outbound_spool_dir', 'trace_buffer_spans',
+    'display_broker_log', 'nemo_sources', 'history_dir', 'history_segment_mb', 'history_segment_hours',
+)
 
 # Configuration validation and loading
-def load_config():
-    """Load and validate configuration from environment variables"""
+def load_config(environ=None):
+    """Load and validate configuration from environment variables (or the given mapping)"""
+    env = os.environ if environ is None else environ
     config = {}
     
     # MQTT Configuration
     # MQTT_BROKER defaults to localhost since Mosquitto runs on the same VM
     # Note: NEMO backend needs to know the VM's IP address (e.g., 10.0.0.31) to connect to Mosquitto
-    config['mqtt_broker'] = os.getenv('MQTT_BROKER', 'localhost')
-    config['mqtt_hmac_key'] = os.getenv('MQTT_HMAC_KEY', '')
-    config['mqtt_username'] = os.getenv('MQTT_USERNAME', '')
-    config['mqtt_password'] = os.getenv('MQTT_PASSWORD', '')
+    config['mqtt_broker'] = env.get('MQTT_BROKER', 'localhost')
+    config['mqtt_hmac_key'] = env.get('MQTT_HMAC_KEY', '')
+    # Key rotation: previous key accepted until removed, or for a window after a hot reload
+    config['mqtt_hmac_key_previous'] = env.get('MQTT_HMAC_KEY_PREVIOUS', '')
+    config['mqtt_hmac_rotation_window_seconds'] = float(env.get('MQTT_HMAC_ROTATION_WINDOW_SECONDS', '600'))
+    config['mqtt_username'] = env.get('MQTT_USERNAME', '')
+    config['mqtt_password'] = env.get('MQTT_PASSWORD', '')
+    # Listener ports; None = use src/config.h (MQTT_PORT_ESP32 / MQTT_PORT_NEMO)
+    config['mqtt_port_esp32'] = int(env['MQTT_PORT_ESP32']) if env.get('MQTT_PORT_ESP32') else None
+    config['mqtt_port_nemo'] = int(env['MQTT_PORT']) if env.get('MQTT_PORT') else None
+    # How long startup waits for each broker connection before giving up
+    config['mqtt_connect_timeout_seconds'] = float(env.get('MQTT_CONNECT_TIMEOUT_SECONDS', '10'))
+    # Extra upstream NEMO brokers (NEMO_SOURCES + NEMO_SOURCE_<NAME>_*), fanned into one pipeline
+    config['nemo_sources'] = source_configs(env, config)
     
     # Display Configuration
-    config['timezone_offset_hours'] = int(os.getenv('TIMEZONE_OFFSET_HOURS', '-7'))
-    config['max_name_length'] = int(os.getenv('MAX_NAME_LENGTH', '13'))
+    config['timezone_offset_hours'] = int(env.get('TIMEZONE_OFFSET_HOURS', '-7'))
+    config['max_name_length'] = int(env.get('MAX_NAME_LENGTH', '13'))
     
     # Logging Configuration
-    config['log_level'] = os.getenv('LOG_LEVEL', 'INFO').upper()
+    config['log_level'] = env.get('LOG_LEVEL', 'INFO').upper()
+    
+    # Ingest admission control (rates in messages/sec; 0 = unlimited)
+    config['ingest_queue_size'] = int(env.get('INGEST_QUEUE_SIZE', '1000'))
+    config['ingest_rate_limit'] = float(env.get('INGEST_RATE_LIMIT', '0'))
+    config['ingest_burst'] = float(env.get('INGEST_BURST', '50'))
+    config['ingest_tool_rate_limit'] = float(env.get('INGEST_TOOL_RATE_LIMIT', '5'))
+    config['ingest_tool_burst'] = float(env.get('INGEST_TOOL_BURST', '10'))
+    
+    # Outbound flow control (window matches mosquitto max_inflight_messages)
+    config['outbound_max_inflight'] = int(env.get('OUTBOUND_MAX_INFLIGHT', '20'))
+    config['outbound_retry_queue_size'] = int(env.get('OUTBOUND_RETRY_QUEUE_SIZE', '500'))
+    config['outbound_spool_dir'] = env.get('OUTBOUND_SPOOL_DIR', '').strip()
+    config['outbound_drain_rate'] = float(env.get('OUTBOUND_DRAIN_RATE', '20'))
+    
+    # Full-state resync after ESP32 broker reconnect (messages/sec)
+    config['resync_rate'] = float(env.get('RESYNC_RATE', '50'))
+    config['resync_burst'] = float(env.get('RESYNC_BURST', '10'))
+    
+    # Warm-start from retained ESP32 status topics (seconds; 0 = disabled)
+    config['bootstrap_window_seconds'] = float(env.get('BOOTSTRAP_WINDOW_SECONDS', '3'))
+    
+    # Hot reload: poll config.env mtime every N seconds (0 = reload on SIGHUP only)
+    config['config_watch_interval_seconds'] = float(env.get('CONFIG_WATCH_INTERVAL_SECONDS', '0'))
+    
+    # On-demand sampling profiler (SIGUSR1 or nemo/server/admin/profile)
+    config['profile_dir'] = env.get('PROFILE_DIR', 'profiles').strip() or 'profiles'
+    config['profile_default_seconds'] = float(env.get('PROFILE_DEFAULT_SECONDS', '30'))
+    config['profile_max_seconds'] = float(env.get('PROFILE_MAX_SECONDS', '300'))
+    config['profile_sample_interval_ms'] = float(env.get('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+    
+    # Per-stage span tracing of the forwarding path (ring buffer size; 0 = disabled)
+    config['trace_buffer_spans'] = int(env.get('TRACE_BUFFER_SPANS', '8192'))
+    config['trace_dir'] = env.get('TRACE_DIR', 'traces').strip() or 'traces'
+    
+    # Display fleet: presence/heartbeat topics plus mosquitto.log connect lines (empty path = off)
+    config['display_client_prefix'] = env.get('DISPLAY_CLIENT_PREFIX', 'nemo_display_')
+    config['display_stale_seconds'] = float(env.get('DISPLAY_STALE_SECONDS', '180'))
+    config['display_broker_log'] = env.get('DISPLAY_BROKER_LOG', 'mqtt/log/mosquitto.log').strip()
+    config['display_resync_on_reconnect'] = env.get('DISPLAY_RESYNC_ON_RECONNECT', 'true').strip().lower() in ('1', 'true', 'yes')
+    
+    # Tool event history (segmented append-only log; empty dir = off, retention 0 = keep forever)
+    config['history_dir'] = env.get('HISTORY_DIR', 'history').strip()
+    config['history_segment_mb'] = float(env.get('HISTORY_SEGMENT_MB', '16'))
+    config['history_segment_hours'] = float(env.get('HISTORY_SEGMENT_HOURS', '24'))
+    config['history_retention_days'] = float(env.get('HISTORY_RETENTION_DAYS', '365'))
+    
+    # Events up to this many seconds older than a tool's current state count as simultaneous
+    config['event_reorder_window_seconds'] = float(env.get('EVENT_REORDER_WINDOW_SECONDS', '2'))
+    
+    # JSON backend: auto (orjson, then msgspec, then stdlib), orjson, msgspec or json
+    config['json_codec'] = env.get('JSON_CODEC', 'auto').strip().lower() or 'auto'
+    
+    # Per-tool utilization reports (seconds between publishes; 0 = don't publish)
+    config['utilization_publish_seconds'] = float(env.get('UTILIZATION_PUBLISH_SECONDS', '300'))
     
     # Validate required configurations
     
@@ -52,24 +162,119 @@ def load_config():
     if config['max_name_length'] < 1 or config['max_name_length'] > 50:
         raise ValueError("MAX_NAME_LENGTH must be between 1 and 50")
     
+    if config['ingest_queue_size'] < 1:
+        raise ValueError("INGEST_QUEUE_SIZE must be at least 1")
+    
+    for key in ('ingest_rate_limit', 'ingest_burst', 'ingest_tool_rate_limit', 'ingest_tool_burst'):
+        if config[key] < 0:
+            raise ValueError(f"{key.upper()} must not be negative")
+    
+    if config['outbound_max_inflight'] < 1:
+        raise ValueError("OUTBOUND_MAX_INFLIGHT must be at least 1")
+    
+    if config['outbound_retry_queue_size'] < 1:
+        raise ValueError("OUTBOUND_RETRY_QUEUE_SIZE must be at least 1")
+    
+    if config['outbound_drain_rate'] <= 0:
+        raise ValueError("OUTBOUND_DRAIN_RATE must be positive")
+    
+    if config['resync_rate'] <= 0 or config['resync_burst'] < 1:
+        raise ValueError("RESYNC_RATE must be positive and RESYNC_BURST at least 1")
+    
+    if config['bootstrap_window_seconds'] < 0 or config['bootstrap_window_seconds'] > 60:
+        raise ValueError("BOOTSTRAP_WINDOW_SECONDS must be between 0 and 60")
+    
+    if config['mqtt_hmac_rotation_window_seconds'] < 0:
+        raise ValueError("MQTT_HMAC_ROTATION_WINDOW_SECONDS must not be negative")
+    
+    if config['config_watch_interval_seconds'] < 0:
+        raise ValueError("CONFIG_WATCH_INTERVAL_SECONDS must not be negative")
+    
+    for key, name in (('mqtt_port_esp32', 'MQTT_PORT_ESP32'), ('mqtt_port_nemo', 'MQTT_PORT')):
+        if config[key] is not None and not 0 < config[key] < 65536:
+            raise ValueError(f"{name} must be between 1 and 65535")
+    
+    if config['mqtt_connect_timeout_seconds'] <= 0:
+        raise ValueError("MQTT_CONNECT_TIMEOUT_SECONDS must be positive")
+    
+    if config['profile_max_seconds'] <= 0 or not 0 < config['profile_default_seconds'] <= config['profile_max_seconds']:
+        raise ValueError("PROFILE_DEFAULT_SECONDS must be positive and at most PROFILE_MAX_SECONDS")
+    
+    if config['profile_sample_interval_ms'] < 1 or config['profile_sample_interval_ms'] > 1000:
+        raise ValueError("PROFILE_SAMPLE_INTERVAL_MS must be between 1 and 1000")
+    
+    if config['trace_buffer_spans'] < 0:
+        raise ValueError("TRACE_BUFFER_SPANS must not be negative")
+    
+    if config['display_stale_seconds'] <= 0:
+        raise ValueError("DISPLAY_STALE_SECONDS must be positive")
+    
+    if config['history_segment_mb'] <= 0 or config['history_segment_mb'] > 1024 or config['history_segment_hours'] <= 0:
+        raise ValueError("HISTORY_SEGMENT_MB must be between 0 and 1024 and HISTORY_SEGMENT_HOURS positive")
+    
+    if config['history_retention_days'] < 0:
+        raise ValueError("HISTORY_RETENTION_DAYS must not be negative")
+    
+    if config['event_reorder_window_seconds'] < 0 or config['event_reorder_window_seconds'] > 3600:
+        raise ValueError("EVENT_REORDER_WINDOW_SECONDS must be between 0 and 3600")
+    
+    if config['json_codec'] not in codec.CHOICES:
+        raise ValueError(f"JSON_CODEC must be one of {', '.join(codec.CHOICES)}")
+    
+    if config['utilization_publish_seconds'] < 0:
+        raise ValueError("UTILIZATION_PUBLISH_SECONDS must not be negative")
+    
     return config
 
-# Load configuration
-try:
-    CONFIG = load_config()
-except Exception as e:
-    print(f"Configuration error: {e}")
-    sys.exit(1)
+def read_config_env(path=CONFIG_ENV_PATH):
+    """Fresh environment for a reload: config.env values under the original process env"""
+    env = {k: v for k, v in dotenv_values(path).items() if v is not None}
+    env.update(_PROCESS_ENV if _PROCESS_ENV is not None else os.environ)
+    return env
+
+
+def get_config():
+    """Load config.env and validate it on first call; later calls return the cached config.
+    Raises ValueError on invalid configuration.
+    """
+    global _CONFIG, _PROCESS_ENV
+    with _CONFIG_LOCK:
+        if _CONFIG is None:
+            if _PROCESS_ENV is None:
+                _PROCESS_ENV = dict(os.environ)
+            load_dotenv(CONFIG_ENV_PATH)
+            _CONFIG = load_config()
+        return _CONFIG
+
+
+def __getattr__(name):
+    # Backwards compatibility: main.CONFIG loads the config lazily
+    if name == 'CONFIG':
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
+def setup_logging(level_name: str = 'INFO', log_file: Optional[str] = LOG_FILE):
+    """Configure root logging for the server process (file + stdout)"""
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.insert(0, logging.FileHandler(log_file))
+    logging.basicConfig(
+        level=getattr(logging, level_name, logging.INFO),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=handlers
+    )
 
-def print_mqtt_config_for_debug():
+
+def print_mqtt_config_for_debug(config: Optional[dict] = None):
     """Print current MQTT config to terminal for verification during debugging."""
-    broker = CONFIG.get('mqtt_broker', 'localhost')
+    config = config if config is not None else get_config()
+    broker = config.get('mqtt_broker', 'localhost')
     nemo_port = get_nemo_port()
     esp32_port = get_esp32_port()
-    user = CONFIG.get('mqtt_username', '')
-    pass_set = 'yes' if CONFIG.get('mqtt_password') else 'no'
-    hmac_set = 'yes' if (CONFIG.get('mqtt_hmac_key') or '').strip() else 'no'
+    user = config.get('mqtt_username', '')
+    pass_set = 'yes' if config.get('mqtt_password') else 'no'
+    hmac_set = 'yes' if (config.get('mqtt_hmac_key') or '').strip() else 'no'
     print("=" * 60)
     print("MQTT config (for NEMO backend verification)")
     print("=" * 60)
@@ -82,16 +287,6 @@ def print_mqtt_config_for_debug():
     print("=" * 60)
 
 
-# Configure logging
-log_level = getattr(logging, CONFIG['log_level'], logging.INFO)
-logging.basicConfig(
-    level=log_level,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('nemo_server.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
 logger = logging.getLogger(__name__)
 
 
@@ -118,9 +313,13 @@ def get_local_ip():
 class NEMOToolServer:
     """Main server class for NEMO Tool Display system"""
     
-    def __init__(self):
-        # Load configuration
-        self.config = CONFIG
+    def __init__(self, config: Optional[dict] = None):
+        # Load configuration (replaced as a whole on reload; readers take one reference per message)
+        self.config = config if config is not None else get_config()
+        previous = self.config['mqtt_hmac_key_previous']
+        self.keyring = HmacKeyring(self.config['mqtt_hmac_key'], [(previous, None)] if previous else [])
+        self.reload_requested = False
+        logger.info(f"🧩 JSON codec: {codec.use(self.config['json_codec'])}")
         
         # MQTT broker defaults to localhost (Mosquitto runs on same VM)
         logger.info(f"MQTT broker: {self.config['mqtt_broker']}")
@@ -128,27 +327,101 @@ class NEMOToolServer:
         # Track last users for each tool (keyed by tool_id)
         self.last_users = {}  # tool_id (str) -> user_name
         
-        self.mqtt_client_nemo = None  # Client for receiving from NEMO on port 1886
+        self.mqtt_client_nemo = None  # Client for receiving from NEMO on port 1886 (the default source)
         self.mqtt_client_esp32 = None  # Client for publishing to ESP32s on port 1883
         self.running = False
 
+        # Upstream NEMO brokers: the default one (MQTT_BROKER/MQTT_PORT, server keyring) plus NEMO_SOURCES
+        self.sources = [NemoSource(DEFAULT_SOURCE, self.config['mqtt_broker'], self.config.get('mqtt_port_nemo'),
+                                   self.config['mqtt_username'], self.config['mqtt_password'])]
+        self.sources += [NemoSource.from_config(source) for source in self.config['nemo_sources']]
+
+        # Bounded, prioritized queue between the NEMO client threads and message processing
+        self.admission = AdmissionController(
+            self.handle_nemo_message,
+            queue_size=self.config['ingest_queue_size'],
+            global_rate=self.config['ingest_rate_limit'],
+            global_burst=self.config['ingest_burst'],
+            tool_rate=self.config['ingest_tool_rate_limit'],
+            tool_burst=self.config['ingest_tool_burst'],
+            on_shed=self._record_shed,
+        )
+        self._last_shed_total = 0
+        self._last_source_report = time.monotonic()
+
+        # Windowed ESP32 publisher with retry queue and optional disk spool
+        self.publisher = OutboundPublisher(
+            max_inflight=self.config['outbound_max_inflight'],
+            retry_queue_size=self.config['outbound_retry_queue_size'],
+            spool_dir=self.config['outbound_spool_dir'] or None,
+            drain_rate=self.config['outbound_drain_rate'],
+        )
+
+        # Last payload published per ESP32 topic; republished after ESP32 broker reconnects
+        self.esp32_state = {}  # topic -> payload_json
+        self._state_lock = threading.Lock()
+        self._esp32_connected_once = False
+        self.resync = ResyncEngine(
+            self.publisher.publish,
+            rate=self.config['resync_rate'],
+            burst=self.config['resync_burst'],
+            lock=self._state_lock,
+        )
+
+        # Sampling profiler; idle (no thread, no hooks) until a profile is requested
+        self.profiler = SamplingProfiler(
+            output_dir=self.config['profile_dir'],
+            interval=self.config['profile_sample_interval_ms'] / 1000,
+            max_seconds=self.config['profile_max_seconds'],
+        )
+        self.profile_requested = False
+
+        # Stage spans of recent messages; dumped on SIGUSR2 or nemo/server/admin/trace
+        self.tracer = SpanTracer(self.config['trace_buffer_spans'], output_dir=self.config['trace_dir'])
+        self.trace_dump_requested = False
+
+        # Which displays are online and what each was last sent; drives per-display resync
+        self.fleet = FleetRegistry(
+            client_prefix=self.config['display_client_prefix'],
+            stale_after=self.config['display_stale_seconds'],
+        )
+        log_path = self.config['display_broker_log']
+        self.broker_log = LogTailer(log_path) if log_path else None
+
+        # Every forwarded transition, queryable by time and tool (python history.py)
+        self.history = None
+        if self.config['history_dir']:
+            try:
+                self.history = EventHistory(
+                    self.config['history_dir'],
+                    segment_bytes=int(self.config['history_segment_mb'] * 1024 * 1024),
+                    segment_seconds=self.config['history_segment_hours'] * 3600,
+                    retention_seconds=self.config['history_retention_days'] * 86400,
+                )
+            except OSError as e:
+                logger.error(f"❌ Event history disabled, cannot open {self.config['history_dir']}: {e}")
+
+        # Late, redelivered and out-of-order events are dropped per tool before they change state
+        self.order_guard = EventOrderGuard(self.config['event_reorder_window_seconds'])
+        self._last_order_dropped = 0
+        self._unchanged_publishes = 0
+
+        # Pre-serialized per-tool status payload fragments
+        self.status_templates = StatusTemplates()
+
+        # In-use/idle/disabled time per tool in hourly and daily buckets
+        self.utilization = UtilizationTracker(self.config['timezone_offset_hours'])
+        # Both warm-started from the history
+        if self.history:
+            self.replay_history()
+
     async def init_mqtt(self):
         """Initialize MQTT clients: one for receiving from NEMO (1886), one for publishing to ESP32s (1883)"""
         
-        # ===== NEMO Client (port 1886) - Receives messages from NEMO backend =====
-        import time
-        unique_id = f"nemo_receiver_{int(time.time())}"
-        self.mqtt_client_nemo = mqtt.Client(client_id=unique_id)
-        if self.config['mqtt_username'] and self.config['mqtt_password']:
-            self.mqtt_client_nemo.username_pw_set(self.config['mqtt_username'], self.config['mqtt_password'])
-        
-        self.mqtt_client_nemo.on_connect = self.on_mqtt_connect_nemo
-        self.mqtt_client_nemo.on_disconnect = self.on_mqtt_disconnect_nemo
-        self.mqtt_client_nemo.on_message = self.on_mqtt_message
-        
-        # Set keepalive and other options for LAN reliability
-        self.mqtt_client_nemo.keepalive = 60
-        self.mqtt_client_nemo.will_set("nemo/server/status", "offline", qos=1, retain=True)
+        # ===== NEMO Clients (port 1886) - Receive messages from NEMO backends, one per source =====
+        for source in self.sources:
+            self.make_nemo_client(source)
+        self.mqtt_client_nemo = self.sources[0].client
         
         # ===== ESP32 Client (port 1883) - Publishes to ESP32 displays =====
         import time
@@ -160,27 +433,47 @@ class NEMOToolServer:
         self.mqtt_client_esp32.on_connect = self.on_mqtt_connect_esp32
         self.mqtt_client_esp32.on_disconnect = self.on_mqtt_disconnect_esp32
         self.mqtt_client_esp32.on_publish = self.on_mqtt_publish
+        self.mqtt_client_esp32.message_callback_add(PRESENCE_FILTER, self.on_display_message)
+        self.mqtt_client_esp32.message_callback_add(HEARTBEAT_FILTER, self.on_display_message)
         
         # Set keepalive
         self.mqtt_client_esp32.keepalive = 60
+        self.publisher.attach(self.mqtt_client_esp32)
+        
+        # Start the admission and outbound workers before messages can arrive
+        self.admission.start()
+        self.publisher.start()
         
         try:
-            nemo_port = get_nemo_port()
-            logger.info(f"Connecting NEMO client to mqtt://{self.config['mqtt_broker']}:{nemo_port}")
-            self.mqtt_client_nemo.connect(self.config['mqtt_broker'], nemo_port, 60)
-            self.mqtt_client_nemo.loop_start()
-            
-            # Wait for NEMO client to establish connection
-            await asyncio.sleep(2)
-            
-            # Connect ESP32 client to configured port
-            esp32_port = get_esp32_port()
+            # Connect ESP32 client first so retained state can be read before forwarding starts
+            esp32_port = self.config.get('mqtt_port_esp32') or get_esp32_port()
             logger.info(f"Connecting ESP32 client to mqtt://{self.config['mqtt_broker']}:{esp32_port}")
             self.mqtt_client_esp32.connect(self.config['mqtt_broker'], esp32_port, 60)
             self.mqtt_client_esp32.loop_start()
             
             # Wait for ESP32 client to establish connection
-            await asyncio.sleep(2)
+            await self.wait_connected(self.mqtt_client_esp32)
+            
+            # Rebuild per-tool state from retained status topics before NEMO events arrive
+            await self.bootstrap_from_retained()
+            
+            nemo_port = self.config.get('mqtt_port_nemo') or get_nemo_port()
+            self.sources[0].port = nemo_port
+            logger.info(f"Connecting NEMO client to mqtt://{self.config['mqtt_broker']}:{nemo_port}")
+            self.mqtt_client_nemo.connect(self.config['mqtt_broker'], nemo_port, 60)
+            self.mqtt_client_nemo.loop_start()
+            
+            # Extra sources connect in the background: one cleanroom's broker being down must not stop the rest
+            for source in self.sources[1:]:
+                logger.info(f"Connecting NEMO source {source.name} to mqtt://{source.broker}:{source.port}")
+                source.client.connect_async(source.broker, source.port, 60)
+                source.client.loop_start()
+            
+            # Wait for NEMO client to establish connection
+            await self.wait_connected(self.mqtt_client_nemo)
+            for source in self.sources[1:]:
+                if not await self.wait_connected(source.client):
+                    logger.warning(f"⚠️ NEMO source {source.name} not connected yet; retrying in the background")
             
             # Check NEMO client connection
             if not self.mqtt_client_nemo.is_connected():
@@ -198,16 +491,186 @@ class NEMOToolServer:
             logger.error(f"Failed to connect MQTT clients: {e}")
             raise
     
+    def make_nemo_client(self, source: NemoSource) -> mqtt.Client:
+        """Build the subscribing client for one NEMO source (the source is the paho userdata)"""
+        name = "" if source.is_default else f"{source.name}_"
+        source.client = mqtt.Client(client_id=f"nemo_receiver_{name}{int(time.time())}", userdata=source)
+        if source.username and source.password:
+            source.client.username_pw_set(source.username, source.password)
+        
+        source.client.on_connect = self.on_mqtt_connect_nemo
+        source.client.on_disconnect = self.on_mqtt_disconnect_nemo
+        source.client.on_message = self.on_mqtt_message
+        
+        # Set keepalive and other options for LAN reliability
+        source.client.keepalive = 60
+        source.client.will_set("nemo/server/status", "offline", qos=1, retain=True)
+        return source.client
+    
+    async def wait_connected(self, client, poll_interval=0.01):
+        """Return as soon as ``client`` is connected, or after mqtt_connect_timeout_seconds"""
+        deadline = time.monotonic() + self.config.get('mqtt_connect_timeout_seconds', 10)
+        while not client.is_connected() and time.monotonic() < deadline:
+            await asyncio.sleep(poll_interval)
+        return client.is_connected()
+    
+    async def bootstrap_from_retained(self):
+        """Seed esp32_state and last_users from retained nemo/esp32/+/status payloads"""
+        window = self.config['bootstrap_window_seconds']
+        if window <= 0 or not self.mqtt_client_esp32.is_connected():
+            return
+        try:
+            retained = await RetainedStateBootstrap(self.mqtt_client_esp32, window=window).run()
+        except Exception as e:
+            logger.warning(f"⚠️ Bootstrap from retained topics failed: {e}")
+            return
+        with self._state_lock:
+            for topic, payload in retained.items():
+                # Anything already published by this process is newer than the retained copy
+                self.esp32_state.setdefault(topic, payload)
+        for tool_id, user_name in last_users_from_retained(retained).items():
+            self.last_users.setdefault(tool_id, user_name)
+        logger.info(f"🌅 Restored last user for {len(self.last_users)} tool(s)")
+    
+    def request_reload(self):
+        """Ask for a config reload (safe to call from a signal handler)"""
+        self.reload_requested = True
+    
+    def request_profile(self):
+        """Ask for a profile of PROFILE_DEFAULT_SECONDS (safe to call from a signal handler)"""
+        self.profile_requested = True
+    
+    def handle_admin_profile(self, payload):
+        """nemo/server/admin/profile: start a profile; optional {"seconds": N}"""
+        seconds = self.config['profile_default_seconds']
+        if isinstance(payload, dict) and payload.get('seconds') is not None:
+            try:
+                seconds = float(payload['seconds'])
+            except (TypeError, ValueError):
+                logger.warning(f"⚠️ Ignoring profile request with invalid seconds={payload['seconds']!r}")
+                return
+            if seconds <= 0:
+                logger.warning(f"⚠️ Ignoring profile request with non-positive seconds={seconds:g}")
+                return
+        self.profiler.start(seconds, reason=ADMIN_PROFILE_TOPIC)
+    
+    def request_trace_dump(self):
+        """Ask for the span buffer to be written out (safe to call from a signal handler)"""
+        self.trace_dump_requested = True
+    
+    def reload_config(self) -> bool:
+        """Re-read config.env and apply it; the running config is kept if the new one is invalid"""
+        try:
+            new_config = load_config(read_config_env())
+        except Exception as e:
+            logger.error(f"❌ Config reload rejected, keeping current config: {e}")
+            return False
+        self.apply_config(new_config)
+        return True
+    
+    def apply_config(self, new_config: dict):
+        """Swap in a validated config without dropping MQTT sessions"""
+        old_config = self.config
+        changed = sorted(k for k in new_config if new_config.get(k) != old_config.get(k))
+        if not changed:
+            logger.info("🔄 Config reload: no changes")
+            return
+        
+        if (new_config['mqtt_hmac_key'] != old_config['mqtt_hmac_key']
+                or new_config['mqtt_hmac_key_previous'] != old_config['mqtt_hmac_key_previous']):
+            was_enabled = self.keyring.enabled
+            self.keyring = self.keyring.rotated(
+                new_config['mqtt_hmac_key'],
+                new_config['mqtt_hmac_rotation_window_seconds'],
+                explicit_previous=new_config['mqtt_hmac_key_previous'],
+            )
+            logger.info(f"🔑 HMAC keys now accepted: {self.keyring.describe()}")
+            if self.keyring.enabled != was_enabled:
+                self.update_admin_subscription(self.sources[0])
+        
+        self.admission.global_bucket.set_rate(new_config['ingest_rate_limit'], new_config['ingest_burst'])
+        self.admission.set_tool_rate(new_config['ingest_tool_rate_limit'], new_config['ingest_tool_burst'])
+        self.publisher.drain_bucket.set_rate(new_config['outbound_drain_rate'], max(new_config['outbound_drain_rate'], 1.0))
+        self.resync.bucket.set_rate(new_config['resync_rate'], new_config['resync_burst'])
+        # Picked up by the next profile
+        self.profiler.output_dir = new_config['profile_dir']
+        self.profiler.interval = new_config['profile_sample_interval_ms'] / 1000
+        self.profiler.max_seconds = new_config['profile_max_seconds']
+        self.tracer.output_dir = new_config['trace_dir']
+        self.fleet.client_prefix = new_config['display_client_prefix']
+        self.fleet.stale_after = new_config['display_stale_seconds']
+        self.order_guard.window = new_config['event_reorder_window_seconds']
+        self.status_templates.clear()
+        if new_config['json_codec'] != old_config['json_codec']:
+            logger.info(f"🧩 JSON codec: {codec.use(new_config['json_codec'])}")
+        if self.history:
+            self.history.retention_seconds = new_config['history_retention_days'] * 86400
+        if new_config['timezone_offset_hours'] != old_config['timezone_offset_hours']:
+            # Displayed times switch with self.config below; move the utilization buckets with them
+            self.rebuild_utilization(new_config['timezone_offset_hours'])
+        logging.getLogger().setLevel(getattr(logging, new_config['log_level'], logging.INFO))
+        
+        restart_needed = [k for k in changed if k in RESTART_REQUIRED_KEYS]
+        if restart_needed:
+            logger.warning(f"⚠️ Config reload: {', '.join(restart_needed)} changed but only take effect after restart")
+        
+        # Single reference swap; message handlers read self.config once per message
+        self.config = new_config
+        logger.info(f"🔄 Config reloaded: {', '.join(k for k in changed if 'key' not in k and 'password' not in k) or '(secrets only)'}")
+    
+    async def config_watch(self):
+        """Apply SIGHUP-requested reloads and, if enabled, reload when config.env changes"""
+        last_mtime = self._config_env_mtime()
+        last_check = time.monotonic()
+        while self.running:
+            await asyncio.sleep(1)
+            interval = self.config['config_watch_interval_seconds']
+            if interval > 0 and time.monotonic() - last_check >= interval:
+                last_check = time.monotonic()
+                mtime = self._config_env_mtime()
+                if mtime != last_mtime:
+                    last_mtime = mtime
+                    logger.info(f"🔄 {CONFIG_ENV_PATH} changed, reloading config")
+                    self.reload_config()
+            if self.reload_requested:
+                self.reload_requested = False
+                last_mtime = self._config_env_mtime()
+                logger.info("🔄 Reload requested (SIGHUP), reloading config")
+                self.reload_config()
+    
+    @staticmethod
+    def _config_env_mtime():
+        try:
+            return os.stat(CONFIG_ENV_PATH).st_mtime_ns
+        except OSError:
+            return None
+    
     def on_mqtt_connect_nemo(self, client, userdata, flags, rc):
-        """MQTT connection callback for NEMO client (port 1886)"""
+        """MQTT connection callback for NEMO clients (port 1886); userdata is the NemoSource"""
         if rc == 0:
-            logger.info("✅ NEMO MQTT client connected successfully")
+            logger.info(f"✅ NEMO MQTT client connected successfully (source {userdata.name})")
             # Subscribe to all tool events (enabled, disabled, start, end); same handler and HMAC verification for all
             client.subscribe("nemo/tools/+/+", qos=1)  # nemo/tools/<id>/enabled, .../disabled, .../start, .../end
             client.subscribe("nemo/tools/overall", qos=1)
+            self.update_admin_subscription(userdata)
             logger.info("📥 Subscribed to NEMO tool status updates (nemo/tools only)")
         else:
-            logger.error(f"❌ NEMO MQTT connection failed with code {rc}")
+            logger.error(f"❌ NEMO MQTT connection failed with code {rc} (source {userdata.name})")
+    
+    def keyring_for(self, source: Optional[NemoSource]) -> HmacKeyring:
+        """The keyring that verifies messages from ``source`` (the server's own for the default source)"""
+        return source.keyring if source is not None and source.keyring is not None else self.keyring
+    
+    def update_admin_subscription(self, source: NemoSource):
+        """Subscribe a source to the admin topics only while it has an HMAC key to verify them with"""
+        client = source.client
+        if client is None or not client.is_connected():
+            return
+        if self.keyring_for(source).enabled:
+            client.subscribe([(topic, 1) for topic in ADMIN_TOPICS])
+        else:
+            client.unsubscribe(list(ADMIN_TOPICS))
+            logger.info(f"🔒 Admin topics not subscribed for source {source.name} (no HMAC key); use SIGUSR1/SIGUSR2")
     
     def on_mqtt_connect_esp32(self, client, userdata, flags, rc):
         """MQTT connection callback for ESP32 client (port 1883)"""
@@ -215,13 +678,21 @@ class NEMOToolServer:
             logger.info("✅ ESP32 MQTT client connected successfully")
             # Publish server online status
             client.publish("nemo/server/status", "online", qos=1, retain=True)
+            client.subscribe([(PRESENCE_FILTER, 1), (HEARTBEAT_FILTER, 0)])
+            self.publisher.on_connect()
             logger.info("📤 Ready to publish to ESP32 displays")
+            # After a reconnect the broker may have lost retained state (restart without persistence)
+            if self._esp32_connected_once:
+                with self._state_lock:
+                    topics = list(self.esp32_state)
+                self.resync.trigger(topics, self.esp32_state.get, reason="ESP32 broker reconnect")
+            self._esp32_connected_once = True
         else:
             logger.error(f"❌ ESP32 MQTT connection failed with code {rc}")
     
     def on_mqtt_disconnect_nemo(self, client, userdata, rc):
         """MQTT disconnection callback for NEMO client with auto-reconnect"""
-        logger.warning(f"⚠️  NEMO MQTT client disconnected with code {rc}")
+        logger.warning(f"⚠️  NEMO MQTT client disconnected with code {rc} (source {userdata.name})")
         
         # Auto-reconnect if not intentionally disconnected
         if rc != 0 and self.running:
@@ -255,9 +726,134 @@ class NEMOToolServer:
                     except Exception as e2:
                         logger.error(f"❌ ESP32 client second reconnection attempt failed: {e2}")
     
+    def publish_to_esp32(self, topic: str, payload_json: str) -> bool:
+        """Record topic state for resync and publish it (retained, QoS 1) to the ESP32 broker.
+        Both happen under the state lock so a concurrent resync cannot publish an older copy after it
+        """
+        self.fleet.record_delivery(topic, payload_json)
+        with self._state_lock:
+            self.esp32_state[topic] = payload_json
+            return self.publisher.publish(topic, payload_json, qos=1, retain=True)
+    
+    def publish_suppressed(self, tool_id, esp32_event: str, reason: str):
+        """Tell observers an event was handled without a status publish (best effort, never queued)"""
+        client = self.mqtt_client_esp32
+        if client is None or not client.is_connected():
+            return
+        try:
+            client.publish(SUPPRESSED_TOPIC.format(tool_id=tool_id),
+                           codec.dumps({"event_type": esp32_event, "reason": reason}), qos=0)
+        except Exception as e:
+            logger.debug(f"Suppressed marker for tool {tool_id} not published: {e}")
+    
+    def on_display_message(self, client, userdata, msg):
+        """Display presence (retained, LWT) and heartbeats from the ESP32 broker"""
+        client_id = display_client_id(msg.topic)
+        if client_id is None:
+            return
+        if msg.topic.endswith("/presence"):
+            came_online = self.fleet.on_presence(client_id, msg.payload)
+            record = self.fleet.get(client_id)
+            logger.info(f"📟 Display {client_id} (tool {record.tool_id}) {'online' if record.online else 'offline'}"
+                        f"{' (retained)' if msg.retain else ''}")
+        else:
+            came_online = self.fleet.on_heartbeat(client_id, msg.payload)
+            record = self.fleet.get(client_id)
+            # A display reporting an older state than the one it was sent gets it again
+            # (at most once per stale period, so a display that cannot apply it is not flooded)
+            now = time.time()
+            if (not came_online and record.in_sync() is False
+                    and now - record.delivered_at > DISPLAY_SYNC_GRACE_SECONDS
+                    and now - record.resynced_at > self.fleet.stale_after):
+                logger.warning(f"📟 Display {client_id} reports {record.applied}, expected {record.delivered}")
+                self.resync_display(client_id, "out of sync")
+                return
+        # Retained presence is the broker replaying history on (re)subscribe, not a reconnect
+        if came_online and not msg.retain and self.config['display_resync_on_reconnect']:
+            self.resync_display(client_id, "reconnected")
+    
+    def resync_display(self, client_id: str, reason: str) -> int:
+        """Republish one display's status (and the overall status) instead of the whole fleet's"""
+        record = self.fleet.get(client_id)
+        if record is None or record.tool_id is None:
+            return 0
+        with self._state_lock:
+            topics = [(t, self.esp32_state[t]) for t in (record.status_topic, "nemo/esp32/overall") if t in self.esp32_state]
+            for topic, payload in topics:
+                self.fleet.record_delivery(topic, payload)
+                self.publisher.publish(topic, payload, qos=1, retain=True)
+        record.resynced_at = time.time()
+        logger.info(f"🔁 Display {client_id} {reason}: republished {len(topics)} topic(s) for tool {record.tool_id}")
+        return len(topics)
+    
+    def replay_history(self):
+        """Rebuild utilization counters and per-tool ordering state from the event history (startup only)"""
+        started = time.perf_counter()
+        since = time.time() - UTILIZATION_DAYS * 86400
+        count = 0
+        for event in self.history.iter_events(since=since):
+            self.utilization.on_event(event.tool_id, event.event, event.event_time, now=event.recorded_at)
+            self.order_guard.check(event.tool_id, event.event, event.event_time, event.usage_id)
+            count += 1
+        if count:
+            logger.info(f"📊 Replayed {count} events for {len(self.utilization.tools)} tools "
+                        f"from history in {(time.perf_counter() - started) * 1000:.0f} ms")
+    
+    def rebuild_utilization(self, utc_offset_hours: int):
+        """Rebucket utilization for a new display timezone (config reload).
+        Replayed from the history when one is kept; otherwise counting starts over."""
+        tracker = UtilizationTracker(utc_offset_hours)
+        if self.history:
+            for event in self.history.iter_events(since=time.time() - UTILIZATION_DAYS * 86400):
+                tracker.on_event(event.tool_id, event.event, event.event_time, now=event.recorded_at)
+        else:
+            logger.warning("⚠️ Timezone changed without HISTORY_DIR: utilization counters start over")
+        # Single reference swap; process_tool_status reads self.utilization once per event
+        self.utilization = tracker
+        logger.info(f"📊 Utilization rebucketed for UTC{utc_offset_hours:+d} ({len(tracker.tools)} tools)")
+    
+    def publish_utilization(self) -> int:
+        """Publish the utilization summary and one report per tool (retained, QoS 0)"""
+        now = time.time()
+        reports = self.utilization.reports(now)
+        for report in reports:
+            self.publisher.publish(UTILIZATION_TOOL_TOPIC.format(tool_id=report['tool_id']),
+                                   codec.dumps(report), qos=0, retain=True)
+        self.publisher.publish(UTILIZATION_TOPIC, codec.dumps(self.utilization.summary_report(now)), qos=0, retain=True)
+        return len(reports)
+    
+    async def utilization_publish(self):
+        """Publish utilization reports every UTILIZATION_PUBLISH_SECONDS"""
+        last = time.monotonic()
+        while self.running:
+            await asyncio.sleep(1)
+            interval = self.config['utilization_publish_seconds']
+            if not interval or time.monotonic() - last < interval:
+                continue
+            last = time.monotonic()
+            try:
+                count = self.publish_utilization()
+                logger.debug(f"📊 Published utilization for {count} tools")
+            except Exception as e:
+                logger.error(f"Error publishing utilization: {e}")
+    
+    async def fleet_watch(self):
+        """Follow broker connect/disconnect lines and mark silent displays offline"""
+        while self.running:
+            await asyncio.sleep(1)
+            try:
+                if self.broker_log is not None:
+                    for event in self.broker_log.poll():
+                        self.fleet.on_broker_event(event)
+                for client_id in self.fleet.expire():
+                    logger.warning(f"📟 Display {client_id} silent for {self.fleet.stale_after:g}s, marked offline")
+            except Exception as e:
+                logger.error(f"Error in fleet watch: {e}")
+    
     def on_mqtt_publish(self, client, userdata, mid):
         """MQTT publish callback"""
         logger.debug(f"Message published with mid: {mid}")
+        self.publisher.on_publish(mid)
     
     def get_mqtt_error_description(self, rc):
         """Get human-readable description of MQTT error codes"""
@@ -296,8 +892,8 @@ class NEMOToolServer:
                 esp32_state = self.mqtt_client_esp32._state if self.mqtt_client_esp32 else "None"
                 
                 # Check if ports are actually listening
-                esp32_port = get_esp32_port()
-                nemo_port = get_nemo_port()
+                esp32_port = self.config.get('mqtt_port_esp32') or get_esp32_port()
+                nemo_port = self.config.get('mqtt_port_nemo') or get_nemo_port()
                 port_1883_listening = self.check_port_listening(esp32_port)
                 port_1886_listening = self.check_port_listening(nemo_port)
                 
@@ -320,7 +916,39 @@ class NEMOToolServer:
                         self.mqtt_client_esp32.reconnect()
                     except Exception as e:
                         logger.error(f"❌ Manual ESP32 reconnection failed: {e}")
-                        
+                
+                # Report ingest shedding since the last check
+                shed_total = self.admission.shed_total()
+                if shed_total != self._last_shed_total:
+                    self._last_shed_total = shed_total
+                    logger.warning(f"⚠️ Ingest load shedding: {self.admission.snapshot()}")
+                
+                dropped = self.order_guard.dropped()
+                if dropped != self._last_order_dropped:
+                    self._last_order_dropped = dropped
+                    logger.warning(f"⚠️ Out-of-order/duplicate events dropped: {self.order_guard.snapshot()}, "
+                                   f"{self._unchanged_publishes} unchanged not republished")
+                
+                outbound = self.publisher.snapshot()
+                if outbound['retry_queue'] or outbound['spool']:
+                    logger.warning(f"⚠️ Outbound backlog: {outbound}")
+                
+                fleet = self.fleet.snapshot()
+                if fleet['known'] and (fleet['online'] < fleet['known'] or fleet['out_of_sync']):
+                    logger.warning(f"📟 Fleet: {self.fleet.summary()}")
+
+                # Extra NEMO sources reconnect on their own (loop_start); report when one is down
+                # and log per-source throughput/lag every SOURCE_REPORT_INTERVAL seconds
+                if len(self.sources) > 1:
+                    for source in self.sources[1:]:
+                        if source.client and not source.client.is_connected():
+                            logger.warning(f"⚠️ NEMO source {source.name} ({source.broker}:{source.port}) disconnected")
+                    now = time.monotonic()
+                    if now - self._last_source_report >= SOURCE_REPORT_INTERVAL:
+                        self._last_source_report = now
+                        for source in self.sources:
+                            logger.info(f"📥 Source {source.summary()}")
+
             except Exception as e:
                 logger.error(f"Error in connection monitor: {e}")
     
@@ -412,14 +1040,15 @@ class NEMOToolServer:
             i += 1
         return None
 
-    def _unwrap_and_verify_hmac(self, raw_payload: str, topic: str) -> Tuple[bool, Optional[dict]]:
+    def _unwrap_and_verify_hmac(self, raw_payload: str, topic: str, trace=NULL_TRACE,
+                                keyring: Optional[HmacKeyring] = None) -> Tuple[bool, Optional[dict]]:
         """Verify NEMO envelope: {"payload": "<signed string>", "hmac": "<hex>", "algo": "sha256"}.
         HMAC is computed over the payload string as decoded from the envelope (same value NEMO signs).
         Returns (True, parsed_payload) or (False, None).
         """
         try:
-            data = json.loads(raw_payload)
-        except (json.JSONDecodeError, UnicodeDecodeError):
+            data = codec.loads(raw_payload)
+        except ValueError:
             logger.warning(f"[HMAC] Rejected (invalid JSON) topic={topic}")
             return False, None
 
@@ -439,35 +1068,50 @@ class NEMOToolServer:
             logger.warning(f"[HMAC] Rejected (payload must be string) topic={topic}")
             return False, None
 
-        # Key = shared secret as UTF-8 (exact value from config)
-        key_bytes = self.config["mqtt_hmac_key"].strip().encode("utf-8")
-        # Message = payload string as decoded by JSON (same bytes NEMO signs before envelope serialization)
-        message_bytes = payload_str.encode("utf-8")
+        # Optional key-id hint ("kid") selects one key instead of trying each accepted key
+        kid = data.get("kid")
+        kid = kid if isinstance(kid, str) and kid else None
 
         # digestmod must be a name or constructor, not an instance
         if algo not in hashlib.algorithms_available:
             logger.warning(f"[HMAC] Rejected (unsupported algo={algo}) topic={topic}")
             return False, None
 
-        expected = hmac_lib.new(key_bytes, message_bytes, digestmod=algo).hexdigest()
-        if not hmac_lib.compare_digest(expected, msg_hmac_hex.strip().lower()):
+        trace.mark("envelope")
+        # Key = shared secret as UTF-8; message = payload string as decoded by JSON
+        # (same bytes NEMO signs before envelope serialization)
+        if keyring is None:
+            keyring = self.keyring
+        signer = keyring.verify(payload_str, msg_hmac_hex, algo, kid)
+        trace.mark("hmac")
+        if signer is None:
             logger.warning(f"[HMAC] Rejected (bad signature) topic={topic}")
             # Debug: log what we hashed so it can be compared with NEMO's signer (e.g. payload serialization or topic inclusion)
             if logger.isEnabledFor(logging.DEBUG):
                 logger.debug(
-                    f"[HMAC] expected={expected} received={msg_hmac_hex.strip().lower()} "
+                    f"[HMAC] kid={kid} accepted_keys=[{keyring.describe()}] received={msg_hmac_hex.strip().lower()} "
                     f"payload_len={len(payload_str)} payload_preview={repr(payload_str[:200])!s}"
                 )
             return False, None
+        if signer != keyring.current_id and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"[HMAC] Accepted with non-current key {signer} topic={topic}")
 
         # Parse the payload string as JSON for downstream; if not JSON, return None
-        try:
-            parsed = json.loads(payload_str)
-        except (json.JSONDecodeError, UnicodeDecodeError):
-            parsed = None
+        parsed = self._parse_nemo_payload(topic, payload_str)
         payload = parsed if isinstance(parsed, dict) else ({"value": parsed} if parsed is not None else None)
+        trace.mark("parse")
         return True, payload
 
+    @staticmethod
+    def _parse_nemo_payload(topic: str, payload_str: str):
+        """Tool events against the typed schema (with msgspec), anything else as plain JSON; None if not JSON"""
+        try:
+            if topic.startswith("nemo/tools/") and topic != "nemo/tools/overall":
+                return codec.loads_tool_event(payload_str)
+            return codec.loads(payload_str)
+        except ValueError:
+            return None
+
     def _is_hmac_envelope(self, data: dict) -> bool:
         """Return True iff data is the required HMAC envelope shape: payload, hmac, algo (all present and correct types)."""
         if not isinstance(data, dict):
@@ -484,45 +1128,77 @@ class NEMOToolServer:
         )
 
     def on_mqtt_message(self, client, userdata, msg):
+        """Hand incoming NEMO messages to admission control (runs on the paho network thread).
+        Processing happens on the admission worker via handle_nemo_message.
+        """
+        userdata.record_received(len(msg.payload))
+        self.admission.offer(msg.topic, msg.payload, userdata)
+
+    @staticmethod
+    def _record_shed(source: Optional[NemoSource]):
+        if source is not None:
+            source.record_shed()
+
+    def handle_nemo_message(self, topic: str, payload_bytes: bytes, source: Optional[NemoSource] = None,
+                            received_at: Optional[float] = None):
         """Handle incoming MQTT messages from NEMO backend.
         When MQTT_HMAC_KEY is set, every message from NEMO (all nemo/tools/... topics including
         nemo/tools/+/enabled and nemo/tools/+/disabled) must pass the same HMAC verification
         before any processing; no topic is exempt.
         For nemo/tools/... when HMAC is required, the payload must be the envelope
         (payload, hmac, algo); unsigned or malformed messages are rejected.
+        Each source is verified with its own keyring and its tool ids are moved by its offset.
         """
-        topic = msg.topic
-        raw_payload = msg.payload.decode(errors="replace")
+        trace = self.tracer.begin(topic)
+        try:
+            accepted = self._handle_nemo_message(topic, payload_bytes, trace, source)
+        finally:
+            trace.finish()
+        if source is not None:
+            if accepted:
+                source.record_processed(received_at)
+            else:
+                source.record_rejected()
+
+    def _handle_nemo_message(self, topic: str, payload_bytes: bytes, trace, source: Optional[NemoSource]) -> bool:
+        """Returns False when the message was rejected (HMAC/envelope)"""
+        raw_payload = payload_bytes.decode(errors="replace")
+        trace.mark("decode")
 
         # For testing: show raw value received from NEMO
         raw_preview = raw_payload if len(raw_payload) <= 500 else raw_payload[:500] + "..."
         logger.info(f"📥 raw from NEMO  {topic} | {raw_preview}")
+        trace.mark("log")
 
-        hmac_key = (self.config.get("mqtt_hmac_key") or "").strip()
+        keyring = self.keyring_for(source)
+        hmac_required = keyring.enabled
+
+        if topic in ADMIN_TOPICS and not hmac_required:
+            logger.warning(f"[HMAC] Rejected (admin topics require an HMAC key) topic={topic}")
+            return False
 
         # For nemo/tools/... when HMAC is required, enforce envelope contract: reject if not envelope-shaped.
-        if topic.startswith("nemo/tools/") and hmac_key:
+        if topic.startswith("nemo/tools/") and hmac_required:
             try:
-                data = json.loads(raw_payload)
-            except (json.JSONDecodeError, UnicodeDecodeError):
+                data = codec.loads(raw_payload)
+            except ValueError:
                 logger.warning(f"[HMAC] Rejected (nemo/tools/... requires HMAC envelope; invalid JSON) topic={topic}")
-                return
+                return False
             if not self._is_hmac_envelope(data):
                 logger.warning(
                     f"[HMAC] Rejected (nemo/tools/... requires HMAC envelope: payload, hmac, algo) topic={topic}"
                 )
-                return
+                return False
+            # Timed as part of the "envelope" stage that _unwrap_and_verify_hmac records
 
         # Single HMAC gate for all NEMO messages when key is set (enabled, disabled, start, end, overall).
-        if hmac_key:
-            unwrapped, payload = self._unwrap_and_verify_hmac(raw_payload, topic)
+        if hmac_required:
+            unwrapped, payload = self._unwrap_and_verify_hmac(raw_payload, topic, trace, keyring)
             if not unwrapped:
-                return  # reject and already logged
+                return False  # reject and already logged
         else:
-            try:
-                payload = json.loads(raw_payload)
-            except (json.JSONDecodeError, UnicodeDecodeError):
-                payload = None
+            payload = self._parse_nemo_payload(topic, raw_payload)
+            trace.mark("parse")
 
         try:
             # Handle individual tool status updates
@@ -547,20 +1223,36 @@ class NEMOToolServer:
                     except (ValueError, TypeError):
                         pass
                 tool_data.setdefault("tool_name", tool_identifier)
-                tool_data.setdefault("timestamp", datetime.utcnow().isoformat() + "+00:00")
+                if source is not None:
+                    source.record_event_age(event_age_seconds(tool_data, event_type))
+                    if source.tool_id_offset:
+                        # Keep each NEMO instance's tool ids apart on the shared ESP32 topics
+                        tool_data["tool_id"] = source.map_tool_id(tool_data.get("tool_id", tool_identifier))
+                        tool_identifier = str(tool_data["tool_id"])
 
+                trace.mark("normalize")
                 if isinstance(payload, dict):
-                    logger.info(f"📥 inbound  {topic} | {json.dumps(payload)}")
+                    logger.info(f"📥 inbound  {topic} | {codec.dumps(payload)}")
                 else:
                     logger.info(
                         f"📥 inbound  {topic} | {raw_payload[:200]}{'...' if len(raw_payload) > 200 else ''}"
                     )
-                self.process_tool_status(tool_identifier, tool_data, event_type)
+                trace.mark("log")
+                self.process_tool_status(tool_identifier, tool_data, event_type, trace)
 
             # Handle overall status updates
             elif topic == "nemo/tools/overall":
-                logger.info(f"📥 inbound  {topic} | {json.dumps(payload)}")
-                self.process_overall_status(payload)
+                if source is not None and not source.is_default and isinstance(payload, dict):
+                    payload = dict(payload, source=source.name)
+                logger.info(f"📥 inbound  {topic} | {codec.dumps(payload)}")
+                trace.mark("log")
+                self.process_overall_status(payload, trace)
+
+            elif topic == ADMIN_PROFILE_TOPIC:
+                self.handle_admin_profile(payload)
+
+            elif topic == ADMIN_TRACE_TOPIC:
+                self.request_trace_dump()
 
             else:
                 if payload is None:
@@ -571,14 +1263,16 @@ class NEMOToolServer:
                     logger.debug(f"[1886] Other topic: {topic} -> {payload}")
         except Exception as e:
             logger.error(f"Error processing MQTT message: {e}")
+        return True
     
-    def process_tool_status(self, tool_identifier: str, tool_data: dict, event_type: str = None):
+    def process_tool_status(self, tool_identifier: str, tool_data: dict, event_type: str = None, trace=NULL_TRACE):
         """Process individual tool status update and forward to ESP32 displays.
         
         NEMO sends separate events: enabled/disabled (tool on/off) and start/end (usage session).
         We forward start/end/enabled/disabled and map to a consistent vocabulary:
         active (in use), enabled (available), disabled (tool off).
         """
+        config = self.config  # one consistent config for the whole message, even across a reload
         try:
             # Parse NEMO message format:
             # {"event": "tool_usage_start", "usage_id": 232, "user_id": 1, 
@@ -610,10 +1304,10 @@ class NEMOToolServer:
                 user_display_name = full_user_name.split('(')[0].strip()
             
             # Trim to max length if needed
-            if len(user_display_name) > self.config['max_name_length']:
+            if len(user_display_name) > config['max_name_length']:
                 # Try first name only
                 first_name = user_display_name.split()[0] if ' ' in user_display_name else user_display_name
-                user_display_name = first_name[:self.config['max_name_length']]
+                user_display_name = first_name[:config['max_name_length']]
                 logger.debug(f"Name too long, trimmed to: '{user_display_name}'")
             
             # If NEMO doesn't include a user_name on state-only events, prefer the last known user.
@@ -622,9 +1316,6 @@ class NEMOToolServer:
 
             # Map NEMO event types to a consistent vocabulary.
             # start = someone using tool -> active; end/enabled/idle = tool available -> enabled; disabled = tool off
-            ESP32_ACTIVE = "active"
-            ESP32_ENABLED = "enabled"
-            ESP32_DISABLED = "disabled"
             if event_type == "start":
                 esp32_event = ESP32_ACTIVE
             elif event_type in ("end", "enabled", "idle"):
@@ -644,63 +1335,89 @@ class NEMOToolServer:
             elif event_type in ("enabled", "disabled", "idle"):
                 timestamp_candidates = ["timestamp", "enabled_at", "disabled_at", "updated_at"]
             timestamp_value = None
+            event_time = None
             for key in timestamp_candidates:
                 if tool_data.get(key):
                     timestamp_value = tool_data.get(key)
                     break
+            # No time from NEMO: the display shows the arrival time, but the event is ordered and
+            # recorded without one, since the VM's clock is not comparable with NEMO's timestamps
+            nemo_timestamp = bool(timestamp_value)
+            if not nemo_timestamp:
+                timestamp_value = datetime.utcnow().isoformat() + "+00:00"
             
-            if timestamp_value:
-                try:
-                    from datetime import datetime, timedelta
-                    dt = datetime.fromisoformat(timestamp_value.replace("Z", "+00:00"))
-                    dt = dt + timedelta(hours=self.config["timezone_offset_hours"])
-                    formatted_time = dt.strftime("%b %d, %I:%M %p")
-                    logger.debug(f"Parsed timestamp: {timestamp_value} -> {formatted_time}")
-                except Exception as e:
-                    logger.warning(f"Failed to parse timestamp '{timestamp_value}': {e}")
-                    formatted_time = "Invalid Time"
+            try:
+                dt = datetime.fromisoformat(timestamp_value.replace("Z", "+00:00"))
+                if nemo_timestamp:
+                    event_time = dt.timestamp()
+                dt = dt + timedelta(hours=config["timezone_offset_hours"])
+                formatted_time = dt.strftime("%b %d, %I:%M %p")
+                logger.debug(f"Parsed timestamp: {timestamp_value} -> {formatted_time}")
+            except Exception as e:
+                logger.warning(f"Failed to parse timestamp '{timestamp_value}': {e}")
+                formatted_time = "Invalid Time"
+            
+            # Drop events older than the tool's current state (before they touch last_users)
+            verdict = self.order_guard.check(tool_id, event_type, event_time, tool_data.get('usage_id'))
+            if verdict != ORDER_APPLY:
+                logger.info(f"⏭️ {tool_name} (ID: {tool_id}): dropped {event_type} ({verdict.replace('_', ' ')})")
+                self.publish_suppressed(tool_id, esp32_event, verdict)
+                return
             
-            # User labels: active = "User", idle/disabled = "Last User"
             if user_display_name:
                 self.last_users[str(tool_id)] = user_display_name
-            user_label = "User" if esp32_event == ESP32_ACTIVE else "Last User"
-            time_label = "Enabled Since" if esp32_event != ESP32_DISABLED else "Disabled Since"
-            
-            # Create minimal message for ESP32 - only fields the display uses (config.h: active/idle/disabled)
-            esp32_message = {
-                "event_type": esp32_event,
-                "in_use": esp32_event == ESP32_ACTIVE,
-                "timestamp": formatted_time,
-                "time_label": time_label,
-                "user_label": user_label,
-                "user_name": user_display_name,
-                "tool_name": tool_name,
-            }
+            trace.mark("normalize")
             
-            esp32_topic = f"nemo/esp32/{tool_id}/status"
-            payload_json = json.dumps(esp32_message)
-            logger.info(f"📤 outbound {esp32_topic} | {payload_json}")
-            result = self.mqtt_client_esp32.publish(esp32_topic, payload_json, qos=1, retain=True)
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                logger.info(f"✅ {tool_name} (ID: {tool_id}): {esp32_event} → ESP32")
+            # Minimal message for ESP32 - only fields the display uses (config.h: active/idle/disabled);
+            # labels, tool name and topic come pre-serialized from the tool's template
+            esp32_topic, payload_json = self.status_templates.render(
+                tool_id, tool_name, esp32_event, formatted_time, user_display_name)
+            trace.mark("serialize")
+            with self._state_lock:
+                unchanged = self.esp32_state.get(esp32_topic) == payload_json
+            if unchanged:
+                # Same retained payload (e.g. end followed by enabled): nothing for displays to redraw
+                self._unchanged_publishes += 1
+                logger.info(f"✅ {tool_name} (ID: {tool_id}): {esp32_event} unchanged, not republished")
+                self.publish_suppressed(tool_id, esp32_event, "unchanged")
+                trace.mark("log")
             else:
-                logger.error(f"❌ Failed to forward tool {tool_id} status: {result.rc} ({self.get_mqtt_error_description(result.rc)})")
+                logger.info(f"📤 outbound {esp32_topic} | {payload_json}")
+                trace.mark("log")
+                published = self.publish_to_esp32(esp32_topic, payload_json)
+                trace.mark("publish")
+                if published:
+                    logger.info(f"✅ {tool_name} (ID: {tool_id}): {esp32_event} → ESP32")
+                else:
+                    logger.warning(f"⏳ {tool_name} (ID: {tool_id}): {esp32_event} queued for retry")
+                trace.mark("log")
+            if self.history:
+                self.history.append(
+                    tool_id, event_type, event_time=event_time, usage_id=tool_data.get('usage_id'),
+                    user_id=tool_data.get('user_id'), user_name=full_user_name, tool_name=tool_name,
+                )
+                trace.mark("history")
+            self.utilization.on_event(tool_id, event_type, event_time)
                 
         except Exception as e:
             logger.error(f"Error processing tool status for {tool_identifier}: {e}")
     
-    def process_overall_status(self, overall_data: dict):
+    def process_overall_status(self, overall_data: dict, trace=NULL_TRACE):
         """Process overall status update and forward to ESP32 displays"""
         try:
             # Forward to ESP32 displays using ESP32 client (port 1883)
             esp32_topic = "nemo/esp32/overall"
-            payload_json = json.dumps(overall_data)
+            payload_json = codec.dumps(overall_data)
+            trace.mark("serialize")
             logger.info(f"📤 outbound {esp32_topic} | {payload_json}")
-            result = self.mqtt_client_esp32.publish(esp32_topic, payload_json, qos=1, retain=True)
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            trace.mark("log")
+            published = self.publish_to_esp32(esp32_topic, payload_json)
+            trace.mark("publish")
+            if published:
                 logger.info("✅ overall → ESP32")
             else:
-                logger.warning(f"Failed to forward overall status: {result.rc}")
+                logger.warning("⏳ overall status queued for retry")
+            trace.mark("log")
                 
         except Exception as e:
             logger.error(f"Error processing overall status: {e}")
@@ -718,9 +1435,27 @@ class NEMOToolServer:
             # Start connection status monitor
             asyncio.create_task(self.connection_status_monitor())
             
+            # Hot config reload (SIGHUP and optional config.env watch)
+            asyncio.create_task(self.config_watch())
+            
+            # Display presence from broker log lines and heartbeat timeouts
+            asyncio.create_task(self.fleet_watch())
+            
+            # Periodic per-tool utilization reports
+            asyncio.create_task(self.utilization_publish())
+            
             # Keep the server running
             while self.running:
                 await asyncio.sleep(1)
+                if self.profile_requested:
+                    self.profile_requested = False
+                    self.profiler.start(self.config['profile_default_seconds'], reason="SIGUSR1")
+                if self.trace_dump_requested:
+                    self.trace_dump_requested = False
+                    try:
+                        self.tracer.dump()
+                    except OSError as e:
+                        logger.error(f"❌ Could not write trace to {self.tracer.output_dir}: {e}")
                 
         except KeyboardInterrupt:
             logger.info("Received shutdown signal")
@@ -734,9 +1469,17 @@ class NEMOToolServer:
         """Cleanup resources"""
         logger.info("Cleaning up resources")
         
-        if self.mqtt_client_nemo:
-            self.mqtt_client_nemo.loop_stop()
-            self.mqtt_client_nemo.disconnect()
+        self.admission.stop()
+        self.resync.cancel()
+        self.publisher.stop()
+        self.profiler.stop()
+        if self.history:
+            self.history.close()
+        
+        for source in self.sources:
+            if source.client:
+                source.client.loop_stop()
+                source.client.disconnect()
         
         if self.mqtt_client_esp32:
             self.mqtt_client_esp32.loop_stop()
@@ -759,6 +1502,12 @@ def validate_environment():
 
 async def main():
     """Main entry point"""
+    try:
+        config = get_config()
+    except Exception as e:
+        print(f"Configuration error: {e}")
+        sys.exit(1)
+    setup_logging(config['log_level'])
     logger.info("NEMO Tool Display Server - Starting up")
 
     # Validate environment before starting
@@ -767,9 +1516,9 @@ async def main():
         sys.exit(1)
 
     # Display MQTT config for verification during debugging
-    print_mqtt_config_for_debug()
+    print_mqtt_config_for_debug(config)
     
-    server = NEMOToolServer()
+    server = NEMOToolServer(config)
 
     def _request_shutdown(*_args):
         logger.info("Shutdown requested (Ctrl+C or SIGTERM)")
@@ -778,6 +1527,12 @@ async def main():
     try:
         signal.signal(signal.SIGINT, _request_shutdown)
         signal.signal(signal.SIGTERM, _request_shutdown)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, lambda *_args: server.request_reload())
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda *_args: server.request_profile())
+        if hasattr(signal, 'SIGUSR2'):
+            signal.signal(signal.SIGUSR2, lambda *_args: server.request_trace_dump())
     except ValueError:
         # signal.signal can fail if not in main thread (e.g. some IDEs)
         pass
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Streaming metric primitives for the NEMO Tool Display VM server and tools
+Fixed-memory rate windows and histograms that update in O(1), shared by the
+per-source server metrics, the monitor and the load generator
+"""
+
+from typing import Tuple
+
+
+class SlidingWindow:
+    """Per-second ring buffer of message and byte counts covering the last ``span`` seconds.
+
+    ``add`` is O(1). Window queries only look at completed seconds, so a 1 s rate is
+    the previous full second rather than the partial current one.
+    """
+
+    __slots__ = ("span", "_epoch", "_msgs", "_bytes")
+
+    def __init__(self, span: int = 60):
+        self.span = span
+        self._epoch = [-1] * span
+        self._msgs = [0] * span
+        self._bytes = [0] * span
+
+    def add(self, size: int, now: float):
+        second = int(now)
+        slot = second % self.span
+        if self._epoch[slot] != second:
+            self._epoch[slot] = second
+            self._msgs[slot] = 0
+            self._bytes[slot] = 0
+        self._msgs[slot] += 1
+        self._bytes[slot] += size
+
+    def totals(self, window: int, now: float) -> Tuple[int, int]:
+        """(messages, bytes) in the last ``window`` completed seconds"""
+        current = int(now)
+        oldest = current - min(window, self.span - 1)
+        msgs = nbytes = 0
+        for slot in range(self.span):
+            if oldest <= self._epoch[slot] < current:
+                msgs += self._msgs[slot]
+                nbytes += self._bytes[slot]
+        return msgs, nbytes
+
+    def peak(self, window: int, now: float) -> int:
+        """Highest per-second message count in the last ``window`` completed seconds"""
+        current = int(now)
+        oldest = current - min(window, self.span - 1)
+        return max(
+            (self._msgs[slot] for slot in range(self.span) if oldest <= self._epoch[slot] < current),
+            default=0,
+        )
+
+
+class LogHistogram:
+    """Fixed-size log-linear histogram for non-negative integers (e.g. payload sizes).
+
+    Values are bucketed by power of two with ``SUB`` linear sub-buckets each, so any
+    reported percentile is within ~1/SUB (12.5%) of the true value. O(1) updates.
+    """
+
+    SUB_BITS = 3
+    SUB = 1 << SUB_BITS
+    MAX_BITS = 32
+
+    __slots__ = ("counts", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * ((self.MAX_BITS + 1) * self.SUB)
+        self.total = 0
+        self.max = 0
+
+    @classmethod
+    def _index(cls, value: int) -> int:
+        if value < cls.SUB:
+            return value
+        bits = value.bit_length()
+        if bits > cls.MAX_BITS:
+            return (cls.MAX_BITS + 1) * cls.SUB - 1
+        shift = bits - cls.SUB_BITS - 1
+        return (shift + 1) * cls.SUB + ((value >> shift) - cls.SUB)
+
+    @classmethod
+    def _upper(cls, index: int) -> int:
+        """Largest value that maps to ``index``"""
+        if index < cls.SUB:
+            return index
+        shift = index // cls.SUB - 1
+        return ((cls.SUB + index % cls.SUB + 1) << shift) - 1
+
+    def add(self, value: int):
+        self.counts[self._index(value)] += 1
+        self.total += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p: float) -> int:
+        """Upper bound of the bucket holding the ``p``-th percentile (0 when empty)"""
+        if self.total == 0:
+            return 0
+        rank = max(1, int(round(self.total * p / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self._upper(index), self.max)
+        return self.max
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Broker health for the MQTT monitor from mosquitto's $SYS topics
+The broker pushes these every sys_interval seconds (10 s by default), so reading
+status is a dictionary lookup instead of forking pgrep/lsof on each refresh
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+SYS_FILTER = "$SYS/broker/#"
+
+# $SYS topic -> field name shown by the monitor
+SYS_FIELDS = {
+    "$SYS/broker/version": "version",
+    "$SYS/broker/uptime": "uptime_s",
+    "$SYS/broker/clients/connected": "clients_connected",
+    "$SYS/broker/clients/total": "clients_total",
+    "$SYS/broker/load/messages/received/1min": "msgs_received_per_min",
+    "$SYS/broker/load/messages/sent/1min": "msgs_sent_per_min",
+    "$SYS/broker/heap/current": "heap_bytes",
+    "$SYS/broker/retained messages/count": "retained_count",
+    "$SYS/broker/store/messages/count": "stored_count",
+    "$SYS/broker/subscriptions/count": "subscriptions",
+}
+
+# Without an update for this long the cached values are reported as stale
+STALE_AFTER_SECONDS = 35
+
+
+def _parse_value(field: str, text: str):
+    if field == "version":
+        return text
+    if field == "uptime_s":
+        # "12345 seconds"
+        text = text.split()[0] if text else text
+    try:
+        number = float(text)
+    except ValueError:
+        return text
+    return int(number) if number.is_integer() else number
+
+
+class BrokerStatus:
+    """Cached broker metrics pushed via $SYS, with restart detection from uptime resets"""
+
+    def __init__(self, on_restart: Optional[Callable[[int, int], None]] = None):
+        self.values = {}
+        self.updated_at = None
+        self.restarts = 0
+        self.on_restart = on_restart
+        self._lock = threading.Lock()
+
+    def update(self, topic: str, payload: bytes) -> bool:
+        """Apply one $SYS message; returns False for topics that are not tracked"""
+        field = SYS_FIELDS.get(topic)
+        if field is None:
+            return False
+        value = _parse_value(field, payload.decode("utf-8", errors="replace").strip())
+        restarted = None
+        with self._lock:
+            if field == "uptime_s" and isinstance(value, int):
+                previous = self.values.get("uptime_s")
+                if isinstance(previous, int) and value < previous:
+                    self.restarts += 1
+                    restarted = (previous, value)
+            self.values[field] = value
+            self.updated_at = time.monotonic()
+        if restarted and self.on_restart:
+            self.on_restart(*restarted)
+        return True
+
+    def stale(self) -> bool:
+        return self.updated_at is None or time.monotonic() - self.updated_at > STALE_AFTER_SECONDS
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snap = dict(self.values)
+            snap["restarts_detected"] = self.restarts
+            snap["age_s"] = None if self.updated_at is None else round(time.monotonic() - self.updated_at, 1)
+        return snap
+
+    def summary(self) -> str:
+        """One-line status for dashboards"""
+        if self.updated_at is None:
+            return "waiting for $SYS data"
+        s = self.snapshot()
+        parts = [
+            f"up {s.get('uptime_s', '?')}s",
+            f"clients {s.get('clients_connected', '?')}",
+            f"rx {s.get('msgs_received_per_min', '?')}/min",
+            f"tx {s.get('msgs_sent_per_min', '?')}/min",
+            f"retained {s.get('retained_count', '?')}",
+        ]
+        if "heap_bytes" in s:
+            parts.append(f"heap {s['heap_bytes']}B")
+        if s["restarts_detected"]:
+            parts.append(f"restarts {s['restarts_detected']}")
+        if self.stale():
+            parts.append("STALE")
+        return " | ".join(parts)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+NEMO -> ESP32 forwarding latency probe for the MQTT monitor
+Matches each inbound nemo/tools/<id>/<event> seen on the NEMO port to the
+nemo/esp32/<id>/status the server publishes on the ESP32 port (or to its
+nemo/server/suppressed/<id> marker when no publish was needed), and keeps the
+delay distribution plus events that were never forwarded
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Optional, Tuple
+
+import codec
+from metrics import LogHistogram
+from sources import DEFAULT_SOURCE, map_tool_id
+
+# NEMO event -> event_type the server publishes to the display (see main.process_tool_status)
+EXPECTED_ESP32_EVENT = {
+    "start": "active",
+    "end": "enabled",
+    "enabled": "enabled",
+    "idle": "enabled",
+    "disabled": "disabled",
+}
+
+OVERALL_KEY = "overall"
+# Published by the server instead of a status when an event changes nothing (see main.SUPPRESSED_TOPIC)
+SUPPRESSED_PREFIX = "nemo/server/suppressed/"
+
+# Inbound events without a matching outbound after this long are reported as unforwarded
+FORWARD_TIMEOUT_SECONDS = 5.0
+# Pending inbound events kept per tool (older ones count as superseded)
+MAX_PENDING_PER_TOOL = 32
+
+
+def _json_object(payload: bytes) -> Optional[dict]:
+    try:
+        data = codec.loads(payload)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def inbound_key(topic: str, payload: bytes, tool_id_offset: int = 0,
+                source_name: str = DEFAULT_SOURCE) -> Tuple[Optional[str], Optional[str]]:
+    """(tool key, expected ESP32 event) for a NEMO topic, or (None, None) if it is not forwarded.
+
+    ``tool_id_offset``/``source_name`` are the NEMO source's settings (NEMO_SOURCE_<NAME>_TOOL_ID_OFFSET):
+    the server moves that source's tool ids before publishing, so the key is moved the same way.
+    """
+    if topic == "nemo/tools/overall":
+        return OVERALL_KEY, OVERALL_KEY
+    parts = topic.split("/")
+    if len(parts) < 4 or parts[0] != "nemo" or parts[1] != "tools":
+        return None, None
+    expected = EXPECTED_ESP32_EVENT.get(parts[3])
+    if expected is None:
+        return None, None
+    tool = parts[2]
+    # The server keys displays by the payload's tool_id when present (possibly inside an HMAC envelope)
+    data = _json_object(payload)
+    if data is not None and isinstance(data.get("payload"), str) and "hmac" in data:
+        data = _json_object(data["payload"].encode("utf-8"))
+    if data is not None and data.get("tool_id") is not None:
+        tool = data["tool_id"]
+    return str(map_tool_id(tool, tool_id_offset, source_name)), expected
+
+
+def outbound_key(topic: str, payload: bytes) -> Tuple[Optional[str], Optional[str], bool]:
+    """(tool key, event_type, suppressed) for a server -> display topic or suppressed marker,
+    or (None, None, False)"""
+    if topic == "nemo/esp32/overall":
+        return OVERALL_KEY, OVERALL_KEY, False
+    suppressed = topic.startswith(SUPPRESSED_PREFIX)
+    if suppressed:
+        tool = topic[len(SUPPRESSED_PREFIX):]
+    else:
+        parts = topic.split("/")
+        if len(parts) != 4 or parts[0] != "nemo" or parts[1] != "esp32" or parts[3] != "status":
+            return None, None, False
+        tool = parts[2]
+    data = _json_object(payload)
+    if data is None or not tool:
+        return None, None, False
+    return tool, data.get("event_type"), suppressed
+
+
+class ForwardingCorrelator:
+    """Pair inbound NEMO events with the resulting display publishes.
+
+    An outbound status for tool T with event E matches the newest pending inbound event
+    for T that maps to E; pending events for T received before it were coalesced or
+    superseded by the server and are counted as such, not as lost. A suppressed marker
+    (no publish needed: unchanged state or an out-of-order event) matches the same way
+    but is counted as suppressed, without a delay sample. Inbound events still
+    unmatched after ``timeout`` seconds are counted as unforwarded.
+    """
+
+    def __init__(self, timeout: float = FORWARD_TIMEOUT_SECONDS, recent_unforwarded: int = 20):
+        self.timeout = timeout
+        self.delays_us = LogHistogram()
+        self.unforwarded = deque(maxlen=recent_unforwarded)  # (wall time, topic)
+        self.stats = {
+            "inbound": 0,
+            "matched": 0,
+            "suppressed": 0,
+            "superseded": 0,
+            "unforwarded": 0,
+            "unsolicited": 0,  # outbound with nothing pending (resync, other publishers)
+        }
+        self._pending = {}  # tool key -> deque of (monotonic, wall, expected event, topic)
+        self._lock = threading.Lock()
+
+    def on_inbound(self, topic: str, payload: bytes, retained: bool = False, tool_id_offset: int = 0,
+                   source_name: str = DEFAULT_SOURCE):
+        """Call for each message received on a NEMO port (with that NEMO source's tool id offset)"""
+        if retained:
+            return  # replayed on subscribe, not a live event
+        tool, expected = inbound_key(topic, payload, tool_id_offset, source_name)
+        if tool is None:
+            return
+        with self._lock:
+            self.stats["inbound"] += 1
+            pending = self._pending.get(tool)
+            if pending is None:
+                pending = self._pending[tool] = deque()
+            if len(pending) >= MAX_PENDING_PER_TOOL:
+                pending.popleft()
+                self.stats["superseded"] += 1
+            pending.append((time.monotonic(), time.time(), expected, topic))
+
+    def on_outbound(self, topic: str, payload: bytes, retained: bool = False) -> Optional[float]:
+        """Call for each message received on the ESP32 port; returns the matched delay in seconds"""
+        if retained:
+            return None
+        tool, event, suppressed = outbound_key(topic, payload)
+        if tool is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            pending = self._pending.get(tool)
+            match = None
+            if pending:
+                for index in range(len(pending) - 1, -1, -1):
+                    if pending[index][2] == event:
+                        match = index
+                        break
+            if match is None:
+                self.stats["unsolicited"] += 1
+                return None
+            for _ in range(match):
+                pending.popleft()
+                self.stats["superseded"] += 1
+            received_at = pending.popleft()[0]
+            if not pending:
+                del self._pending[tool]
+            if suppressed:
+                self.stats["suppressed"] += 1
+                return None
+            delay = now - received_at
+            self.stats["matched"] += 1
+            self.delays_us.add(int(delay * 1_000_000))
+            return delay
+
+    def expire(self) -> list:
+        """Move pending events older than the timeout to the unforwarded count; returns their topics"""
+        cutoff = time.monotonic() - self.timeout
+        expired = []
+        with self._lock:
+            for tool in list(self._pending):
+                pending = self._pending[tool]
+                while pending and pending[0][0] < cutoff:
+                    _mono, wall, _expected, topic = pending.popleft()
+                    self.stats["unforwarded"] += 1
+                    self.unforwarded.append((wall, topic))
+                    expired.append(topic)
+                if not pending:
+                    del self._pending[tool]
+        return expired
+
+    def snapshot(self) -> dict:
+        """Counters, pending count and delay percentiles in milliseconds"""
+        self.expire()
+        with self._lock:
+            snap = dict(self.stats)
+            snap["pending"] = sum(len(p) for p in self._pending.values())
+            for p in (50, 90, 99):
+                snap[f"delay_p{p}_ms"] = self.delays_us.percentile(p) / 1000.0
+            snap["delay_max_ms"] = self.delays_us.max / 1000.0
+            snap["recent_unforwarded"] = list(self.unforwarded)
+        return snap
+
+    def summary(self) -> str:
+        """One-line forwarding status for dashboards"""
+        s = self.snapshot()
+        if not s["inbound"]:
+            return "no NEMO events yet"
+        return (
+            f"{s['matched']} forwarded | p50 {s['delay_p50_ms']:.1f} / p90 {s['delay_p90_ms']:.1f} / "
+            f"p99 {s['delay_p99_ms']:.1f} / max {s['delay_max_ms']:.1f} ms | {s['suppressed']} suppressed | "
+            f"{s['unforwarded']} unforwarded | "
+            f"{s['superseded']} superseded | {s['pending']} pending"
+        )
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Dashboard and tail renderers for the MQTT monitor
+Redraw one screen at a fixed frame rate from aggregated monitor state, or print
+a filtered tail in batches, so terminal I/O never runs on the paho threads
+"""
+
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+CLEAR_SCREEN = "\x1b[H\x1b[2J"
+HIDE_CURSOR = "\x1b[?25l"
+SHOW_CURSOR = "\x1b[?25h"
+
+
+def _preview(payload: bytes, width: int) -> str:
+    text = payload.decode("utf-8", errors="replace").replace("\n", " ")
+    return text if len(text) <= width else text[: max(width - 3, 0)] + "..."
+
+
+def _window_summary(st) -> str:
+    if not st:
+        return "-"
+    return (
+        f"{st['msgs_per_s_1s']:.0f} / {st['msgs_per_s_10s']:.1f} / {st['msgs_per_s_60s']:.1f}/s"
+        f"  peak {st['peak_msgs_per_s_60s']}/s  {st['size_p50']}B / {st['size_p99']}B"
+    )
+
+
+def _log_summary(counts: dict) -> str:
+    counts = dict(counts)
+    return (
+        f"{counts.get('connect', 0)} connects | {counts.get('disconnect', 0)} disconnects | "
+        f"{counts.get('timeout', 0)} timeouts | {counts.get('socket_error', 0)} socket errors"
+    )
+
+
+class DashboardRenderer:
+    """Redraw a single dashboard screen ``fps`` times per second"""
+
+    def __init__(self, monitor, fps: float = 2.0, out=None):
+        self.monitor = monitor
+        self.interval = 1.0 / max(fps, 0.1)
+        self.out = out or sys.stdout
+        self._thread = None
+        self._running = False
+        self._last_counts = None
+        self._last_time = None
+
+    def _rates(self, counts: dict, now: float) -> dict:
+        """Per-key msgs/sec since the previous frame"""
+        rates = {}
+        if self._last_counts is not None and now > self._last_time:
+            elapsed = now - self._last_time
+            for key, value in counts.items():
+                rates[key] = (value - self._last_counts.get(key, 0)) / elapsed
+        self._last_counts = dict(counts)
+        self._last_time = now
+        return rates
+
+    def render(self) -> str:
+        """Build one frame as a single string"""
+        m = self.monitor
+        cols, rows = shutil.get_terminal_size((100, 40))
+        now = time.monotonic()
+        snap = m.snapshot()
+        rates = self._rates({"total": snap["message_count"]}, now)
+        traffic = snap["traffic"]
+
+        lines = [
+            f"🔍 MQTT MONITOR — dashboard   runtime {datetime.now() - m.start_time}   (Ctrl+C to stop)",
+            "=" * min(cols, 80),
+            f"Broker: {m.broker.summary()}",
+            f"Broker log: {_log_summary(m.log_tailer.counts)}",
+            f"Forwarding: {m.correlator.summary()}",
+            f"Messages: {snap['message_count']} total | {rates.get('total', 0.0):.1f}/s",
+            "  (msgs/s over 1s / 10s / 60s, peak/s in 60s, payload p50 / p99)",
+        ]
+        for port, name in m.port_names.items():
+            lines.append(f"  Port {port} ({name}): {snap['port_stats'].get(port, 0)}  " + _window_summary(traffic["port"].get(port)))
+
+        lines.append("")
+        lines.append("📦 TOPIC CLASSES:")
+        by_rate = sorted(traffic["prefix"].items(), key=lambda kv: kv[1]["msgs_per_s_10s"], reverse=True)
+        for prefix, st in by_rate[:5]:
+            lines.append(f"  {prefix:<24} " + _window_summary(st))
+
+        lines.append("")
+        lines.append("📈 TOP TOPICS:")
+        for topic, count in snap["top_topics"]:
+            lines.append(f"  {count:>8}  {topic}"[:cols])
+
+        lines.append("")
+        lines.append("🕒 LATEST PER TOPIC:")
+        remaining = max(rows - len(lines) - 1, 1)
+        for topic, (ts, source, size, payload) in snap["latest"][:remaining]:
+            stamp = datetime.fromtimestamp(ts).strftime("%H:%M:%S")
+            head = f"  [{stamp}] [{source:>6}] {topic} ({size}B) "
+            lines.append((head + _preview(payload, max(cols - len(head), 0)))[:cols])
+
+        return "\n".join(lines)
+
+    def _run(self):
+        self.out.write(HIDE_CURSOR)
+        try:
+            while self._running:
+                frame = self.render()
+                self.out.write(CLEAR_SCREEN + frame + "\n")
+                self.out.flush()
+                time.sleep(self.interval)
+        finally:
+            self.out.write(SHOW_CURSOR)
+            self.out.flush()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="monitor-dashboard", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(self.interval + 1.0)
+            self._thread = None
+
+
+class TailPrinter:
+    """Buffered one-line-per-message tail, flushed in batches.
+
+    Lines beyond ``max_buffer`` between flushes are dropped and the count is printed,
+    so a burst never blocks the producer threads on terminal writes.
+    """
+
+    def __init__(self, fps: float = 10.0, max_buffer: int = 5000, out=None):
+        self.interval = 1.0 / max(fps, 0.1)
+        self.out = out or sys.stdout
+        self._lines = deque(maxlen=max_buffer)
+        self._offered = 0
+        self._flushed = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+
+    def add(self, line: str):
+        with self._lock:
+            self._lines.append(line)
+            self._offered += 1
+
+    def flush(self):
+        with self._lock:
+            lines = list(self._lines)
+            self._lines.clear()
+            dropped = self._offered - self._flushed - len(lines)
+            self._flushed = self._offered
+        if dropped > 0:
+            lines.insert(0, f"… {dropped} line(s) skipped (tail buffer full)")
+        if lines:
+            self.out.write("\n".join(lines) + "\n")
+            self.out.flush()
+
+    def _run(self):
+        while self._running:
+            time.sleep(self.interval)
+            self.flush()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="monitor-tail", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(self.interval + 1.0)
+            self._thread = None
+        self.flush()
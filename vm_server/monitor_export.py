@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Machine-readable export for the MQTT monitor
+Periodic aggregated stats and, optionally, every message as JSON Lines or CSV.
+Producers only append to an in-memory queue; a writer thread encodes and writes
+in large batches so recording at high message rates stays cheap
+"""
+
+import csv
+import os
+import sys
+import threading
+from collections import deque
+
+import codec
+
+EXPORT_FORMATS = ("jsonl", "csv")
+
+MESSAGE_FIELDS = ("timestamp", "source", "port", "topic", "qos", "retain", "size", "payload")
+STATS_FIELDS = ("timestamp", "metric", "value")
+
+# Messages queued between writer batches before new ones are dropped (and counted)
+MAX_PENDING_MESSAGES = 200000
+# Userspace file buffer; batches are written through it in one call
+WRITE_BUFFER_BYTES = 1 << 20
+
+
+def flatten(prefix: str, value, out: list):
+    """Flatten nested dicts into (dotted.metric, value) pairs; lists become JSON strings"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flatten(f"{prefix}.{key}" if prefix else str(key), item, out)
+    elif isinstance(value, (list, tuple)):
+        out.append((prefix, codec.dumps(value)))
+    else:
+        out.append((prefix, value))
+    return out
+
+
+def messages_path(path: str) -> str:
+    """CSV message rows go next to the stats file: export.csv -> export.messages.csv"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.messages{ext or '.csv'}"
+
+
+class ExportWriter:
+    """Batched JSONL/CSV writer.
+
+    JSONL: one file, each line has "type": "stats" or "message".
+    CSV: stats in long form (timestamp, metric, value) in ``path``; messages, when
+    enabled, in ``messages_path(path)``. ``path`` "-" writes to stdout (JSONL only).
+    """
+
+    def __init__(self, path: str, fmt: str = "jsonl", include_messages: bool = False,
+                 flush_interval: float = 1.0, max_pending: int = MAX_PENDING_MESSAGES):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"export format must be one of {', '.join(EXPORT_FORMATS)}")
+        if fmt == "csv" and path == "-":
+            raise ValueError("CSV export needs a file path (stats and messages are separate files)")
+        self.path = path
+        self.fmt = fmt
+        self.include_messages = include_messages
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.written = 0
+        self._messages = deque()
+        self._stats = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+        self._out = None
+        self._msg_out = None
+
+    # ----- producer side -----
+
+    def add_message(self, timestamp: float, source: str, port: str, topic: str,
+                    qos: int, retain: bool, payload: bytes):
+        """Queue one message (no encoding or I/O on the caller's thread)"""
+        if not self.include_messages:
+            return
+        with self._lock:
+            if len(self._messages) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._messages.append((timestamp, source, port, topic, qos, retain, payload))
+
+    def add_stats(self, timestamp: float, stats: dict):
+        with self._lock:
+            self._stats.append((timestamp, stats))
+        self._wake.set()
+
+    # ----- writer thread -----
+
+    def _open(self):
+        if self.path == "-":
+            # The real stdout: the monitor sends its human-readable output to stderr in export mode
+            self._out = sys.__stdout__
+        else:
+            self._out = open(self.path, "a", encoding="utf-8", newline="", buffering=WRITE_BUFFER_BYTES)
+        if self.fmt == "csv":
+            new_file = self._out.tell() == 0
+            if new_file:
+                csv.writer(self._out).writerow(STATS_FIELDS)
+            if self.include_messages:
+                mpath = messages_path(self.path)
+                self._msg_out = open(mpath, "a", encoding="utf-8", newline="", buffering=WRITE_BUFFER_BYTES)
+                if self._msg_out.tell() == 0:
+                    csv.writer(self._msg_out).writerow(MESSAGE_FIELDS)
+
+    def _encode_jsonl(self, messages, stats) -> str:
+        lines = []
+        for ts, snapshot in stats:
+            lines.append(codec.dumps({"type": "stats", "timestamp": ts, **snapshot}))
+        for ts, source, port, topic, qos, retain, payload in messages:
+            lines.append(codec.dumps({
+                "type": "message", "timestamp": ts, "source": source, "port": port, "topic": topic,
+                "qos": qos, "retain": retain, "size": len(payload),
+                "payload": payload.decode("utf-8", errors="replace"),
+            }))
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def flush(self):
+        """Encode and write everything queued so far as one batch"""
+        with self._lock:
+            messages, self._messages = self._messages, deque()
+            stats, self._stats = self._stats, deque()
+        if not messages and not stats:
+            return
+        if self.fmt == "jsonl":
+            self._out.write(self._encode_jsonl(messages, stats))
+        else:
+            rows = []
+            for ts, snapshot in stats:
+                rows.extend((ts, metric, value) for metric, value in flatten("", snapshot, []))
+            csv.writer(self._out).writerows(rows)
+            if messages and self._msg_out is not None:
+                csv.writer(self._msg_out).writerows(
+                    (ts, source, port, topic, qos, int(retain), len(payload), payload.decode("utf-8", errors="replace"))
+                    for ts, source, port, topic, qos, retain, payload in messages
+                )
+                self._msg_out.flush()
+        self._out.flush()
+        self.written += len(messages)
+
+    def _run(self):
+        while self._running:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        self._open()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="monitor-export", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(self.flush_interval + 2.0)
+            self._thread = None
+        if self._out is not None:
+            self.flush()
+            if self.path != "-":
+                self._out.close()
+            self._out = None
+        if self._msg_out is not None:
+            self._msg_out.close()
+            self._msg_out = None
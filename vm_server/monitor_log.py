@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Incremental mosquitto.log follower for the MQTT monitor
+Starts at the end of the file and then reads only the bytes appended since the
+previous poll, reopening on rotation or truncation, and parses client
+connect/disconnect lines into counted events
+"""
+
+import os
+import re
+from collections import deque
+from typing import List, Optional
+
+MOSQUITTO_LOG = "mqtt/log/mosquitto.log"
+
+# Bytes read backwards from the end on first open to seed the recent-lines view
+INITIAL_TAIL_BYTES = 4096
+# Upper bound per poll so a huge backlog cannot stall the caller
+MAX_READ_BYTES = 1 << 20
+
+# "<epoch>: <message>" (mosquitto's default log_timestamp format)
+_LINE = re.compile(r"^(?:(?P<ts>\d+(?:\.\d+)?):\s+)?(?P<msg>.*)$")
+
+# Event kind, regex with a "client" group where the line names one
+EVENT_PATTERNS = (
+    ("connect", re.compile(r"^New client connected from (?P<addr>\S+) as (?P<client>\S+)")),
+    ("disconnect", re.compile(r"^Client (?P<client>\S+) (?:disconnected|closed its connection)")),
+    ("timeout", re.compile(r"^Client (?P<client>\S+) has exceeded timeout")),
+    ("socket_error", re.compile(r"^Socket error on client (?P<client>\S+)")),
+    ("takeover", re.compile(r"^Client (?P<client>\S+) already connected")),
+    ("auth_failure", re.compile(r"not authori[sz]ed|bad username or password", re.IGNORECASE)),
+    ("new_connection", re.compile(r"^New connection from (?P<addr>\S+)")),
+)
+
+
+class LogEvent:
+    """One parsed log line"""
+
+    __slots__ = ("timestamp", "kind", "client", "message")
+
+    def __init__(self, timestamp: Optional[float], kind: str, client: Optional[str], message: str):
+        self.timestamp = timestamp
+        self.kind = kind
+        self.client = client
+        self.message = message
+
+
+def parse_line(line: str) -> LogEvent:
+    """Parse a mosquitto log line; unrecognised lines get kind "other" """
+    match = _LINE.match(line)
+    ts = float(match.group("ts")) if match.group("ts") else None
+    message = match.group("msg")
+    for kind, pattern in EVENT_PATTERNS:
+        event = pattern.search(message)
+        if event:
+            client = event.groupdict().get("client")
+            return LogEvent(ts, kind, client.rstrip(".,") if client else None, message)
+    return LogEvent(ts, "other", None, message)
+
+
+class LogTailer:
+    """Follow a log file by byte offset.
+
+    ``poll()`` reads only what was appended since the previous call. When the file's
+    inode changes (rotation) or it shrinks below the saved offset (truncation), the
+    new file is read from the start.
+    """
+
+    def __init__(self, path: str = MOSQUITTO_LOG, recent_lines: int = 50):
+        self.path = path
+        self.recent = deque(maxlen=recent_lines)
+        self.counts = {}
+        self.rotations = 0
+        self._fh = None
+        self._inode = None
+        self._offset = 0
+        self._partial = b""
+
+    def _open(self, from_end: bool) -> bool:
+        try:
+            fh = open(self.path, "rb")
+        except OSError:
+            return False
+        st = os.fstat(fh.fileno())
+        self._fh = fh
+        self._inode = st.st_ino
+        self._partial = b""
+        self._offset = 0
+        if from_end:
+            # Seed a few recent lines without counting them as new events
+            start = max(st.st_size - INITIAL_TAIL_BYTES, 0)
+            fh.seek(start)
+            data = fh.read(st.st_size - start)
+            lines = data.split(b"\n")
+            if start > 0:
+                lines = lines[1:]  # first piece is probably a partial line
+            for raw in lines:
+                if raw.strip():
+                    self.recent.append(parse_line(raw.decode("utf-8", errors="replace").rstrip("\r")))
+            self._offset = st.st_size
+        return True
+
+    def _close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def poll(self) -> List[LogEvent]:
+        """Return events for complete lines appended since the last poll"""
+        if self._fh is None:
+            # Start from the end the first time only; a file created later is read whole
+            if not self._open(from_end=self._inode is None):
+                return []
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return []  # rotated away and not recreated yet; keep the old handle
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            # Drain what is left of the old file before switching
+            events = self._read_new() if st.st_ino != self._inode else []
+            self._close()
+            self.rotations += 1
+            if not self._open(from_end=False):
+                return events
+            return events + self._read_new()
+        if st.st_size == self._offset:
+            return []
+        return self._read_new()
+
+    def _read_new(self) -> List[LogEvent]:
+        self._fh.seek(self._offset)
+        data = self._fh.read(MAX_READ_BYTES)
+        if not data:
+            return []
+        self._offset += len(data)
+        data = self._partial + data
+        lines = data.split(b"\n")
+        self._partial = lines.pop()  # incomplete last line (empty if data ended with a newline)
+        events = []
+        for raw in lines:
+            if not raw.strip():
+                continue
+            event = parse_line(raw.decode("utf-8", errors="replace").rstrip("\r"))
+            self.counts[event.kind] = self.counts.get(event.kind, 0) + 1
+            self.recent.append(event)
+            events.append(event)
+        return events
+
+    def last(self, n: int = 3) -> List[LogEvent]:
+        """The ``n`` most recent parsed lines"""
+        return list(self.recent)[-n:]
+
+    def close(self):
+        self._close()
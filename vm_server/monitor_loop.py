@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Single-threaded event loop for watching many MQTT brokers/listeners at once
+Each endpoint gets a paho client whose socket is driven from one selector via
+loop_read/loop_write/loop_misc, so the monitor needs no thread per connection
+"""
+
+import selectors
+import time
+from typing import Callable, List, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import paho.mqtt.client as mqtt
+
+SCHEMES = {"mqtt": "tcp", "tcp": "tcp", "ws": "websockets"}
+ROLES = ("esp32", "nemo")
+
+RECONNECT_MIN_SECONDS = 1.0
+RECONNECT_MAX_SECONDS = 30.0
+
+
+class Endpoint:
+    """One broker connection to watch.
+
+    ``key`` identifies the connection in statistics (the port for the default
+    listeners, otherwise host:port) and ``label`` names it in output.
+    ``role`` tells the monitor how to interpret traffic: "nemo" endpoints are the
+    server's input, "esp32" endpoints its output; None just records traffic.
+    ``sys`` subscribes to mosquitto's $SYS metrics on this connection.
+    ``tool_id_offset`` is the NEMO source's tool id offset on "nemo" endpoints, so their
+    events can be matched to the server's shifted ESP32 topics.
+    """
+
+    def __init__(self, key: str, label: str, host: str, port: int, transport: str = "tcp",
+                 path: str = "/mqtt", filters: Optional[List[str]] = None, username: str = "",
+                 password: str = "", role: Optional[str] = None, sys: bool = False, tool_id_offset: int = 0):
+        self.key = key
+        self.label = label
+        self.host = host
+        self.port = port
+        self.transport = transport
+        self.path = path
+        self.filters = filters or ["#"]
+        self.username = username
+        self.password = password
+        self.role = role
+        self.sys = sys
+        self.tool_id_offset = tool_id_offset
+        self.client = None
+        self.connected = False
+
+    def __repr__(self):
+        scheme = "ws" if self.transport == "websockets" else "mqtt"
+        path = self.path if self.transport == "websockets" else ""
+        return f"{self.label} {scheme}://{self.host}:{self.port}{path}"
+
+
+def parse_endpoint(spec: str) -> Endpoint:
+    """Parse ``NAME=SCHEME://[USER:PASS@]HOST:PORT[/PATH][?sub=FILTER&role=ROLE&sys=1&offset=N]``.
+
+    SCHEME is mqtt (plain TCP) or ws (websockets); ``sub`` may repeat (default "#").
+    ``offset`` is the tool id offset of a nemo endpoint (NEMO_SOURCE_<NAME>_TOOL_ID_OFFSET).
+    Example: ``site2=ws://10.0.0.5:9001/mqtt?sub=nemo/%23&role=esp32``
+    """
+    name, sep, url = spec.partition("=")
+    if not sep or not name or not url:
+        raise ValueError(f"endpoint '{spec}' must look like NAME=mqtt://HOST:PORT")
+    parts = urlsplit(url)
+    transport = SCHEMES.get(parts.scheme)
+    if transport is None:
+        raise ValueError(f"endpoint '{spec}': scheme must be one of {', '.join(SCHEMES)}")
+    if not parts.hostname or parts.port is None:
+        raise ValueError(f"endpoint '{spec}': host and port are required")
+    query = parse_qs(parts.query)
+    role = query.get("role", [None])[0]
+    if role is not None and role not in ROLES:
+        raise ValueError(f"endpoint '{spec}': role must be one of {', '.join(ROLES)}")
+    try:
+        offset = int(query.get("offset", ["0"])[0])
+    except ValueError:
+        offset = -1
+    if offset < 0:
+        raise ValueError(f"endpoint '{spec}': offset must be a non-negative integer")
+    return Endpoint(
+        key=f"{parts.hostname}:{parts.port}",
+        label=name,
+        host=parts.hostname,
+        port=parts.port,
+        transport=transport,
+        path=parts.path or "/mqtt",
+        filters=query.get("sub") or ["#"],
+        username=unquote(parts.username or ""),
+        password=unquote(parts.password or ""),
+        role=role,
+        sys=query.get("sys", ["0"])[0] in ("1", "true", "yes"),
+        tool_id_offset=offset,
+    )
+
+
+class MultiBrokerLoop:
+    """Drive any number of paho clients from one selector.
+
+    Callbacks receive the Endpoint first: on_connect(endpoint, client, rc),
+    on_message(endpoint, msg), on_disconnect(endpoint, rc). ``tick`` runs about every
+    ``tick_interval`` seconds on the loop thread for periodic work.
+    """
+
+    def __init__(self, endpoints: List[Endpoint], on_connect: Callable, on_message: Callable,
+                 on_disconnect: Optional[Callable] = None, keepalive: int = 60):
+        self.endpoints = endpoints
+        self.on_connect = on_connect
+        self.on_message = on_message
+        self.on_disconnect = on_disconnect
+        self.keepalive = keepalive
+        self.running = False
+        self._selector = selectors.DefaultSelector()
+        self._registered = {}  # endpoint key -> (socket, events)
+        self._retry_at = {}  # endpoint key -> (monotonic time, current backoff)
+
+    def _make_client(self, ep: Endpoint) -> mqtt.Client:
+        client = mqtt.Client(transport=ep.transport)
+        if ep.transport == "websockets":
+            client.ws_set_options(path=ep.path)
+        if ep.username:
+            client.username_pw_set(ep.username, ep.password or None)
+        client.on_connect = lambda c, u, flags, rc: self._connected(ep, c, rc)
+        client.on_message = lambda c, u, msg: self.on_message(ep, msg)
+        client.on_disconnect = lambda c, u, rc: self._disconnected(ep, rc)
+        return client
+
+    def _connected(self, ep: Endpoint, client: mqtt.Client, rc: int):
+        ep.connected = rc == 0
+        if rc == 0:
+            self._retry_at.pop(ep.key, None)
+        self.on_connect(ep, client, rc)
+
+    def _disconnected(self, ep: Endpoint, rc: int):
+        ep.connected = False
+        if self.on_disconnect:
+            self.on_disconnect(ep, rc)
+
+    def _connect(self, ep: Endpoint):
+        """Blocking TCP/websocket connect (bounded by paho's 5 s connect timeout)"""
+        try:
+            if ep.client is None:
+                ep.client = self._make_client(ep)
+                ep.client.connect(ep.host, ep.port, self.keepalive)
+            else:
+                ep.client.reconnect()
+        except (OSError, ValueError) as e:
+            _, backoff = self._retry_at.get(ep.key, (0, RECONNECT_MIN_SECONDS / 2))
+            backoff = min(backoff * 2, RECONNECT_MAX_SECONDS)
+            self._retry_at[ep.key] = (time.monotonic() + backoff, backoff)
+            print(f"❌ {ep.label}: connect to {ep.host}:{ep.port} failed ({e}); retrying in {backoff:.0f}s")
+
+    def _sync_registration(self, ep: Endpoint):
+        """Keep the selector in step with the client's current socket and write interest"""
+        sock = ep.client.socket() if ep.client is not None else None
+        current = self._registered.get(ep.key)
+        if sock is None:
+            if current is not None:
+                try:
+                    self._selector.unregister(current[0])
+                except (KeyError, ValueError, OSError):
+                    pass
+                del self._registered[ep.key]
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if ep.client.want_write() else 0)
+        if current is not None and current[0] is not sock:
+            try:
+                self._selector.unregister(current[0])
+            except (KeyError, ValueError, OSError):
+                pass
+            current = None
+        if current is None:
+            self._selector.register(sock, events, ep)
+        elif current[1] != events:
+            self._selector.modify(sock, events, ep)
+        self._registered[ep.key] = (sock, events)
+
+    @staticmethod
+    def _pending(ep: Endpoint) -> int:
+        sock = ep.client.socket()
+        return sock.pending() if sock is not None and hasattr(sock, "pending") else 0
+
+    def run(self, tick: Optional[Callable[[], None]] = None, tick_interval: float = 1.0):
+        """Connect every endpoint and process network events until stop() is called"""
+        self.running = True
+        for ep in self.endpoints:
+            self._connect(ep)
+        next_tick = time.monotonic() + tick_interval
+        try:
+            while self.running:
+                now = time.monotonic()
+                for ep in self.endpoints:
+                    if ep.client is None or ep.client.socket() is None:
+                        retry_at = self._retry_at.get(ep.key)
+                        if retry_at is None:
+                            # Just dropped: back off before the first reconnect
+                            self._retry_at[ep.key] = (now + RECONNECT_MIN_SECONDS, RECONNECT_MIN_SECONDS)
+                        elif now >= retry_at[0]:
+                            self._connect(ep)
+                    self._sync_registration(ep)
+
+                timeout = max(min(next_tick - now, 1.0), 0.0)
+                # SSL/websocket wrappers may hold decoded bytes select() cannot see
+                buffered = [ep for ep in self.endpoints if ep.key in self._registered and self._pending(ep)]
+                if buffered:
+                    timeout = 0.0
+                if self._registered:
+                    ready = self._selector.select(timeout)
+                else:
+                    time.sleep(timeout)
+                    ready = []
+                for key, mask in ready:
+                    ep = key.data
+                    if mask & selectors.EVENT_READ:
+                        ep.client.loop_read()
+                    if mask & selectors.EVENT_WRITE and ep.client.socket() is not None:
+                        ep.client.loop_write()
+                for ep in buffered:
+                    if ep.client.socket() is not None:
+                        ep.client.loop_read()
+                for ep in self.endpoints:
+                    if ep.client is not None and ep.client.socket() is not None:
+                        ep.client.loop_misc()
+
+                if tick is not None and time.monotonic() >= next_tick:
+                    tick()
+                    next_tick = time.monotonic() + tick_interval
+        finally:
+            self._shutdown()
+
+    def stop(self):
+        self.running = False
+
+    def _shutdown(self):
+        """Send DISCONNECT on every live connection and release the selector"""
+        for ep in self.endpoints:
+            client = ep.client
+            if client is None or client.socket() is None:
+                continue
+            client.disconnect()
+            deadline = time.monotonic() + 1.0
+            while client.socket() is not None and client.want_write() and time.monotonic() < deadline:
+                client.loop_write()
+        self._selector.close()
+        self._registered.clear()
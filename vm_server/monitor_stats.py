@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Streaming statistics for the MQTT monitor
+Fixed-memory structures that update in O(1) per message
+"""
+
+from typing import Iterable, List, Optional, Tuple
+
+import paho.mqtt.client as mqtt
+
+from metrics import LogHistogram, SlidingWindow
+
+
+class _Bucket:
+    """All monitored items that currently share one count"""
+
+    __slots__ = ("count", "items", "lower", "higher")
+
+    def __init__(self, count: int):
+        self.count = count
+        self.items = {}  # key -> None, used as an insertion-ordered set
+        self.lower = None
+        self.higher = None
+
+
+class SpaceSaving:
+    """Space-Saving heavy hitters (Metwally et al.) over a stream-summary.
+
+    Tracks at most ``capacity`` keys. Updates are O(1); ``top(k)`` is O(k). Reported
+    counts may overestimate by at most the key's ``error``; any key whose true count
+    exceeds total/capacity is guaranteed to be tracked.
+
+    Keys matching one of the ``exact`` MQTT topic filters additionally get exact counts.
+    """
+
+    def __init__(self, capacity: int = 256, exact: Optional[Iterable[str]] = None):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.exact_filters = list(exact or [])
+        self.exact_counts = {}
+        self.total = 0
+        self._items = {}  # key -> [bucket, error]
+        self._min = None  # lowest-count bucket
+        self._max = None  # highest-count bucket
+
+    def __len__(self):
+        return len(self._items)
+
+    def __bool__(self):
+        return self.total > 0
+
+    # ----- bucket list maintenance -----
+
+    def _insert_above(self, bucket: Optional[_Bucket], count: int) -> _Bucket:
+        """Return the bucket for ``count`` directly above ``bucket`` (None = list head)"""
+        above = bucket.higher if bucket is not None else self._min
+        if above is not None and above.count == count:
+            return above
+        new = _Bucket(count)
+        new.lower = bucket
+        new.higher = above
+        if bucket is not None:
+            bucket.higher = new
+        else:
+            self._min = new
+        if above is not None:
+            above.lower = new
+        else:
+            self._max = new
+        return new
+
+    def _unlink_if_empty(self, bucket: _Bucket):
+        if bucket.items:
+            return
+        if bucket.lower is not None:
+            bucket.lower.higher = bucket.higher
+        else:
+            self._min = bucket.higher
+        if bucket.higher is not None:
+            bucket.higher.lower = bucket.lower
+        else:
+            self._max = bucket.lower
+
+    # ----- updates -----
+
+    def add(self, key: str):
+        """Count one occurrence of ``key``"""
+        self.total += 1
+        if self.exact_filters:
+            for pattern in self.exact_filters:
+                if mqtt.topic_matches_sub(pattern, key):
+                    self.exact_counts[key] = self.exact_counts.get(key, 0) + 1
+                    break
+
+        entry = self._items.get(key)
+        if entry is not None:
+            bucket = entry[0]
+            target = self._insert_above(bucket, bucket.count + 1)
+            del bucket.items[key]
+            target.items[key] = None
+            entry[0] = target
+            self._unlink_if_empty(bucket)
+            return
+
+        if len(self._items) < self.capacity:
+            target = self._insert_above(None, 1)
+            target.items[key] = None
+            self._items[key] = [target, 0]
+            return
+
+        # Full: replace one of the minimum-count keys; the newcomer inherits its count
+        low = self._min
+        evicted = next(iter(low.items))
+        del low.items[evicted]
+        del self._items[evicted]
+        target = self._insert_above(low, low.count + 1)
+        target.items[key] = None
+        self._items[key] = [target, low.count]
+        self._unlink_if_empty(low)
+
+    # ----- queries -----
+
+    def count(self, key: str) -> Tuple[int, int]:
+        """(estimated count, max overestimate) for ``key``; exact keys have error 0"""
+        if key in self.exact_counts:
+            return self.exact_counts[key], 0
+        entry = self._items.get(key)
+        if entry is None:
+            return 0, 0
+        return entry[0].count, entry[1]
+
+    def top(self, k: int = 10) -> List[Tuple[str, int, int]]:
+        """Up to ``k`` heaviest keys as (key, count, error), highest count first"""
+        result = []
+        bucket = self._max
+        while bucket is not None and len(result) < k:
+            for key in bucket.items:
+                exact = self.exact_counts.get(key)
+                if exact is not None:
+                    result.append((key, exact, 0))
+                else:
+                    result.append((key, bucket.count, self._items[key][1]))
+                if len(result) >= k:
+                    break
+            bucket = bucket.lower
+        # Exact counts can be slightly below neighbouring estimates
+        result.sort(key=lambda item: item[1], reverse=True)
+        return result
+
+
+class TrafficStats:
+    """Sliding-window rates, bursts and payload-size percentiles per port and per topic prefix"""
+
+    WINDOWS = (1, 10, 60)
+    PREFIX_LEVELS = 2
+    MAX_PREFIXES = 64
+    OTHER_PREFIX = "(other)"
+
+    def __init__(self):
+        self._series = {}  # (kind, key) -> (SlidingWindow, LogHistogram)
+        self._prefix_count = 0
+
+    @classmethod
+    def topic_prefix(cls, topic: str) -> str:
+        """Topic class used for aggregation: the first PREFIX_LEVELS levels"""
+        return "/".join(topic.split("/", cls.PREFIX_LEVELS)[: cls.PREFIX_LEVELS])
+
+    def _get(self, kind: str, key: str):
+        series = self._series.get((kind, key))
+        if series is None:
+            if kind == "prefix":
+                if self._prefix_count >= self.MAX_PREFIXES:
+                    # Bounded: further topic classes share one series
+                    key = self.OTHER_PREFIX
+                    series = self._series.get((kind, key))
+                    if series is not None:
+                        return series
+                self._prefix_count += 1
+            series = (SlidingWindow(max(self.WINDOWS) + 1), LogHistogram())
+            self._series[(kind, key)] = series
+        return series
+
+    def record(self, port: str, topic: str, size: int, now: float):
+        """Account one message; O(1)"""
+        for kind, key in (("port", port), ("prefix", self.topic_prefix(topic))):
+            window, sizes = self._get(kind, key)
+            window.add(size, now)
+            sizes.add(size)
+
+    def snapshot(self, now: float) -> dict:
+        """{"port": {port: stats}, "prefix": {prefix: stats}} with rates per window and size percentiles"""
+        result = {"port": {}, "prefix": {}}
+        for (kind, key), (window, sizes) in self._series.items():
+            entry = {}
+            for w in self.WINDOWS:
+                msgs, nbytes = window.totals(w, now)
+                entry[f"msgs_per_s_{w}s"] = msgs / w
+                entry[f"bytes_per_s_{w}s"] = nbytes / w
+            entry["peak_msgs_per_s_60s"] = window.peak(60, now)
+            entry["size_p50"] = sizes.percentile(50)
+            entry["size_p90"] = sizes.percentile(90)
+            entry["size_p99"] = sizes.percentile(99)
+            entry["size_max"] = sizes.max
+            entry["messages"] = sizes.total
+            result[kind][key] = entry
+        return result
@@ -5,23 +5,66 @@ Combines broker status monitoring, message watching, and traffic analysis
 """
 
 import paho.mqtt.client as mqtt
+import argparse
+import contextlib
 import threading
 import time
 import sys
 import os
 import signal
 from datetime import datetime
-from collections import defaultdict
+from collections import OrderedDict
 from dotenv import load_dotenv
 
+import codec
+from monitor_broker import SYS_FILTER, BrokerStatus
+from monitor_correlator import ForwardingCorrelator
+from monitor_dashboard import DashboardRenderer, TailPrinter
+from monitor_export import EXPORT_FORMATS, ExportWriter
+from monitor_log import MOSQUITTO_LOG, LogTailer
+from monitor_loop import Endpoint, MultiBrokerLoop, parse_endpoint
+from monitor_stats import SpaceSaving, TrafficStats
+from sources import source_configs
+
 # Load configuration from config.env
 load_dotenv('config.env')
+codec.use(os.getenv('JSON_CODEC', 'auto').strip().lower() or 'auto')
+
+# Output modes: full per-message log, single-screen dashboard, filtered one-line tail,
+# or headless machine-readable export
+MODES = ("log", "dashboard", "tail", "export")
+
+# Latest-message-per-topic entries kept for the dashboard
+LATEST_MAX_TOPICS = 500
+# Payload bytes kept per latest message (decoded only when rendered)
+LATEST_PREVIEW_BYTES = 200
+# Topics tracked by the heavy-hitters summary (fixed memory regardless of topic count)
+TOPK_CAPACITY = 256
 
 class ComprehensiveMQTTMonitor:
-    def __init__(self):
+    def __init__(self, mode="log", fps=2.0, tail_filter="#", topk_capacity=TOPK_CAPACITY, exact_topics=None,
+                 log_file=MOSQUITTO_LOG, exporter=None, export_interval=10.0, endpoints=None):
         self.running = True
+        self.mode = mode
+        self.fps = fps
+        self.tail_filter = tail_filter
         self.message_count = 0
-        self.topic_stats = defaultdict(int)
+        # Streaming top-k topic counts; topics matching exact_topics filters are counted exactly
+        self.topic_stats = SpaceSaving(topk_capacity, exact=exact_topics)
+        self.latest = OrderedDict()  # topic -> (epoch, source, size, payload prefix)
+        # Sliding-window rates and size percentiles per port and topic prefix
+        self.traffic = TrafficStats()
+        self._lock = threading.Lock()
+        self.renderer = None
+        # Export mode: stats every export_interval seconds (and messages if enabled) via a batched writer
+        self.exporter = exporter
+        self.export_interval = export_interval
+        # Broker health pushed by mosquitto on $SYS (no subprocesses per refresh)
+        self.broker = BrokerStatus(on_restart=self.on_broker_restart)
+        # Follows mosquitto.log by offset; polled once per second from the main loop
+        self.log_tailer = LogTailer(log_file)
+        # Black-box NEMO -> ESP32 forwarding delay measured across the two ports
+        self.correlator = ForwardingCorrelator()
         
         # Read MQTT configuration from environment
         self.mqtt_broker = os.getenv('MQTT_BROKER', 'localhost')
@@ -30,7 +73,14 @@ class ComprehensiveMQTTMonitor:
         self.mqtt_username = os.getenv('MQTT_USERNAME', '')
         self.mqtt_password = os.getenv('MQTT_PASSWORD', '')
         
-        self.port_stats = {str(self.mqtt_port_esp32): 0, str(self.mqtt_port): 0}
+        # Brokers/listeners to watch, all driven from one selector loop
+        self.endpoints = endpoints or self.default_endpoints()
+        if len({ep.key for ep in self.endpoints}) != len(self.endpoints):
+            raise ValueError("each endpoint must have a distinct host:port")
+        self.loop = None
+        
+        self.port_stats = {ep.key: 0 for ep in self.endpoints}
+        self.port_names = {ep.key: ep.label for ep in self.endpoints}
         self.start_time = datetime.now()
         
         # Setup signal handlers for graceful shutdown
@@ -43,51 +93,152 @@ class ComprehensiveMQTTMonitor:
         self.running = False
         sys.exit(0)
     
-    def on_connect_1883(self, client, userdata, flags, rc):
-        """Connection callback for ESP32 port"""
+    def default_endpoints(self):
+        """The ESP32 and NEMO listeners from config.env, plus every NEMO_SOURCES broker"""
+        endpoints = [
+            # '#' does not match $SYS topics; one $SYS subscription is enough since listeners share a broker
+            Endpoint(str(self.mqtt_port_esp32), "ESP32s", self.mqtt_broker, self.mqtt_port_esp32,
+                     role="esp32", sys=True),
+            Endpoint(str(self.mqtt_port), "NEMO", self.mqtt_broker, self.mqtt_port,
+                     username=self.mqtt_username if self.mqtt_password else "",
+                     password=self.mqtt_password, role="nemo"),
+        ]
+        try:
+            sources = source_configs(os.environ, {
+                'mqtt_broker': self.mqtt_broker, 'mqtt_username': self.mqtt_username,
+                'mqtt_password': self.mqtt_password, 'mqtt_hmac_key': '', 'mqtt_hmac_key_previous': '',
+            })
+        except ValueError as e:
+            print(f"⚠️  Ignoring NEMO_SOURCES: {e}")
+            sources = []
+        for source in sources:
+            endpoints.append(Endpoint(f"{source['broker']}:{source['port']}", source['name'], source['broker'],
+                                      source['port'], username=source['username'] if source['password'] else "",
+                                      password=source['password'], role="nemo",
+                                      tool_id_offset=source['tool_id_offset']))
+        return endpoints
+    
+    def on_endpoint_connect(self, ep, client, rc):
+        """Connection callback for any endpoint"""
         if rc == 0:
-            print(f"✅ Connected to port {self.mqtt_port_esp32} (ESP32s)")
-            result = client.subscribe("#", qos=1)  # Subscribe to all topics with QoS 1
-            print(f"   📡 Subscribed to all topics on port {self.mqtt_port_esp32} (result: {result})")
+            print(f"✅ Connected to {ep.key} ({ep.label})")
+            for topic_filter in ep.filters:
+                client.subscribe(topic_filter, qos=1)
+            if ep.sys:
+                client.subscribe(SYS_FILTER, qos=0)
+            print(f"   📡 Subscribed to {', '.join(ep.filters)}{' + $SYS' if ep.sys else ''} on {ep.key}")
         else:
-            print(f"❌ Failed to connect to port {self.mqtt_port_esp32}: {rc}")
+            print(f"❌ Failed to connect to {ep.key} ({ep.label}): {rc}")
     
-    def on_subscribe_1883(self, client, userdata, mid, granted_qos):
-        """Subscription confirmation callback for ESP32 port"""
-        print(f"   ✅ Subscription confirmed for port {self.mqtt_port_esp32} (QoS: {granted_qos})")
+    def on_endpoint_disconnect(self, ep, rc):
+        """Disconnect callback for any endpoint"""
+        if rc != 0 and self.mode == "log":
+            print(f"⚠️  Lost connection to {ep.key} ({ep.label}): {rc}")
     
-    def on_connect_1884(self, client, userdata, flags, rc):
-        """Connection callback for NEMO Dev port"""
-        if rc == 0:
-            print(f"✅ Connected to port {self.mqtt_port} (NEMO Dev)")
-            client.subscribe("#")  # Subscribe to all topics
-        else:
-            print(f"❌ Failed to connect to port {self.mqtt_port}: {rc}")
+    def on_broker_restart(self, previous_uptime, uptime):
+        """Called from the paho thread when $SYS uptime goes backwards"""
+        line = f"⚠️  Broker restart detected (uptime {previous_uptime}s -> {uptime}s)"
+        if self.mode == "tail":
+            self.renderer.add(line)
+        elif self.mode == "log":
+            print(line)
     
-    def on_message_1883(self, client, userdata, msg):
-        """Message callback for ESP32 port"""
-        self.log_message("ESP32s", msg, str(self.mqtt_port_esp32))
+    def on_endpoint_message(self, ep, msg):
+        """Message callback for any endpoint"""
+        if msg.topic.startswith("$SYS/"):
+            # Broker metrics only update the cache; they are not counted as traffic
+            self.broker.update(msg.topic, msg.payload)
+            return
+        delay = None
+        if ep.role == "nemo":
+            self.correlator.on_inbound(msg.topic, msg.payload, msg.retain, ep.tool_id_offset, ep.label)
+        elif ep.role == "esp32":
+            delay = self.correlator.on_outbound(msg.topic, msg.payload, msg.retain)
+        self.log_message(ep, msg)
+        if delay is not None and self.mode == "log":
+            print(f"                    ⏱️  Forwarded {delay * 1000:.1f} ms after NEMO event")
     
-    def on_message_1884(self, client, userdata, msg):
-        """Message callback for NEMO port"""
-        self.log_message("NEMO", msg, str(self.mqtt_port))
+    def check_forwarding(self):
+        """Flag NEMO events the server has not forwarded within the correlator timeout"""
+        for topic in self.correlator.expire():
+            line = f"⚠️  Not forwarded within {self.correlator.timeout:.0f}s: {topic}"
+            if self.mode == "tail":
+                self.renderer.add(line)
+            elif self.mode == "log":
+                print(line)
     
-    def log_message(self, source, msg, port):
+    def record(self, source, msg, key):
+        """Update aggregated state for one message (cheap; no terminal I/O)"""
+        now = time.time()
+        size = len(msg.payload)
+        with self._lock:
+            self.message_count += 1
+            self.topic_stats.add(msg.topic)
+            self.port_stats[key] += 1
+            self.traffic.record(key, msg.topic, size, now)
+            latest = self.latest
+            latest[msg.topic] = (now, source, size, msg.payload[:LATEST_PREVIEW_BYTES])
+            latest.move_to_end(msg.topic)
+            if len(latest) > LATEST_MAX_TOPICS:
+                latest.popitem(last=False)
+    
+    def snapshot(self, top_n=10):
+        """Consistent copy of aggregated state for renderers"""
+        with self._lock:
+            return {
+                "message_count": self.message_count,
+                "port_stats": dict(self.port_stats),
+                "top_topics": [(topic, count) for topic, count, _err in self.topic_stats.top(top_n)],
+                "latest": list(reversed(self.latest.items())),
+                "traffic": self.traffic.snapshot(time.time()),
+            }
+    
+    def export_stats(self):
+        """Aggregated state for export: counts, rates, sizes, top topics, broker and forwarding"""
+        snap = self.snapshot()
+        forwarding = self.correlator.snapshot()
+        forwarding.pop("recent_unforwarded")
+        return {
+            "runtime_s": round((datetime.now() - self.start_time).total_seconds(), 1),
+            "message_count": snap["message_count"],
+            "port_stats": snap["port_stats"],
+            "top_topics": dict(snap["top_topics"]),
+            "traffic": snap["traffic"],
+            "broker": self.broker.snapshot(),
+            "broker_log": dict(self.log_tailer.counts),
+            "forwarding": forwarding,
+            "export_dropped": self.exporter.dropped if self.exporter else 0,
+        }
+    
+    def log_message(self, ep, msg):
         """Log and analyze incoming messages"""
-        self.message_count += 1
-        self.topic_stats[msg.topic] += 1
-        self.port_stats[port] += 1
+        source, port = ep.label, ep.key
+        self.record(source, msg, port)
+        
+        if self.mode == "dashboard":
+            return
+        if self.mode == "export":
+            self.exporter.add_message(time.time(), source, port, msg.topic, msg.qos, msg.retain, msg.payload)
+            return
+        if self.mode == "tail":
+            if mqtt.topic_matches_sub(self.tail_filter, msg.topic):
+                timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
+                preview = msg.payload[:120].decode('utf-8', errors='replace').replace("\n", " ")
+                self.renderer.add(f"[{timestamp}] [{source:>6}] {msg.topic} ({len(msg.payload)}B) {preview}")
+            return
         
         timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
         
-        # Determine direction based on topic and port
-        if port == str(self.mqtt_port_esp32):
+        # Determine direction based on topic and endpoint role
+        if ep.role == "esp32":
             if "esp32" in msg.topic.lower():
                 direction = "📤 TO ESP32"
             else:
                 direction = "📥 FROM ESP32"
-        else:
+        elif ep.role == "nemo":
             direction = "📥 RECEIVED"
+        else:
+            direction = "📡 OBSERVED"
         
         # Format message based on content
         try:
@@ -130,65 +281,6 @@ class ComprehensiveMQTTMonitor:
         print(f"Messages: {self.message_count} total")
         print("=" * 80)
     
-    def print_broker_status(self):
-        """Print broker status information"""
-        print("\n🖥️  BROKER STATUS:")
-        
-        # Check if mosquitto is running
-        try:
-            result = os.popen("pgrep -f 'mosquitto.*mqtt/config/mosquitto.conf'").read().strip()
-            if result:
-                print(f"  🟢 Broker: RUNNING (PID: {result})")
-            else:
-                print("  🔴 Broker: NOT RUNNING")
-        except:
-            print("  ❓ Broker: Status unknown")
-        
-        # Check port status
-        print("\n🔌 PORT STATUS:")
-        ports_to_check = [
-            (str(self.mqtt_port_esp32), "ESP32s"),
-            (str(self.mqtt_port), "NEMO")
-        ]
-        
-        for port, name in ports_to_check:
-            try:
-                result = os.popen(f"lsof -i :{port}").read().strip()
-                if result:
-                    print(f"  🟢 {port} ({name}): LISTENING")
-                else:
-                    print(f"  🔴 {port} ({name}): NOT LISTENING")
-            except:
-                print(f"  ❓ {port} ({name}): Status unknown")
-    
-    def print_message_stats(self):
-        """Print message statistics"""
-        print(f"\n📊 MESSAGE STATISTICS:")
-        print(f"  Total Messages: {self.message_count}")
-        print(f"  Port {self.mqtt_port_esp32} (ESP32s): {self.port_stats[str(self.mqtt_port_esp32)]}")
-        print(f"  Port {self.mqtt_port} (NEMO): {self.port_stats[str(self.mqtt_port)]}")
-        
-        if self.topic_stats:
-            print(f"\n📈 TOP TOPICS:")
-            sorted_topics = sorted(self.topic_stats.items(), key=lambda x: x[1], reverse=True)
-            for topic, count in sorted_topics[:10]:  # Top 10 topics
-                print(f"  {topic}: {count} messages")
-    
-    def print_recent_activity(self):
-        """Print recent log activity"""
-        print(f"\n📝 RECENT ACTIVITY:")
-        log_file = "mqtt/log/mosquitto.log"
-        if os.path.exists(log_file):
-            try:
-                with open(log_file, 'r') as f:
-                    lines = f.readlines()
-                    for line in lines[-3:]:  # Last 3 lines
-                        print(f"  {line.strip()}")
-            except:
-                print("  ❌ Could not read log file")
-        else:
-            print("  📝 No log file found")
-    
     def start_monitoring(self):
         """Start the comprehensive monitoring"""
         self.print_status_header()
@@ -205,69 +297,59 @@ class ComprehensiveMQTTMonitor:
         print("Press Ctrl+C to stop")
         print("=" * 80)
         
-        # Create clients for ports 1883 (ESP32s) and NEMO port from config
-        client_1883 = mqtt.Client()
-        client_1884 = mqtt.Client()
+        if self.exporter:
+            print(f"Exporting {self.exporter.fmt} to {self.exporter.path} every {self.export_interval:g}s"
+                  f"{' (with messages)' if self.exporter.include_messages else ''}")
+            self.exporter.start()
         
-        # Set up callbacks for port 1883
-        client_1883.on_connect = self.on_connect_1883
-        client_1883.on_message = self.on_message_1883
-        client_1883.on_subscribe = self.on_subscribe_1883
+        if self.mode == "tail":
+            # Created before connecting: messages can arrive as soon as the loops start
+            print(f"Tail filter: {self.tail_filter}")
+            self.renderer = TailPrinter(fps=max(self.fps, 10.0))
+            self.renderer.start()
+        
+        print(f"\n✅ Monitoring {len(self.endpoints)} endpoint(s) from one event loop:")
+        for ep in self.endpoints:
+            print(f"   {ep.key}: {ep!r}")
+        print("=" * 80)
         
-        # Set up callbacks for NEMO port
-        client_1884.on_connect = self.on_connect_1884
-        client_1884.on_message = self.on_message_1884
+        if self.mode == "dashboard":
+            self.renderer = DashboardRenderer(self, fps=self.fps)
+            self.renderer.start()
         
+        self.loop = MultiBrokerLoop(self.endpoints, self.on_endpoint_connect, self.on_endpoint_message,
+                                    self.on_endpoint_disconnect)
+        self._last_export = time.monotonic()
         try:
-            # Connect to ESP32 port
-            print(f"Connecting to {self.mqtt_broker}:{self.mqtt_port_esp32} (ESP32s)...")
-            client_1883.connect(self.mqtt_broker, self.mqtt_port_esp32, 60)
-            
-            if self.mqtt_username and self.mqtt_password:
-                client_1884.username_pw_set(self.mqtt_username, self.mqtt_password)
-            print(f"Connecting to {self.mqtt_broker}:{self.mqtt_port} (NEMO)...")
-            client_1884.connect(self.mqtt_broker, self.mqtt_port, 60)
-            
-            # Start loops for all ports
-            thread_1883 = threading.Thread(target=client_1883.loop_forever)
-            thread_1883.daemon = True
-            thread_1883.start()
-            
-            thread_1884 = threading.Thread(target=client_1884.loop_forever)
-            thread_1884.daemon = True
-            thread_1884.start()
-            
-            print(f"\n✅ Monitoring ports:")
-            print(f"   📥 Port {self.mqtt_port} - Receiving from NEMO")
-            print(f"   📤 Port {self.mqtt_port_esp32} - Publishing to ESP32s")
-            print("=" * 80)
-            
-            # Main monitoring loop
-            # last_status_update = time.time()
-            while self.running:
-                # current_time = time.time()
-                
-                # Update status every 30 seconds - DISABLED
-                # if current_time - last_status_update > 30:
-                #     self.print_status_header()
-                #     self.print_broker_status()
-                #     self.print_message_stats()
-                #     self.print_recent_activity()
-                #     print(f"\n🔄 Refreshing in 30 seconds... (Ctrl+C to stop)")
-                #     last_status_update = current_time
-                
-                time.sleep(1)
-                
+            # Blocks until stopped; periodic work runs on the same thread between network events
+            self.loop.run(tick=self.periodic, tick_interval=1.0)
         except KeyboardInterrupt:
             print(f"\n\n🛑 Monitoring stopped by user")
         except Exception as e:
             print(f"❌ Error: {e}")
         finally:
+            if self.renderer:
+                self.renderer.stop()
+            if self.exporter:
+                self.exporter.add_stats(time.time(), self.export_stats())
+                self.exporter.stop()
             self.print_final_stats()
-            if client_1883:
-                client_1883.disconnect()
-            if client_1884:
-                client_1884.disconnect()
+            self.log_tailer.close()
+    
+    def periodic(self):
+        """Once-a-second housekeeping, called from the event loop"""
+        self.log_tailer.poll()
+        self.check_forwarding()
+        if self.exporter and time.monotonic() - self._last_export >= self.export_interval:
+            self.exporter.add_stats(time.time(), self.export_stats())
+            self._last_export = time.monotonic()
+        if not self.running:
+            self.loop.stop()
+    
+    @staticmethod
+    def format_count(count, err):
+        """Format a heavy-hitters count; estimates show their maximum overcount"""
+        return f"{count}" if err == 0 else f"~{count} (≤{err} over)"
     
     def print_final_stats(self):
         """Print final statistics"""
@@ -275,23 +357,71 @@ class ComprehensiveMQTTMonitor:
         print("📊 FINAL STATISTICS")
         print("=" * 80)
         print(f"Total Messages Monitored: {self.message_count}")
-        print(f"Port {self.mqtt_port_esp32} (ESP32s): {self.port_stats[str(self.mqtt_port_esp32)]}")
-        print(f"Port {self.mqtt_port} (NEMO): {self.port_stats[str(self.mqtt_port)]}")
+        for port, name in self.port_names.items():
+            print(f"Port {port} ({name}): {self.port_stats[port]}")
         print(f"Runtime: {datetime.now() - self.start_time}")
         
         if self.topic_stats:
             print(f"\nTop Topics:")
-            sorted_topics = sorted(self.topic_stats.items(), key=lambda x: x[1], reverse=True)
-            for topic, count in sorted_topics[:5]:
-                print(f"  {topic}: {count} messages")
+            for topic, count, err in self.topic_stats.top(5):
+                print(f"  {topic}: {self.format_count(count, err)} messages")
         
+        print(f"\nForwarding: {self.correlator.summary()}")
         print("=" * 80)
 
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Comprehensive MQTT Monitor")
+    parser.add_argument("--mode", choices=MODES, default="log",
+                        help="log: every message in full (default); dashboard: one screen redrawn "
+                             "at --fps; tail: one line per message matching --filter")
+    parser.add_argument("--fps", type=float, default=2.0, help="Dashboard redraws per second (default 2)")
+    parser.add_argument("--filter", dest="tail_filter", default="#",
+                        help="MQTT topic filter for tail mode, e.g. 'nemo/esp32/+/status' (default '#')")
+    parser.add_argument("--topk-capacity", type=int, default=TOPK_CAPACITY,
+                        help=f"Topics tracked for top-topic statistics (fixed memory, default {TOPK_CAPACITY})")
+    parser.add_argument("--exact", action="append", default=[], metavar="FILTER",
+                        help="MQTT topic filter to count exactly (repeatable), e.g. 'nemo/server/#'")
+    parser.add_argument("--log-file", default=MOSQUITTO_LOG,
+                        help=f"Mosquitto log to follow for connect/disconnect events (default {MOSQUITTO_LOG})")
+    parser.add_argument("--endpoint", action="append", default=[], metavar="NAME=URL",
+                        help="Broker/listener to watch (repeatable) instead of the two from config.env, e.g. "
+                             "'site2=ws://10.0.0.5:9001/mqtt?sub=nemo/%%23&role=esp32&sys=1'. Schemes: mqtt, ws; "
+                             "role: nemo (server input) or esp32 (server output); offset: a nemo endpoint's tool id offset")
+    parser.add_argument("--export-file", default="-",
+                        help="Export mode output file; '-' (default) writes JSONL to stdout and the "
+                             "human-readable output to stderr")
+    parser.add_argument("--export-format", choices=EXPORT_FORMATS, default="jsonl",
+                        help="jsonl (default) or csv (stats in long form; messages in <file>.messages.csv)")
+    parser.add_argument("--export-interval", type=float, default=10.0,
+                        help="Seconds between exported stats records (default 10)")
+    parser.add_argument("--export-messages", action="store_true",
+                        help="Also export every message, not just periodic stats")
+    return parser.parse_args(argv)
+
 def main():
     """Main entry point"""
-    print("Starting Comprehensive MQTT Monitor...")
-    monitor = ComprehensiveMQTTMonitor()
-    monitor.start_monitoring()
+    args = parse_args()
+    try:
+        endpoints = [parse_endpoint(spec) for spec in args.endpoint]
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(2)
+    exporter = None
+    if args.mode == "export":
+        try:
+            exporter = ExportWriter(args.export_file, args.export_format, include_messages=args.export_messages)
+        except ValueError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            sys.exit(2)
+    # Keep stdout clean for machine-readable output in export mode
+    with contextlib.redirect_stdout(sys.stderr) if exporter else contextlib.nullcontext():
+        print("Starting Comprehensive MQTT Monitor...")
+        monitor = ComprehensiveMQTTMonitor(mode=args.mode, fps=args.fps, tail_filter=args.tail_filter,
+                                           topk_capacity=args.topk_capacity, exact_topics=args.exact,
+                                           log_file=args.log_file, exporter=exporter,
+                                           export_interval=args.export_interval, endpoints=endpoints)
+        monitor.start_monitoring()
 
 if __name__ == "__main__":
     main()
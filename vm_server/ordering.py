@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Per-tool event ordering for the NEMO Tool Display VM server
+NEMO events can arrive late or twice (QoS 1 redelivery, reconnects, several
+sources). Before an event changes a tool's state it is checked against the last
+applied one: older usage sessions (usage_id), timestamps behind the current
+state and exact duplicates are dropped and counted instead of overwriting newer
+state on the displays
+"""
+
+import threading
+from typing import Dict, Optional
+
+# Within the reorder window, events are treated as simultaneous and the more
+# specific one wins: a tool can go enabled -> in use -> ended -> disabled in one instant
+PRECEDENCE = {"enabled": 0, "idle": 0, "end": 1, "start": 2, "disabled": 3}
+USAGE_EVENTS = ("start", "end")
+
+APPLY = "apply"
+DUPLICATE = "duplicate"
+STALE_USAGE = "stale_usage"
+STALE_TIME = "stale_time"
+SUPERSEDED = "superseded"
+
+
+class ToolOrder:
+    """Last applied event of one tool and the newest usage session seen"""
+
+    __slots__ = ("event", "event_time", "usage_id", "usage_event")
+
+    def __init__(self):
+        self.event: Optional[str] = None
+        self.event_time: Optional[float] = None
+        self.usage_id: Optional[int] = None
+        self.usage_event: Optional[str] = None  # start or end, for usage_id
+
+
+def _usage_id(value) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class EventOrderGuard:
+    """Decides per tool whether an event is newer than the state already applied.
+
+    ``check()`` returns APPLY (and records the event) or the reason it was dropped:
+    - STALE_USAGE: start/end of an older usage session, or a start after its own end
+    - DUPLICATE: a usage's start/end seen again, or the same event and timestamp as the last one
+    - STALE_TIME: timestamp more than ``window`` seconds behind the last applied event
+    - SUPERSEDED: within the window but lower precedence than the last applied event
+    Events without a timestamp are only checked by usage_id.
+    """
+
+    def __init__(self, window: float = 2.0):
+        self.window = window
+        self.tools: Dict[str, ToolOrder] = {}
+        self._lock = threading.Lock()
+        self.stats = {APPLY: 0, DUPLICATE: 0, STALE_USAGE: 0, STALE_TIME: 0, SUPERSEDED: 0}
+
+    def _verdict(self, last: ToolOrder, event: str, event_time: Optional[float], usage_id: Optional[int]) -> str:
+        if event in USAGE_EVENTS and usage_id is not None and last.usage_id is not None:
+            if usage_id < last.usage_id:
+                return STALE_USAGE
+            if usage_id > last.usage_id:
+                return APPLY  # a newer session wins whatever the clocks say
+            if event == "start" and last.usage_event == "end":
+                return STALE_USAGE
+            if event == last.usage_event:
+                return DUPLICATE
+        if event_time is None or last.event_time is None:
+            return APPLY
+        if event == last.event and event_time == last.event_time:
+            return DUPLICATE
+        if event_time >= last.event_time:
+            return APPLY
+        if last.event_time - event_time > self.window:
+            return STALE_TIME
+        return APPLY if PRECEDENCE.get(event, 0) > PRECEDENCE.get(last.event, 0) else SUPERSEDED
+
+    def check(self, tool_id, event: str, event_time: Optional[float] = None, usage_id=None) -> str:
+        usage_id = _usage_id(usage_id) if event in USAGE_EVENTS else None
+        with self._lock:
+            last = self.tools.get(str(tool_id))
+            if last is None:
+                last = self.tools[str(tool_id)] = ToolOrder()
+                verdict = APPLY
+            else:
+                verdict = self._verdict(last, event, event_time, usage_id)
+            self.stats[verdict] += 1
+            if verdict != APPLY:
+                return verdict
+            last.event = event
+            if event_time is not None:
+                # Never move backwards: a winning simultaneous event keeps the later timestamp
+                last.event_time = event_time if last.event_time is None else max(last.event_time, event_time)
+            if usage_id is not None:
+                last.usage_id = usage_id
+                last.usage_event = event
+        return APPLY
+
+    def dropped(self) -> int:
+        with self._lock:
+            return sum(count for verdict, count in self.stats.items() if verdict != APPLY)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snap = dict(self.stats)
+        snap["tools"] = len(self.tools)
+        return snap
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Outbound flow control for the NEMO Tool Display VM server
+Publishes to the ESP32 broker within an inflight window matching mosquitto's
+max_inflight_messages, keeps failed publishes in a bounded retry queue (optionally
+spilling to an on-disk spool) and drains them at a controlled rate on recovery
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import paho.mqtt.client as mqtt
+
+import codec
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Return codes that mean "try again later" rather than "this publish is invalid"
+RETRYABLE_RC = (
+    mqtt.MQTT_ERR_AGAIN,
+    mqtt.MQTT_ERR_NO_CONN,
+    mqtt.MQTT_ERR_CONN_LOST,
+    mqtt.MQTT_ERR_QUEUE_SIZE,
+)
+
+SPOOL_FILENAME = "outbound.spool"
+# An ack that beats publish() back is claimed within microseconds; older entries are leftovers
+EARLY_ACK_TTL_SECONDS = 30.0
+
+
+class OutboundPublisher:
+    """Windowed publisher with retry queue and optional disk spool.
+
+    The retry queue is keyed by topic: every ESP32 topic carries retained state, so only
+    the newest payload per topic needs to survive an outage. When the queue is full the
+    oldest entry is spilled to the spool (if configured) or dropped and counted.
+    """
+
+    def __init__(
+        self,
+        max_inflight: int = 20,
+        retry_queue_size: int = 500,
+        spool_dir: Optional[str] = None,
+        drain_rate: float = 20,
+    ):
+        self.max_inflight = max_inflight
+        self.retry_queue_size = retry_queue_size
+        self.spool_path = os.path.join(spool_dir, SPOOL_FILENAME) if spool_dir else None
+        self.drain_bucket = TokenBucket(drain_rate, max(drain_rate, 1.0))
+
+        self.client = None
+        self._inflight = set()
+        self._sending = 0  # window slots reserved by QoS>0 publish() calls in progress
+        self._acked_early = OrderedDict()  # mid -> time.monotonic() of an ack that beat publish() back
+        self._retry = OrderedDict()  # topic -> (payload, qos, retain)
+        self._spool_count = 0
+        self._spool_topics = set()
+        self._spool_stale = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+        self.stats = {
+            "published": 0,
+            "acked": 0,
+            "queued_for_retry": 0,
+            "coalesced": 0,
+            "retried": 0,
+            "spooled": 0,
+            "unspooled": 0,
+            "dropped": 0,
+            "failed": 0,
+        }
+
+        if self.spool_path:
+            os.makedirs(spool_dir, exist_ok=True)
+            self._spool_count, self._spool_topics = self._scan_spool()
+            if self._spool_count:
+                logger.info(f"📦 Outbound spool has {self._spool_count} pending message(s) from a previous run")
+
+    def attach(self, client: mqtt.Client):
+        """Use ``client`` for publishing and cap paho's own queue at the window size"""
+        self.client = client
+        client.max_inflight_messages_set(self.max_inflight)
+        # paho counts queued + inflight against this limit; beyond it publish() returns
+        # MQTT_ERR_QUEUE_SIZE and the message is held here instead
+        client.max_queued_messages_set(self.max_inflight)
+
+    # ----- publishing -----
+
+    def publish(self, topic: str, payload: str, qos: int = 1, retain: bool = True) -> bool:
+        """Publish now if the window allows, otherwise queue for retry.
+
+        Returns True if the message was handed to the MQTT client, False if it was
+        queued for retry (or dropped, when no retry capacity is left).
+        """
+        with self._cond:
+            if self._retry or self._spool_count or not self._window_open():
+                self._enqueue(topic, payload, qos, retain)
+                return False
+            self._reserve(qos)
+        return self._send(topic, payload, qos, retain)
+
+    def _window_open(self) -> bool:
+        return (
+            self.client is not None
+            and self.client.is_connected()
+            and len(self._inflight) + self._sending < self.max_inflight
+        )
+
+    def _reserve(self, qos: int):
+        """Claim a window slot for a QoS>0 send (caller holds the lock and checked the window),
+        so concurrent publishers cannot all pass the check before any of them is in flight"""
+        if qos > 0:
+            self._sending += 1
+
+    def _send(self, topic: str, payload: str, qos: int, retain: bool) -> bool:
+        """Hand one message to paho; the caller has reserved its slot with _reserve()"""
+        try:
+            result = self.client.publish(topic, payload, qos=qos, retain=retain)
+        except Exception as e:
+            logger.error(f"❌ Publish to {topic} raised: {e}")
+            result = None
+
+        with self._cond:
+            if qos > 0:
+                self._sending -= 1
+            if result is not None and result.rc in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+                # NO_CONN: paho keeps QoS>0 messages and resends them after reconnect
+                self.stats["published"] += 1
+                acked_early = self._acked_early.pop(result.mid, None) is not None
+                if qos > 0 and not acked_early:
+                    self._inflight.add(result.mid)
+                return result.rc == mqtt.MQTT_ERR_SUCCESS
+
+            if result is None or result.rc in RETRYABLE_RC:
+                self._enqueue(topic, payload, qos, retain)
+            else:
+                self.stats["failed"] += 1
+                logger.error(f"❌ Publish to {topic} failed permanently: rc={result.rc}")
+            return False
+
+    def _enqueue(self, topic: str, payload: str, qos: int, retain: bool):
+        """Add to the retry queue (caller holds the lock)"""
+        if topic in self._retry:
+            self.stats["coalesced"] += 1
+            del self._retry[topic]
+        elif len(self._retry) >= self.retry_queue_size:
+            old_topic, old_entry = self._retry.popitem(last=False)
+            if self.spool_path and self._spool_append(old_topic, *old_entry):
+                self.stats["spooled"] += 1
+            else:
+                self.stats["dropped"] += 1
+                logger.warning(f"⚠️ Outbound retry queue full, dropped update for {old_topic}")
+        if topic in self._spool_topics:
+            # The spooled copy is older than this one and must not be replayed
+            self._spool_stale.add(topic)
+        self._retry[topic] = (payload, qos, retain)
+        self.stats["queued_for_retry"] += 1
+        self._cond.notify()
+
+    # ----- paho callbacks -----
+
+    def on_publish(self, mid: int):
+        """Call from the client's on_publish: frees a window slot"""
+        with self._cond:
+            if mid in self._inflight:
+                self._inflight.discard(mid)
+            elif self._sending:
+                # Possibly acked before a QoS>0 publish() returned its mid; _send claims it.
+                # Otherwise a QoS 0 publish or one made outside this class: nothing to free
+                now = time.monotonic()
+                while self._acked_early and now - next(iter(self._acked_early.values())) > EARLY_ACK_TTL_SECONDS:
+                    self._acked_early.popitem(last=False)
+                self._acked_early[mid] = now
+            self.stats["acked"] += 1
+            self._cond.notify()
+
+    def on_connect(self):
+        """Call from the client's on_connect: wakes the drainer"""
+        with self._cond:
+            self._cond.notify()
+
+    # ----- disk spool -----
+
+    def _spool_append(self, topic: str, payload: str, qos: int, retain: bool) -> bool:
+        try:
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                f.write(codec.dumps({"topic": topic, "payload": payload, "qos": qos, "retain": retain}) + "\n")
+        except OSError as e:
+            logger.error(f"❌ Could not write outbound spool {self.spool_path}: {e}")
+            return False
+        self._spool_count += 1
+        self._spool_topics.add(topic)
+        self._spool_stale.discard(topic)
+        return True
+
+    def _scan_spool(self):
+        count, topics = 0, set()
+        try:
+            with open(self.spool_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        topics.add(codec.loads(line)["topic"])
+                        count += 1
+                    except (ValueError, KeyError):
+                        continue
+        except FileNotFoundError:
+            pass
+        return count, topics
+
+    def _load_spool(self):
+        """Move spooled records back into the retry queue (caller holds the lock).
+
+        Only called when the retry queue is empty. At most retry_queue_size topics are
+        loaded, oldest first; the rest are written back to the spool for the next load.
+        """
+        latest = OrderedDict()
+        try:
+            with open(self.spool_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = codec.loads(line)
+                    except ValueError:
+                        continue
+                    topic = rec.get("topic")
+                    if not topic or topic in self._spool_stale:
+                        continue
+                    latest.pop(topic, None)
+                    latest[topic] = (rec.get("payload", ""), rec.get("qos", 1), rec.get("retain", True))
+            os.remove(self.spool_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"❌ Could not read outbound spool {self.spool_path}: {e}")
+            return
+        self._spool_count = 0
+        self._spool_topics.clear()
+        self._spool_stale.clear()
+        loaded = 0
+        for topic, entry in latest.items():
+            if topic in self._retry:
+                continue  # a newer update is already queued
+            if len(self._retry) < self.retry_queue_size:
+                self._retry[topic] = entry
+                loaded += 1
+            elif not self._spool_append(topic, *entry):
+                self.stats["dropped"] += 1
+        self.stats["unspooled"] += loaded
+        if loaded:
+            logger.info(f"📦 Loaded {loaded} message(s) from outbound spool, {self._spool_count} left")
+
+    # ----- drain worker -----
+
+    def _run(self):
+        while self._running:
+            with self._cond:
+                while self._running and not (
+                    (self._retry or self._spool_count) and self._window_open()
+                ):
+                    self._cond.wait(1.0)
+                if not self._running:
+                    return
+                if not self._retry:
+                    self._load_spool()
+                    if not self._retry:
+                        continue
+            self.drain_bucket.acquire()
+            with self._cond:
+                if not self._retry or not self._window_open():
+                    continue
+                topic, (payload, qos, retain) = self._retry.popitem(last=False)
+                self.stats["retried"] += 1
+                self._reserve(qos)
+            if self._send(topic, payload, qos, retain) and not self._retry and not self._spool_count:
+                logger.info("✅ Outbound retry queue drained")
+
+    def start(self):
+        """Start the drain worker thread"""
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="outbound-drain", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        """Stop the drain worker; the retry queue is spilled to the spool if configured"""
+        with self._cond:
+            self._running = False
+            if self.spool_path:
+                while self._retry:
+                    topic, entry = self._retry.popitem(last=False)
+                    if self._spool_append(topic, *entry):
+                        self.stats["spooled"] += 1
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def snapshot(self) -> dict:
+        """Copy of counters plus current window/queue sizes"""
+        with self._cond:
+            snap = dict(self.stats)
+            snap["inflight"] = len(self._inflight)
+            snap["retry_queue"] = len(self._retry)
+            snap["spool"] = self._spool_count
+        return snap
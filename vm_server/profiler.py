@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+On-demand sampling profiler for the NEMO Tool Display VM server
+Samples the stacks of every thread (asyncio, admission worker, paho network
+threads, ...) for a bounded time and writes them as collapsed stacks, the input
+format of flamegraph.pl and speedscope. Nothing runs while no profile is active
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Deepest stack recorded per sample; deeper frames are cut at the root end
+MAX_STACK_DEPTH = 128
+
+
+class SamplingProfiler:
+    """Wall-clock sampler over sys._current_frames().
+
+    ``start(seconds)`` launches one background thread that takes a sample every
+    ``interval`` seconds until the duration ends, then writes
+    ``<output_dir>/profile-<timestamp>.folded`` with one line per distinct stack:
+    ``thread;outer_func (file:line);...;inner_func (file:line) count``.
+    Only one profile runs at a time.
+    """
+
+    def __init__(self, output_dir: str = "profiles", interval: float = 0.005, max_seconds: float = 300):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.last_path: Optional[str] = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._labels: Dict[object, str] = {}  # code object -> frame label
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, reason: str = "request") -> bool:
+        """Begin a profile of ``seconds`` (capped at max_seconds); False if one is already running"""
+        seconds = min(max(seconds, self.interval), self.max_seconds)
+        with self._lock:
+            if self.running():
+                logger.warning(f"🔬 Profile requested ({reason}) but one is already running")
+                return False
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(seconds,), name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"🔬 Profiling all threads for {seconds:g}s every {self.interval * 1000:g} ms ({reason})")
+        return True
+
+    def stop(self):
+        """End a running profile early (its samples are still written)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _run(self, seconds: float):
+        own_ident = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        started = time.monotonic()
+        deadline = started + seconds
+        next_sample = started
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(stack))] += 1
+            samples += 1
+            # Fixed schedule; if sampling fell behind, skip ahead rather than burst
+            next_sample = max(next_sample + self.interval, time.monotonic())
+            self._stop.wait(next_sample - time.monotonic())
+        elapsed = time.monotonic() - started
+        self._labels.clear()
+        try:
+            path = self._write(stacks)
+        except OSError as e:
+            logger.error(f"❌ Could not write profile to {self.output_dir}: {e}")
+            return
+        self.last_path = path
+        logger.info(f"🔬 Profile done: {samples} samples in {elapsed:.1f}s, {len(stacks)} distinct stacks -> {path}")
+        for leaf, count in self._top_leaves(stacks, 5):
+            logger.info(f"   {count * 100 / max(sum(stacks.values()), 1):5.1f}%  {leaf}")
+
+    def _write(self, stacks: Counter) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    @staticmethod
+    def _top_leaves(stacks: Counter, n: int):
+        """Innermost frames by sample count (idle waits included, since this is wall-clock time)"""
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(n)
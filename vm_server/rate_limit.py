@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Rate limiting primitives for the NEMO Tool Display VM server
+Token buckets shared by ingest admission, outbound draining and resync pacing
+"""
+
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Thread-safe token bucket.
+
+    Holds up to ``burst`` tokens and refills at ``rate`` tokens per second.
+    A rate of 0 (or less) disables limiting: every acquire succeeds immediately.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1.0))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take tokens if available; never blocks"""
+        if self.unlimited:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def delay_until_available(self, tokens: float = 1.0) -> float:
+        """Seconds until ``tokens`` can be taken (0.0 if available now)"""
+        if self.unlimited:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            missing = tokens - self._tokens
+            return missing / self.rate if missing > 0 else 0.0
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """Block until tokens are taken or ``timeout`` seconds pass"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.try_acquire(tokens):
+                return True
+            wait = self.delay_until_available(tokens)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(max(wait, 0.001))
+
+    def set_rate(self, rate: float, burst: Optional[float] = None):
+        """Change rate/burst in place (used by config reload)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+            self.burst = float(burst if burst is not None else max(rate, 1.0))
+            self._tokens = min(self._tokens, self.burst)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Full-state resync for the NEMO Tool Display VM server
+Republishes the last known state of every ESP32 topic after the ESP32 broker
+connection comes back, paced by a token bucket so the broker is not flooded.
+Each topic's payload is read when it is sent, so updates published during a
+resync are never overwritten by an older copy
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class ResyncEngine:
+    """Paced republish of the current state of a list of topics.
+
+    ``publish`` is called as ``publish(topic, payload, qos=1, retain=True)`` (normally
+    OutboundPublisher.publish). ``lock`` guards the state the ``current`` getter reads;
+    each payload is read and published while holding it, so a writer that publishes
+    under the same lock is never overtaken by an older payload. A new trigger cancels
+    a resync that is still running.
+    """
+
+    def __init__(self, publish, rate: float = 50, burst: Optional[float] = None,
+                 lock: Optional[threading.Lock] = None):
+        self.publish = publish
+        self.state_lock = lock if lock is not None else threading.Lock()
+        self.bucket = TokenBucket(rate, burst if burst is not None else min(rate, 10))
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.stats = {
+            "runs": 0,
+            "cancelled": 0,
+            "published": 0,
+            "last_count": 0,
+            "last_duration_s": 0.0,
+        }
+
+    def trigger(self, topics: Iterable[str], current: Callable[[str], Optional[str]], reason: str = "reconnect"):
+        """Start republishing ``topics`` in the background; ``current(topic)`` gives the payload
+        to send (read at send time; None skips the topic)"""
+        topics = list(topics)
+        if not topics:
+            logger.info(f"🔁 Resync ({reason}): no known state to republish")
+            return
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            self._thread = threading.Thread(
+                target=self._run, args=(generation, topics, current, reason), name="esp32-resync", daemon=True
+            )
+            self._thread.start()
+
+    def cancel(self):
+        """Stop any running resync"""
+        with self._lock:
+            self._generation += 1
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self, generation: int, topics: list, current: Callable[[str], Optional[str]], reason: str):
+        started = time.monotonic()
+        count = 0
+        logger.info(f"🔁 Resync ({reason}): republishing {len(topics)} topic(s)")
+        for topic in topics:
+            self.bucket.acquire()
+            if generation != self._generation:
+                self.stats["cancelled"] += 1
+                logger.info(f"🔁 Resync ({reason}) superseded after {count}/{len(topics)} topic(s)")
+                return
+            try:
+                with self.state_lock:
+                    payload = current(topic)
+                    if payload is None:
+                        continue
+                    self.publish(topic, payload, qos=1, retain=True)
+                count += 1
+            except Exception as e:
+                logger.error(f"❌ Resync publish to {topic} failed: {e}")
+        duration = time.monotonic() - started
+        self.stats["runs"] += 1
+        self.stats["published"] += count
+        self.stats["last_count"] = count
+        self.stats["last_duration_s"] = duration
+        logger.info(f"✅ Resync ({reason}) complete: {count} topic(s) in {duration:.2f}s")
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Upstream NEMO sources for the NEMO Tool Display VM server
+One server can subscribe to several NEMO brokers (e.g. one per cleanroom). Each
+source has its own connection, credentials, HMAC key and tool-id offset, feeds
+the shared admission queue and keeps its own throughput and lag metrics
+"""
+
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from hmac_keyring import HmacKeyring
+from metrics import LogHistogram, SlidingWindow
+
+DEFAULT_SOURCE = "default"
+SOURCE_NAME = re.compile(r"^[A-Za-z0-9_]+$")
+
+# Rate windows reported per source (seconds)
+RATE_WINDOWS = (10, 60)
+
+
+def source_configs(env, config: dict) -> List[dict]:
+    """Extra sources from NEMO_SOURCES=name1,name2 and NEMO_SOURCE_<NAME>_* settings.
+
+    Broker, credentials and HMAC key fall back to the top-level MQTT_* values so a
+    source only has to state what differs; the port defaults to 1886. A source that
+    inherits MQTT_HMAC_KEY also inherits MQTT_HMAC_KEY_PREVIOUS, so a rotation covers it.
+    Every source needs its own positive TOOL_ID_OFFSET: the default source publishes
+    its tool ids unchanged, so sources must not share an offset (including 0).
+    """
+    names = [n.strip() for n in env.get('NEMO_SOURCES', '').split(',') if n.strip()]
+    sources = []
+    for name in names:
+        if not SOURCE_NAME.match(name):
+            raise ValueError(f"NEMO_SOURCES: '{name}' may only contain letters, digits and _")
+        if name.lower() == DEFAULT_SOURCE or any(s['name'].lower() == name.lower() for s in sources):
+            raise ValueError(f"NEMO_SOURCES: '{name}' is reserved or listed twice")
+        prefix = f"NEMO_SOURCE_{name.upper()}_"
+        source = {
+            'name': name,
+            'broker': env.get(prefix + 'BROKER', config['mqtt_broker']),
+            'port': int(env.get(prefix + 'PORT', '1886')),
+            'username': env.get(prefix + 'USERNAME', config['mqtt_username']),
+            'password': env.get(prefix + 'PASSWORD', config['mqtt_password']),
+            'hmac_key': env.get(prefix + 'HMAC_KEY', config['mqtt_hmac_key']),
+            'hmac_key_previous': env.get(prefix + 'HMAC_KEY_PREVIOUS',
+                                         '' if prefix + 'HMAC_KEY' in env else config['mqtt_hmac_key_previous']),
+            'tool_id_offset': int(env.get(prefix + 'TOOL_ID_OFFSET', '0')),
+        }
+        if not 0 < source['port'] < 65536:
+            raise ValueError(f"{prefix}PORT must be between 1 and 65535")
+        if source['tool_id_offset'] <= 0:
+            raise ValueError(f"{prefix}TOOL_ID_OFFSET must be set to a positive number "
+                             f"so its tool ids do not collide with the default source")
+        if any(s['tool_id_offset'] == source['tool_id_offset'] for s in sources):
+            raise ValueError(f"{prefix}TOOL_ID_OFFSET {source['tool_id_offset']} is used by another source")
+        sources.append(source)
+    return sources
+
+
+def map_tool_id(tool_id, tool_id_offset: int, source_name: str):
+    """Move a source-local tool id into the shared ESP32 topic space (shared with the monitor)"""
+    if not tool_id_offset:
+        return tool_id
+    try:
+        return int(tool_id) + tool_id_offset
+    except (TypeError, ValueError):
+        return f"{source_name}-{tool_id}"
+
+
+def event_age_seconds(tool_data: dict, event_type: Optional[str]) -> Optional[float]:
+    """Seconds between the NEMO event time in the payload and now (None when absent or unparsable)"""
+    key = {"start": "start_time", "end": "end_time"}.get(event_type, "timestamp")
+    value = tool_data.get(key) or tool_data.get("timestamp")
+    if not isinstance(value, str):
+        return None
+    try:
+        when = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - when).total_seconds()
+
+
+class NemoSource:
+    """One upstream NEMO broker and its metrics.
+
+    ``keyring`` is None for the default source, which uses the server's own keyring
+    (so MQTT_HMAC_KEY rotation on reload keeps working); named sources get their own.
+    """
+
+    def __init__(self, name: str, broker: str, port: int, username: str = "", password: str = "",
+                 keyring: Optional[HmacKeyring] = None, tool_id_offset: int = 0):
+        self.name = name
+        self.broker = broker
+        self.port = port
+        self.username = username
+        self.password = password
+        self.keyring = keyring
+        self.tool_id_offset = tool_id_offset
+        self.client = None
+        self._lock = threading.Lock()
+        self._window = SlidingWindow(max(RATE_WINDOWS) + 1)
+        self._ingest_lag_us = LogHistogram()  # arrival -> processed
+        self._event_age_ms = LogHistogram()  # NEMO event timestamp -> processed
+        self.stats = {"received": 0, "bytes": 0, "processed": 0, "rejected": 0, "shed": 0}
+
+    @classmethod
+    def from_config(cls, source: dict) -> "NemoSource":
+        previous = source['hmac_key_previous']
+        return cls(
+            source['name'], source['broker'], source['port'], source['username'], source['password'],
+            keyring=HmacKeyring(source['hmac_key'], [(previous, None)] if previous else []),
+            tool_id_offset=source['tool_id_offset'],
+        )
+
+    @property
+    def is_default(self) -> bool:
+        return self.name == DEFAULT_SOURCE
+
+    def map_tool_id(self, tool_id):
+        """Move a source-local tool id into the shared ESP32 topic space"""
+        return map_tool_id(tool_id, self.tool_id_offset, self.name)
+
+    # ----- metrics (paho thread and admission worker) -----
+
+    def record_received(self, size: int):
+        with self._lock:
+            self.stats["received"] += 1
+            self.stats["bytes"] += size
+            self._window.add(size, time.time())
+
+    def record_shed(self):
+        """One message from this source shed by admission control (including ones replaced in the queue)"""
+        with self._lock:
+            self.stats["shed"] += 1
+
+    def record_processed(self, received_at: Optional[float]):
+        """``received_at`` is the time.monotonic() arrival time"""
+        with self._lock:
+            self.stats["processed"] += 1
+            if received_at is not None:
+                self._ingest_lag_us.add(int((time.monotonic() - received_at) * 1_000_000))
+
+    def record_event_age(self, event_age: Optional[float]):
+        """Seconds since the NEMO event timestamp (clock skew can make it slightly negative)"""
+        if event_age is None:
+            return
+        with self._lock:
+            self._event_age_ms.add(int(max(event_age, 0.0) * 1000))
+
+    def record_rejected(self):
+        with self._lock:
+            self.stats["rejected"] += 1
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        with self._lock:
+            snap = dict(self.stats)
+            for window in RATE_WINDOWS:
+                msgs, nbytes = self._window.totals(window, now)
+                snap[f"msgs_per_s_{window}s"] = round(msgs / window, 2)
+                snap[f"bytes_per_s_{window}s"] = round(nbytes / window, 1)
+            lag, age = self._ingest_lag_us, self._event_age_ms
+            snap["ingest_lag_ms"] = {
+                "p50": lag.percentile(50) / 1000, "p99": lag.percentile(99) / 1000, "max": lag.max / 1000,
+            }
+            snap["event_age_s"] = {
+                "p50": age.percentile(50) / 1000, "p99": age.percentile(99) / 1000, "max": age.max / 1000,
+            }
+        snap["connected"] = self.client is not None and self.client.is_connected()
+        return snap
+
+    def summary(self) -> str:
+        snap = self.snapshot()
+        lag = snap["ingest_lag_ms"]
+        return (f"{self.name} {'up' if snap['connected'] else 'DOWN'} {snap['msgs_per_s_60s']:.2f} msg/s, "
+                f"lag p50 {lag['p50']:.1f}/p99 {lag['p99']:.1f} ms, event age p99 {snap['event_age_s']['p99']:.1f}s, "
+                f"{snap['rejected']} rejected, {snap['shed']} shed")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Pre-serialized status payloads for the NEMO Tool Display VM server
+Most of a tool's nemo/esp32/<tool_id>/status payload is fixed per tool and state
+(event_type, in_use, labels, tool_name). Those parts are serialized once per tool
+into template fragments; a publish only encodes the timestamp and user name and
+joins the pieces. The output is byte-identical to codec.dumps of the full message
+(compact UTF-8 JSON), so status and overall payloads share one encoding
+"""
+
+import threading
+from json.encoder import encode_basestring
+from typing import Dict, Tuple
+
+import codec
+
+ESP32_ACTIVE = "active"
+ESP32_ENABLED = "enabled"
+ESP32_DISABLED = "disabled"
+# state -> (time_label, user_label): active = "User", idle/disabled = "Last User"
+STATE_LABELS = {
+    ESP32_ACTIVE: ("Enabled Since", "User"),
+    ESP32_ENABLED: ("Enabled Since", "Last User"),
+    ESP32_DISABLED: ("Disabled Since", "Last User"),
+}
+
+
+def status_message(event_type: str, timestamp: str, user_name: str, tool_name: str) -> dict:
+    """The status message as a dict (field order is the wire order)"""
+    time_label, user_label = STATE_LABELS[event_type]
+    return {
+        "event_type": event_type,
+        "in_use": event_type == ESP32_ACTIVE,
+        "timestamp": timestamp,
+        "time_label": time_label,
+        "user_label": user_label,
+        "user_name": user_name,
+        "tool_name": tool_name,
+    }
+
+
+class ToolTemplate:
+    """Topic and per-state payload fragments of one tool"""
+
+    __slots__ = ("tool_name", "topic", "fragments")
+
+    def __init__(self, tool_id, tool_name: str):
+        self.tool_name = tool_name
+        self.topic = f"nemo/esp32/{tool_id}/status"
+        tail = ',"tool_name":' + codec.dumps(tool_name) + "}"
+        # state -> (head before timestamp, middle before user_name, tail)
+        self.fragments: Dict[str, Tuple[str, str, str]] = {}
+        for state, (time_label, user_label) in STATE_LABELS.items():
+            head = ('{"event_type":' + encode_basestring(state)
+                    + ',"in_use":' + ("true" if state == ESP32_ACTIVE else "false") + ',"timestamp":')
+            middle = (',"time_label":' + encode_basestring(time_label)
+                      + ',"user_label":' + encode_basestring(user_label) + ',"user_name":')
+            self.fragments[state] = (head, middle, tail)
+
+
+class StatusTemplates:
+    """Per-tool status templates, rebuilt when a tool's name changes and dropped by clear()"""
+
+    def __init__(self):
+        self._templates: Dict[str, ToolTemplate] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "built": 0, "cleared": 0}
+
+    def render(self, tool_id, tool_name: str, event_type: str, timestamp: str, user_name: str) -> Tuple[str, str]:
+        """(topic, payload JSON) for one status update"""
+        key = str(tool_id)
+        template = self._templates.get(key)
+        if template is None or template.tool_name != tool_name:
+            template = ToolTemplate(tool_id, tool_name)
+            with self._lock:
+                self._templates[key] = template
+                self.stats["built"] += 1
+        else:
+            self.stats["hits"] += 1
+        head, middle, tail = template.fragments[event_type]
+        return template.topic, (head + encode_basestring(str(timestamp)) + middle
+                                + encode_basestring(str(user_name)) + tail)
+
+    def clear(self):
+        """Forget every template (config reload)"""
+        with self._lock:
+            self._templates.clear()
+            self.stats["cleared"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snap = dict(self.stats)
+            snap["tools"] = len(self._templates)
+        return snap
@@ -10,7 +10,10 @@ import paho.mqtt.client as mqtt
 import os
 from dotenv import load_dotenv
 
+import codec
+
 load_dotenv()
+codec.use(os.getenv('JSON_CODEC', 'auto').strip().lower() or 'auto')
 
 class MQTTTester:
     def __init__(self):
@@ -35,7 +38,7 @@ class MQTTTester:
     def on_message(self, client, userdata, msg):
         topic = msg.topic
         try:
-            payload = json.loads(msg.payload.decode())
+            payload = codec.loads(msg.payload.decode())
             self.received_messages.append((topic, payload))
             print(f"📨 Received on {topic}: {json.dumps(payload, indent=2)}")
         except json.JSONDecodeError:
@@ -85,7 +88,7 @@ class MQTTTester:
             }
         }
         
-        result = self.client.publish(test_topic, json.dumps(test_payload), qos=1, retain=True)
+        result = self.client.publish(test_topic, codec.dumps(test_payload), qos=1, retain=True)
         if result.rc == mqtt.MQTT_ERR_SUCCESS:
             print(f"📤 Published test message to {test_topic}")
             return True
@@ -104,7 +107,7 @@ class MQTTTester:
             "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
         }
         
-        result = self.client.publish(test_topic, json.dumps(test_payload), qos=1, retain=True)
+        result = self.client.publish(test_topic, codec.dumps(test_payload), qos=1, retain=True)
         if result.rc == mqtt.MQTT_ERR_SUCCESS:
             print(f"📤 Published overall test message to {test_topic}")
             return True
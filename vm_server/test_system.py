@@ -4,11 +4,15 @@ NEMO Tool Display - Comprehensive System Test
 Consolidated test script for all system components
 """
 
+import asyncio
 import json
+import os
+import threading
 import time
 import socket
 import subprocess
 import sys
+import tempfile
 from datetime import datetime, timedelta
 from paho.mqtt import client as mqtt_client
 from config_parser import get_esp32_port, get_nemo_port, get_mqtt_broker
@@ -38,6 +42,14 @@ def print_warning(text):
 def print_info(text):
     print(f"{Colors.CYAN}ℹ {text}{Colors.NC}")
 
+def check(condition, description):
+    """Print one check result and return it"""
+    if condition:
+        print_success(description)
+    else:
+        print_error(description)
+    return bool(condition)
+
 def check_port_listening(port):
     """Check if a port is listening"""
     try:
@@ -266,8 +278,831 @@ def test_system_processes():
     
     return all_running
 
-def run_all_tests():
-    """Run all system tests"""
+IMPORT_TIME_BUDGET_SECONDS = 0.5
+
+def test_import_time():
+    """Test that main.py and config_parser.py import quickly and without side effects"""
+    print_header("Import Time Test")
+    
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    code = (
+        "import sys, time\n"
+        f"sys.path.insert(0, {script_dir!r})\n"
+        "t = time.perf_counter()\n"
+        "import config_parser, main\n"
+        "print(time.perf_counter() - t)\n"
+    )
+    # Run from an empty directory so any file the import creates is easy to spot
+    with tempfile.TemporaryDirectory() as tmp:
+        result = subprocess.run([sys.executable, '-c', code], cwd=tmp, capture_output=True, text=True)
+        created = os.listdir(tmp)
+    
+    if result.returncode != 0:
+        print_error(f"Import failed: {result.stderr.strip()}")
+        return False
+    
+    elapsed = float(result.stdout.strip().splitlines()[-1])
+    ok = True
+    if elapsed <= IMPORT_TIME_BUDGET_SECONDS:
+        print_success(f"Import took {elapsed * 1000:.0f} ms (budget {IMPORT_TIME_BUDGET_SECONDS * 1000:.0f} ms)")
+    else:
+        print_error(f"Import took {elapsed * 1000:.0f} ms (budget {IMPORT_TIME_BUDGET_SECONDS * 1000:.0f} ms)")
+        ok = False
+    if created:
+        print_error(f"Import created files: {', '.join(created)}")
+        ok = False
+    else:
+        print_success("Import created no files")
+    return ok
+
+FORWARD_PATH_BUDGET_SECONDS = 1.0
+
+def test_forward_path_inprocess():
+    """Test NEMO -> server -> ESP32 forwarding end to end against the in-process broker"""
+    print_header("Hermetic Forward Path Test")
+    
+    from inproc_broker import InProcessBroker
+    from hmac_keyring import sign_payload
+    import codec
+    import main
+    
+    hmac_key = "hermetic-test-key"
+    users = {"nemo": "secret"}
+    started = time.perf_counter()
+    broker = InProcessBroker(users=users, allow_anonymous=False)
+    esp32_port, nemo_port = broker.start([0, 0])
+    history_dir = tempfile.TemporaryDirectory()
+    config = main.load_config({
+        'MQTT_BROKER': '127.0.0.1',
+        'MQTT_PORT_ESP32': str(esp32_port),
+        'MQTT_PORT': str(nemo_port),
+        'MQTT_USERNAME': 'nemo',
+        'MQTT_PASSWORD': 'secret',
+        'MQTT_HMAC_KEY': hmac_key,
+        'BOOTSTRAP_WINDOW_SECONDS': '0',
+        'HISTORY_DIR': history_dir.name,
+    })
+    server = main.NEMOToolServer(config)
+    loop = asyncio.new_event_loop()
+    statuses = []
+    got_status = threading.Event()
+    suppressed = []
+    got_suppressed = threading.Event()
+    
+    def on_message(client, userdata, msg):
+        if msg.topic == "nemo/esp32/42/status":
+            statuses.append(codec.loads(msg.payload))
+            got_status.set()
+        elif msg.topic == "nemo/server/suppressed/42":
+            suppressed.append(codec.loads(msg.payload))
+            got_suppressed.set()
+    
+    display = mqtt_client.Client("hermetic-display")
+    display.username_pw_set("nemo", "secret")
+    display.on_message = on_message
+    nemo = mqtt_client.Client("hermetic-nemo")
+    nemo.username_pw_set("nemo", "secret")
+    try:
+        loop.run_until_complete(server.init_mqtt())
+        if not broker.wait_for_subscription("nemo/tools/+/+"):
+            print_error("Server did not subscribe to nemo/tools/+/+")
+            return False
+        
+        display.connect("127.0.0.1", esp32_port, 60)
+        display.subscribe([("nemo/esp32/+/status", 1), ("nemo/server/suppressed/+", 0)])
+        display.loop_start()
+        nemo.connect("127.0.0.1", nemo_port, 60)
+        nemo.loop_start()
+        if not broker.wait_for_subscription("nemo/esp32/+/status"):
+            print_error("Display client did not subscribe")
+            return False
+        
+        event = {
+            "event": "tool_usage_start", "usage_id": 1, "user_id": 1,
+            "user_name": "Alex Denton (admin)", "tool_id": 42, "tool_name": "woollam",
+            "start_time": "2025-10-14T19:15:14.691967+00:00", "end_time": None,
+        }
+        # Unsigned copy first: must be rejected by HMAC verification, never forwarded
+        nemo.publish("nemo/tools/42/start", codec.dumps({**event, "user_name": "Mallory"}), qos=1)
+        # Signed body serialized like NEMO does (stdlib json); envelope through the server's codec
+        nemo.publish("nemo/tools/42/start", codec.dumps(sign_payload(hmac_key, json.dumps(event))), qos=1)
+        
+        if not got_status.wait(FORWARD_PATH_BUDGET_SECONDS):
+            print_error("No nemo/esp32/42/status received")
+            return False
+        elapsed = time.perf_counter() - started
+        status = statuses[-1]
+        
+        ok = True
+        expected = {"event_type": "active", "in_use": True, "user_name": "Alex Denton", "tool_name": "woollam"}
+        for key, value in expected.items():
+            if status.get(key) != value:
+                print_error(f"status[{key!r}] = {status.get(key)!r}, expected {value!r}")
+                ok = False
+        if any(s.get("user_name") == "Mallory" for s in statuses):
+            print_error("Unsigned event was forwarded")
+            ok = False
+        # History is appended right after the publish, so it may trail the status slightly
+        deadline = time.monotonic() + 1.0
+        recorded = server.history.query(tool_id=42)
+        while not recorded and time.monotonic() < deadline:
+            time.sleep(0.01)
+            recorded = server.history.query(tool_id=42)
+        if [(e.event, e.usage_id, e.user_name) for e in recorded] != [("start", 1, "Alex Denton (admin)")]:
+            print_error(f"History for tool 42 is {recorded}, expected the one signed start")
+            ok = False
+        # A redelivered copy is dropped by the ordering guard and reported with a suppressed marker
+        nemo.publish("nemo/tools/42/start", codec.dumps(sign_payload(hmac_key, json.dumps(event))), qos=1)
+        if not got_suppressed.wait(1.0) or suppressed[-1] != {"event_type": "active", "reason": "duplicate"}:
+            print_error(f"No suppressed marker for the duplicate start (got {suppressed})")
+            ok = False
+        if len(statuses) != 1:
+            print_error(f"Duplicate start republished the status ({len(statuses)} publishes)")
+            ok = False
+        if broker.retained_messages().get("nemo/server/status") != b"online":
+            print_error("nemo/server/status is not retained as online")
+            ok = False
+        if elapsed <= FORWARD_PATH_BUDGET_SECONDS:
+            print_success(f"Forward path completed in {elapsed * 1000:.0f} ms (budget {FORWARD_PATH_BUDGET_SECONDS * 1000:.0f} ms)")
+        else:
+            print_error(f"Forward path took {elapsed * 1000:.0f} ms (budget {FORWARD_PATH_BUDGET_SECONDS * 1000:.0f} ms)")
+            ok = False
+        if ok:
+            print_success("Signed start event forwarded; unsigned copy rejected")
+        return ok
+    finally:
+        for client in (display, nemo):
+            client.loop_stop()
+            client.disconnect()
+        loop.run_until_complete(server.cleanup())
+        loop.close()
+        broker.stop()
+        history_dir.cleanup()
+
+def test_admission_control():
+    """Test admission lanes, shedding policies and per-source shed accounting"""
+    print_header("Admission Control Test")
+    
+    from collections import Counter
+    from admission import AdmissionController
+    
+    shed_by_source = Counter()
+    handled = []
+    admission = AdmissionController(lambda topic, payload, source, received_at: handled.append((topic, payload)),
+                                    queue_size=3, tool_rate=0.001, tool_burst=1, on_shed=lambda source: shed_by_source.update([source]))
+    results = []
+    
+    # Same kind queued twice for a tool: replaced in place, but still counted as shed for its source
+    results.append(check(admission.offer("nemo/tools/1/enabled", b"old", "a")
+                         and admission.offer("nemo/tools/1/enabled", b"new", "a")
+                         and admission.depth() == 1, "Queued enabled replaced in place"))
+    # end is high priority: drops the queued enabled, and is never rate-shed despite the empty tool bucket
+    results.append(check(admission.offer("nemo/tools/1/end", b"end", "a") and admission.depth() == 1,
+                         "end admitted past the tool rate limit and supersedes the queued enabled"))
+    results.append(check(admission.offer("nemo/tools/1/enabled", b"late", "a") and admission.depth() == 2
+                         and admission.stats["deferred_tool_rate"] == 1, "Enabled over the tool rate is deferred, not shed"))
+    # Overflow sheds queued normal-lane messages, then deferred ones, never end/start/disabled
+    admission.offer("nemo/tools/2/enabled", b"2", "b")
+    admission.offer("nemo/tools/3/enabled", b"3", "b")
+    admission.offer("nemo/tools/4/end", b"4", "b")
+    admission.offer("nemo/tools/5/start", b"5", "b")
+    results.append(check(admission.stats["shed_overflow"] == 3, "Overflow shed the queued and deferred enabled events"))
+    results.append(check(not admission.offer("nemo/tools/6/disabled", b"6", "b"),
+                         "Queue full of high-priority events rejects the newcomer"))
+    results.append(check(sum(shed_by_source.values()) == admission.shed_total()
+                         and shed_by_source == Counter({"a": 3, "b": 3}),
+                         f"Per-source shed counts {dict(shed_by_source)} add up to shed_total() {admission.shed_total()}"))
+    
+    admission.start()
+    deadline = time.monotonic() + 1.0
+    while len(handled) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    admission.stop()
+    results.append(check([topic for topic, _ in handled] == ["nemo/tools/1/end", "nemo/tools/4/end", "nemo/tools/5/start"],
+                         "Surviving high-priority events handled in arrival order"))
+    return all(results)
+
+def test_admission_tool_rate_burst():
+    """Test that the newest enabled of a burst past the tool rate still reaches the handler"""
+    print_header("Admission Tool Rate Burst Test")
+    
+    from admission import AdmissionController
+    
+    handled = []
+    admission = AdmissionController(lambda topic, payload, source, received_at: handled.append((topic, payload)),
+                                    tool_rate=20, tool_burst=2)
+    admission.offer("nemo/tools/1/disabled", b"d1", "a")
+    admission.offer("nemo/tools/1/enabled", b"e1", "a")
+    # Bucket now empty: disabled still goes through, the enableds after it wait for a token
+    admission.offer("nemo/tools/1/disabled", b"d2", "a")
+    accepted = [admission.offer("nemo/tools/1/enabled", f"e{i}".encode(), "a") for i in range(2, 6)]
+    depth = admission.depth()
+    
+    admission.start()
+    deadline = time.monotonic() + 2.0
+    while len(handled) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    admission.stop()
+    results = [
+        check(all(accepted) and depth == 3, "Enabled events past the tool rate kept as one deferred message"),
+        check(handled[1:] == [("nemo/tools/1/disabled", b"d2"), ("nemo/tools/1/enabled", b"e5")],
+              f"Display ends on the newest enabled: {handled}"),
+        check(admission.stats["shed_tool_rate"] == 0 and admission.snapshot()["queue_depth"] == 0,
+              "Nothing rate-shed and nothing left queued"),
+    ]
+    return all(results)
+
+class FakePublishClient:
+    """Stands in for the ESP32 paho client: records publishes, optionally acks inside publish()
+    or blocks in it until ``gate`` is set"""
+    
+    class Result:
+        def __init__(self, rc, mid):
+            self.rc = rc
+            self.mid = mid
+    
+    def __init__(self, connected=True):
+        self.connected = connected
+        self.publisher = None
+        self.ack_inline = False
+        self.gate = None
+        self.sent = []
+        self._mid = 0
+    
+    def is_connected(self):
+        return self.connected
+    
+    def max_inflight_messages_set(self, value):
+        pass
+    
+    def max_queued_messages_set(self, value):
+        pass
+    
+    def publish(self, topic, payload, qos=0, retain=False):
+        self._mid += 1
+        mid = self._mid
+        self.sent.append((topic, payload, qos))
+        if self.gate is not None:
+            self.gate.wait()
+        if self.ack_inline:
+            self.publisher.on_publish(mid)
+        return self.Result(0, mid)
+
+def test_outbound_publisher():
+    """Test the outbound inflight window, early acks, retry coalescing and spool bounds"""
+    print_header("Outbound Publisher Test")
+    
+    from outbound import OutboundPublisher
+    
+    results = []
+    client = FakePublishClient()
+    publisher = OutboundPublisher(max_inflight=2, retry_queue_size=10)
+    client.publisher = publisher
+    publisher.attach(client)
+    
+    sent = [publisher.publish(f"nemo/esp32/{i}/status", "x") for i in range(3)]
+    results.append(check(sent == [True, True, False] and publisher.snapshot()["inflight"] == 2,
+                         "Third QoS 1 publish waits for a window slot"))
+    publisher.on_publish(1)
+    results.append(check(publisher.snapshot()["inflight"] == 1, "Ack frees a window slot"))
+    publisher.on_publish(2)
+    
+    # QoS 0 acks (and acks for publishes made elsewhere) are never kept as early acks
+    publisher._retry.clear()
+    client.ack_inline = True
+    for _ in range(2000):
+        publisher.publish("nemo/server/stats/utilization", "{}", qos=0)
+    publisher.on_publish(65000)
+    results.append(check(not publisher._acked_early, "QoS 0 and unknown acks are not tracked"))
+    # A QoS 1 ack that arrives before publish() returns is claimed, not left in the window
+    publisher.publish("nemo/esp32/9/status", "x")
+    results.append(check(publisher.snapshot()["inflight"] == 0 and not publisher._acked_early,
+                         "Ack received inside publish() claimed by the publish"))
+    
+    # Publishers racing for the window: slots are reserved before paho is called, so only 3 get through
+    racing = FakePublishClient()
+    window = OutboundPublisher(max_inflight=3, retry_queue_size=20)
+    racing.publisher = window
+    racing.gate = threading.Event()
+    window.attach(racing)
+    threads = [threading.Thread(target=window.publish, args=(f"nemo/esp32/{i}/status", "x")) for i in range(10)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    entered = len(racing.sent)
+    racing.gate.set()
+    for thread in threads:
+        thread.join(2)
+    snap = window.snapshot()
+    results.append(check(entered == 3 and snap["inflight"] == 3 and snap["retry_queue"] == 7,
+                         f"Concurrent publishes stay within the window ({entered} sent, {snap['retry_queue']} queued)"))
+    
+    client.connected = False
+    publisher.publish("nemo/esp32/5/status", "old")
+    publisher.publish("nemo/esp32/5/status", "new")
+    snap = publisher.snapshot()
+    results.append(check(snap["retry_queue"] == 1 and snap["coalesced"] == 1 and publisher._retry["nemo/esp32/5/status"][0] == "new",
+                         "Updates to one topic coalesce in the retry queue"))
+    
+    with tempfile.TemporaryDirectory() as spool_dir:
+        offline = OutboundPublisher(retry_queue_size=2, spool_dir=spool_dir, drain_rate=1000)
+        offline.attach(FakePublishClient(connected=False))
+        for i in range(5):
+            offline.publish(f"nemo/esp32/{i}/status", str(i))
+        offline.stop()
+        results.append(check(offline.snapshot()["spool"] == 5, "Retry overflow and shutdown spill to the spool"))
+        
+        online = FakePublishClient()
+        restarted = OutboundPublisher(retry_queue_size=2, spool_dir=spool_dir, drain_rate=1000)
+        online.publisher = restarted
+        online.ack_inline = True
+        restarted.attach(online)
+        with restarted._cond:
+            restarted._load_spool()
+        snap = restarted.snapshot()
+        results.append(check(snap["retry_queue"] == 2 and snap["spool"] == 3,
+                             f"Spool load bounded by the retry queue ({snap['retry_queue']} queued, {snap['spool']} left)"))
+        restarted.start()
+        deadline = time.monotonic() + 2.0
+        while len(online.sent) < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        restarted.stop()
+        results.append(check(sorted(payload for _, payload, _ in online.sent) == ["0", "1", "2", "3", "4"],
+                             "Every spooled update drained after restart"))
+    return all(results)
+
+def test_resync_engine():
+    """Test that a resync sends each topic's current payload, not the one from when it started"""
+    print_header("Resync Engine Test")
+    
+    from resync import ResyncEngine
+    
+    state = {"nemo/esp32/1/status": "one", "nemo/esp32/2/status": "two-old", "nemo/esp32/3/status": "three"}
+    lock = threading.Lock()
+    published = []
+    
+    def publish(topic, payload, qos=1, retain=True):
+        published.append((topic, payload))
+        if topic == "nemo/esp32/1/status":
+            # A status update lands while the resync is running (the server publishes it itself)
+            state["nemo/esp32/2/status"] = "two-new"
+            published.append(("nemo/esp32/2/status", "two-new"))
+            del state["nemo/esp32/3/status"]
+    
+    engine = ResyncEngine(publish, rate=1000, burst=1, lock=lock)
+    with lock:
+        topics = list(state)
+    engine.trigger(topics, state.get, reason="test")
+    deadline = time.monotonic() + 1.0
+    while engine.running() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    
+    results = [
+        check(("nemo/esp32/2/status", "two-old") not in published,
+              "Topic updated mid-resync is republished with its current payload"),
+        check(published[-1] == ("nemo/esp32/2/status", "two-new"), "Newest payload is the last one sent"),
+        check(all(topic != "nemo/esp32/3/status" for topic, _ in published), "Topic forgotten mid-resync is skipped"),
+        check(engine.stats["runs"] == 1 and engine.stats["last_count"] == 2, "Resync counted two republished topics"),
+    ]
+    return all(results)
+
+def test_forwarding_correlator():
+    """Test the monitor's forwarding correlator with suppressed markers and tool id offsets"""
+    print_header("Forwarding Correlator Test")
+    
+    import codec
+    from monitor_correlator import ForwardingCorrelator
+    
+    correlator = ForwardingCorrelator(timeout=0.0)
+    status = lambda event_type: codec.dumps({"event_type": event_type})
+    
+    correlator.on_inbound("nemo/tools/1/end", codec.dumps({"tool_id": 1}))
+    end_delay = correlator.on_outbound("nemo/esp32/1/status", status("enabled"))
+    # enabled after end changes nothing on the display: the server sends a marker instead of a status
+    correlator.on_inbound("nemo/tools/1/enabled", codec.dumps({"tool_id": 1}))
+    correlator.on_outbound("nemo/server/suppressed/1", codec.dumps({"event_type": "enabled", "reason": "unchanged"}))
+    # Tool 42 of a source with offset 1000 is published as tool 1042
+    correlator.on_inbound("nemo/tools/42/start", codec.dumps({"tool_id": 42}), tool_id_offset=1000, source_name="fab2")
+    offset_delay = correlator.on_outbound("nemo/esp32/1042/status", status("active"))
+    time.sleep(0.001)
+    clean = correlator.expire()
+    correlator.on_inbound("nemo/tools/5/disabled", codec.dumps({"tool_id": 5}))
+    time.sleep(0.001)
+    lost = correlator.expire()
+    
+    snap = correlator.snapshot()
+    results = [
+        check(end_delay is not None and offset_delay is not None and snap["matched"] == 2,
+              "Status publishes matched, including one for an offset tool id"),
+        check(snap["suppressed"] == 1, "Suppressed marker matched the unchanged enabled event"),
+        check(clean == [], "No normal traffic reported as unforwarded"),
+        check(lost == ["nemo/tools/5/disabled"] and snap["unforwarded"] == 1, "Event with no publish or marker reported"),
+    ]
+    return all(results)
+
+def test_event_ordering():
+    """Test EventOrderGuard verdicts and that events without a NEMO timestamp are never dropped by time"""
+    print_header("Event Ordering Test")
+    
+    import main
+    from ordering import APPLY, DUPLICATE, STALE_TIME, STALE_USAGE, SUPERSEDED, EventOrderGuard, ToolOrder
+    
+    guard = EventOrderGuard(window=2.0)
+    
+    def last(event, event_time, usage_id=None, usage_event=None):
+        order = ToolOrder()
+        order.event, order.event_time, order.usage_id, order.usage_event = event, event_time, usage_id, usage_event
+        return order
+    
+    started = last("start", 1000.0, usage_id=7, usage_event="start")
+    cases = [
+        ("duplicate start of the same usage", started, ("start", 1000.0, 7), DUPLICATE),
+        ("start of an older usage", started, ("start", 1500.0, 6), STALE_USAGE),
+        ("start after its own end", last("end", 1100.0, 7, "end"), ("start", 1000.0, 7), STALE_USAGE),
+        ("newer usage despite an older clock", started, ("start", 10.0, 8), APPLY),
+        ("same event and timestamp again", last("disabled", 1000.0), ("disabled", 1000.0, None), DUPLICATE),
+        ("stale beyond the window", last("disabled", 1000.0), ("enabled", 990.0, None), STALE_TIME),
+        ("lower precedence within the window", last("disabled", 1000.0), ("enabled", 999.0, None), SUPERSEDED),
+        ("higher precedence within the window", last("enabled", 1000.0), ("disabled", 999.0, None), APPLY),
+        ("event without a timestamp", last("disabled", 1000.0), ("enabled", None, None), APPLY),
+        ("no timestamp applied before", last("enabled", None), ("disabled", 10.0, None), APPLY),
+    ]
+    results = []
+    for name, state, (event, event_time, usage_id), expected in cases:
+        verdict = guard._verdict(state, event, event_time, usage_id)
+        results.append(check(verdict == expected, f"{name}: {verdict} (expected {expected})"))
+    
+    # NEMO's clock runs an hour ahead of the VM: a disabled without a timestamp must still apply
+    server = main.NEMOToolServer(main.load_config({'HISTORY_DIR': '', 'MQTT_HMAC_KEY': ''}))
+    ahead = (datetime.utcnow() + timedelta(hours=1)).isoformat() + "+00:00"
+    server.process_tool_status("3", {"tool_id": 3, "tool_name": "asher", "usage_id": 1, "user_name": "A B",
+                                     "start_time": ahead}, "start")
+    server.process_tool_status("3", {"tool_id": 3, "tool_name": "asher"}, "disabled")
+    status = json.loads(server.esp32_state.get("nemo/esp32/3/status", "{}"))
+    results.append(check(status.get("event_type") == "disabled",
+                         "disabled without a NEMO timestamp applied despite clock skew"))
+    return all(results)
+
+def test_load_generator_ordering():
+    """Test that generated load traffic is applied by the server's ordering guard, not dropped"""
+    print_header("Load Generator Ordering Test")
+    
+    import random
+    from load_generator import ToolSimulator
+    from ordering import APPLY, EventOrderGuard
+    
+    rng = random.Random(7)
+    tools = [ToolSimulator(9000 + i, rng) for i in range(20)]
+    guard = EventOrderGuard(2.0)
+    total = 2000
+    for _ in range(total):
+        tool = rng.choice(tools)
+        event_type, payload = tool.next_event()
+        key = {"start": "start_time", "end": "end_time"}.get(event_type, "timestamp")
+        event_time = datetime.fromisoformat(payload[key]).timestamp()
+        guard.check(tool.tool_id, event_type, event_time, payload.get("usage_id"))
+    
+    applied = guard.stats[APPLY]
+    return check(applied >= 0.99 * total,
+                 f"{applied}/{total} generated events applied by EventOrderGuard ({guard.snapshot()})")
+
+def test_admin_topics():
+    """Test that admin topics cannot start a profile or trace dump without a valid HMAC"""
+    print_header("Admin Topic Auth Test")
+    
+    import codec
+    import main
+    from hmac_keyring import sign_payload
+    from tracing import NULL_TRACE
+    
+    results = []
+    for hmac_key in ("", "admin-test-key"):
+        server = main.NEMOToolServer(main.load_config({'MQTT_HMAC_KEY': hmac_key, 'HISTORY_DIR': ''}))
+        source = server.sources[0]
+        label = "with an HMAC key" if hmac_key else "without an HMAC key"
+        for topic in main.ADMIN_TOPICS:
+            accepted = server._handle_nemo_message(topic, b'{"seconds": 1}', NULL_TRACE, source)
+            results.append(check(not accepted, f"Unsigned {topic} rejected {label}"))
+        results.append(check(not server.profiler.running() and not server.trace_dump_requested,
+                             f"Nothing started by unsigned admin messages {label}"))
+        if hmac_key:
+            signed = codec.dumps(sign_payload(hmac_key, json.dumps({})))
+            accepted = server._handle_nemo_message(main.ADMIN_TRACE_TOPIC, signed.encode(), NULL_TRACE, source)
+            results.append(check(accepted and server.trace_dump_requested, "Signed trace request accepted"))
+    return all(results)
+
+def test_payload_encoding():
+    """Test that status templates and codec.dumps give the same bytes with every installed backend"""
+    print_header("Payload Encoding Test")
+    
+    import codec
+    from templates import STATE_LABELS, StatusTemplates, status_message
+    
+    names = ["Alex Denton", "José Müller", 'Quote "Q" \\ Slash/', "Tab\tNew\nline", "😀 Emoji"]
+    results = []
+    previous = codec.backend
+    try:
+        for backend in codec.available():
+            codec.use(backend)
+            templates = StatusTemplates()
+            mismatches = [
+                (state, name) for state in STATE_LABELS for name in names
+                if templates.render(1, name, state, "Oct 14, 12:15 PM", name)[1]
+                != codec.dumps(status_message(state, "Oct 14, 12:15 PM", name, name))
+            ]
+            results.append(check(not mismatches, f"{backend}: status templates match codec.dumps" + (f" (differ: {mismatches})" if mismatches else "")))
+            results.append(check(codec.dumps({"user_name": "José"}) == '{"user_name":"José"}',
+                                 f"{backend}: compact UTF-8 output"))
+    finally:
+        codec.use(previous)
+    return all(results)
+
+def test_fleet_registry():
+    """Test display presence, reconnects, delivered vs applied digests and staleness"""
+    print_header("Fleet Registry Test")
+    
+    from types import SimpleNamespace
+    from fleet import FleetRegistry, payload_digest
+    
+    fleet = FleetRegistry(stale_after=60.0)
+    client = "nemo_display_a"
+    first = fleet.on_presence(client, b'{"state": "online", "tool_id": 5}', now=1000.0)
+    fleet.record_delivery("nemo/esp32/5/status", '{"event_type":"idle"}', now=1001.0)
+    fleet.on_heartbeat(client, json.dumps({"tool_id": 5, "applied": payload_digest('{"event_type":"idle"}')}).encode(), now=1002.0)
+    in_sync = fleet.get(client).in_sync()
+    fleet.record_delivery("nemo/esp32/5/status", '{"event_type":"active"}', now=1003.0)
+    out_of_sync = fleet.snapshot()["out_of_sync"]
+    fleet.on_presence(client, b"offline", now=1004.0)
+    offline = fleet.get(client).online
+    back = fleet.on_heartbeat(client, b'{"tool_id": 5}', now=1005.0)
+    ignored = fleet.on_broker_event(SimpleNamespace(client="other_client", kind="connect", timestamp=1005.0))
+    stale_early = fleet.expire(now=1060.0)
+    stale = fleet.expire(now=1066.0)
+    
+    snap = fleet.snapshot()
+    results = [
+        check(first and fleet.displays_for_tool(5) == [client], "Online presence announced the display for tool 5"),
+        check(in_sync is True and out_of_sync == 1, "Applied digest compared with the last delivered status"),
+        check(offline is False and back is True and snap["reconnects"] == 1,
+              "Heartbeat after the LWT counted as a reconnect"),
+        check(not ignored and snap["known"] == 1, "Broker events of non-display clients ignored"),
+        check(stale_early == [] and stale == [client] and snap["went_stale"] == 1 and snap["online"] == 0,
+              "Display marked stale only after stale_after seconds of silence"),
+        check(fleet.tools_without_display([5, 6]) == ["6"], "Tools without a display listed"),
+    ]
+    return all(results)
+
+def test_nemo_sources():
+    """Test NEMO_SOURCES parsing, tool id mapping and per-source counters"""
+    print_header("NEMO Sources Test")
+    
+    from hmac_keyring import sign_payload
+    from sources import NemoSource, map_tool_id, source_configs
+    
+    config = {'mqtt_broker': 'nemo.local', 'mqtt_username': 'user', 'mqtt_password': 'pw',
+              'mqtt_hmac_key': 'main-key', 'mqtt_hmac_key_previous': 'main-old'}
+    env = {'NEMO_SOURCES': 'fab2,annex', 'NEMO_SOURCE_FAB2_PORT': '1887', 'NEMO_SOURCE_FAB2_TOOL_ID_OFFSET': '1000',
+           'NEMO_SOURCE_FAB2_HMAC_KEY': 'fab2-key', 'NEMO_SOURCE_ANNEX_TOOL_ID_OFFSET': '2000'}
+    configs = source_configs(env, config)
+    results = [
+        check(len(configs) == 2 and configs[0]['broker'] == 'nemo.local' and configs[0]['port'] == 1887
+              and configs[0]['username'] == 'user' and configs[0]['tool_id_offset'] == 1000,
+              "Source settings parsed with MQTT_* fallbacks"),
+        check(configs[0]['hmac_key_previous'] == '' and configs[1]['hmac_key'] == 'main-key'
+              and configs[1]['hmac_key_previous'] == 'main-old',
+              "Previous HMAC key inherited only together with MQTT_HMAC_KEY"),
+        check(source_configs({}, config) == [], "No NEMO_SOURCES means no extra sources"),
+    ]
+    invalid = {
+        "invalid name": {'NEMO_SOURCES': 'fab-2'},
+        "reserved name": {'NEMO_SOURCES': 'default'},
+        "duplicate name": {'NEMO_SOURCES': 'fab2,FAB2'},
+        "port out of range": {'NEMO_SOURCES': 'fab2', 'NEMO_SOURCE_FAB2_PORT': '70000'},
+        "negative offset": {'NEMO_SOURCES': 'fab2', 'NEMO_SOURCE_FAB2_TOOL_ID_OFFSET': '-1'},
+        "no offset": {'NEMO_SOURCES': 'fab2'},
+        "shared offset": {'NEMO_SOURCES': 'fab2,annex', 'NEMO_SOURCE_FAB2_TOOL_ID_OFFSET': '1000',
+                          'NEMO_SOURCE_ANNEX_TOOL_ID_OFFSET': '1000'},
+    }
+    for name, bad_env in invalid.items():
+        try:
+            source_configs(bad_env, config)
+            rejected = False
+        except ValueError:
+            rejected = True
+        results.append(check(rejected, f"NEMO_SOURCES with {name} rejected"))
+    
+    source = NemoSource.from_config(configs[0])
+    signed = sign_payload('fab2-key', '{"tool_id": 42}')
+    foreign = sign_payload('main-key', '{"tool_id": 42}')
+    results += [
+        check(source.map_tool_id(42) == 1042 and source.map_tool_id("42") == 1042, "Numeric tool id offset"),
+        check(source.map_tool_id("litho") == "fab2-litho", "Non-numeric tool id prefixed with the source name"),
+        check(map_tool_id("7", 0, "default") == "7", "Offset 0 leaves the tool id unchanged"),
+        check(source.keyring.verify(signed["payload"], signed["hmac"], signed["algo"], signed["kid"]) is not None
+              and source.keyring.verify(foreign["payload"], foreign["hmac"], foreign["algo"], foreign["kid"]) is None,
+              "Source keyring accepts only its own key"),
+    ]
+    for size in (10, 20, 30):
+        source.record_received(size)
+    source.record_shed()
+    source.record_rejected()
+    source.record_processed(time.monotonic())
+    snap = source.snapshot()
+    results.append(check((snap["received"], snap["bytes"], snap["shed"], snap["rejected"], snap["processed"])
+                         == (3, 60, 1, 1, 1) and snap["connected"] is False, "Per-source counters"))
+    return all(results)
+
+def test_utilization_tracker():
+    """Test utilization accrual per state, late events and that reports do not move counted time"""
+    print_header("Utilization Tracker Test")
+    
+    from utilization import UtilizationTracker
+    
+    tracker = UtilizationTracker()
+    base = 1_700_006_400.0  # midnight UTC
+    tracker.on_event(1, "enabled", when=base, now=base)
+    tracker.on_event(1, "start", when=base + 600, now=base + 600)
+    tracker.on_event(1, "end", when=base + 1800, now=base + 1800)
+    changed = tracker.on_event(1, "disabled", when=base + 3600, now=base + 3600)
+    report = tracker.tool_report(1, now=base + 5400, hours=2, days=1)
+    again = tracker.tool_report(1, now=base + 5400, hours=2, days=1)
+    since = tracker.tools["1"].since
+    unchanged = tracker.on_event(1, "disabled", when=base + 5400, now=base + 5400)
+    tracker.on_event(1, "enabled", when=base + 3000, now=base + 5400)
+    
+    results = [
+        check(changed and not unchanged, "on_event reports state changes only"),
+        check(report["hourly"] == [[1200, 2400, 0], [0, 0, 1800]], f"Hourly buckets: {report['hourly']}"),
+        check(report["last_24h"] == {"in_use": 1200, "idle": 2400, "disabled": 1800, "utilization": 0.333}
+              and report["today"] == report["last_24h"] and report["state"] == "disabled",
+              "Last 24h and today include the open disabled interval"),
+        check(report == again and since == base + 3600, "Reports do not move the counted time"),
+        check(tracker.stats["clamped"] == 1 and tracker.tools["1"].since == base + 5400,
+              "Event older than counted time clamped"),
+        check(tracker.tool_report(2) is None and tracker.summary_report(now=base + 5400)["tools"]["1"]["state"] == "idle",
+              "Summary covers known tools only"),
+    ]
+    
+    # A timezone change on reload rebuckets the counters from the history instead of keeping the old offset
+    import main
+    with tempfile.TemporaryDirectory() as history_dir:
+        settings = {'HISTORY_DIR': history_dir, 'MQTT_HMAC_KEY': '', 'TIMEZONE_OFFSET_HOURS': '-7'}
+        server = main.NEMOToolServer(main.load_config(settings))
+        started = (datetime.utcnow() - timedelta(minutes=90)).isoformat() + "+00:00"
+        server.process_tool_status("3", {"tool_id": 3, "tool_name": "asher", "usage_id": 1, "user_name": "A B",
+                                         "start_time": started}, "start")
+        server.apply_config(main.load_config(dict(settings, TIMEZONE_OFFSET_HOURS='2')))
+        rebuilt = server.utilization.tool_report(3)
+        server.history.close()
+    results.append(check(server.utilization.offset == 2 * 3600 and rebuilt is not None and rebuilt["state"] == "in_use"
+                         and abs(rebuilt["last_24h"]["in_use"] - 5400) <= 5,
+                         "Timezone reload rebucketed utilization from the history"))
+    return all(results)
+
+def test_status_templates():
+    """Test that status templates are reused, rebuilt on a tool rename and dropped by clear()"""
+    print_header("Status Templates Test")
+    
+    from templates import StatusTemplates
+    
+    templates = StatusTemplates()
+    topic, first = templates.render(4, "asher", "active", "Oct 14, 12:15 PM", "A B")
+    _, second = templates.render(4, "asher", "enabled", "Oct 14, 12:30 PM", "A B")
+    _, renamed = templates.render("4", "asher-2", "enabled", "Oct 14, 12:45 PM", "A B")
+    built_before_clear = templates.stats["built"]
+    templates.clear()
+    cleared = templates.snapshot()
+    templates.render(4, "asher-2", "enabled", "Oct 14, 12:45 PM", "A B")
+    
+    results = [
+        check(topic == "nemo/esp32/4/status", "Template topic is the tool's status topic"),
+        check(json.loads(first)["in_use"] is True and json.loads(second)["in_use"] is False,
+              "Per-state fragments rendered"),
+        check(json.loads(renamed)["tool_name"] == "asher-2" and built_before_clear == 2 and templates.stats["hits"] == 1,
+              "Template reused for the same name and rebuilt after a rename"),
+        check(cleared["tools"] == 0 and cleared["cleared"] == 1 and templates.stats["built"] == 3,
+              "clear() drops every template"),
+    ]
+    return all(results)
+
+def test_span_tracing():
+    """Test the span ring wrap-around, the per-stage summary and one envelope span per signed message"""
+    print_header("Span Tracing Test")
+    
+    import codec
+    import main
+    from collections import Counter
+    from hmac_keyring import sign_payload
+    from tracing import SpanRing, summarize
+    
+    ring = SpanRing(3)
+    for trace_id in range(1, 6):
+        ring.record((trace_id, "decode", trace_id * 1000, 1000, "nemo/tools/1/start"))
+    kept = sorted(span[0] for span in ring.snapshot())
+    
+    spans = [(1, "decode", 0, 2_000_000, "nemo/tools/1/start"), (1, "hmac", 2_000_000, 6_000_000, "nemo/tools/1/start"),
+             (1, "total", 0, 8_000_000, "nemo/tools/1/start"), (2, "decode", 0, 1_000_000, "nemo/tools/2/end"),
+             (2, "log", 1_000_000, 500_000, "nemo/tools/2/end"), (2, "log", 1_500_000, 500_000, "nemo/tools/2/end"),
+             (2, "total", 0, 2_000_000, "nemo/tools/2/end")]
+    lines = summarize(spans)
+    stage_lines = {line.split()[0]: line.split()[1:] for line in lines[1:] if not line.startswith("   slow")}
+    
+    server = main.NEMOToolServer(main.load_config({'MQTT_HMAC_KEY': 'trace-test-key', 'HISTORY_DIR': ''}))
+    signed = codec.dumps(sign_payload('trace-test-key', json.dumps({"tool_id": 8, "tool_name": "asher", "usage_id": 1,
+                                                                   "user_name": "A B"})))
+    server.handle_nemo_message("nemo/tools/8/start", signed.encode(), server.sources[0])
+    stages = Counter(span[1] for span in server.tracer.ring.snapshot())
+    
+    results = [
+        check(kept == [3, 4, 5], f"Ring of 3 keeps the newest spans after wrapping: {kept}"),
+        check({stage: fields[0] for stage, fields in stage_lines.items()}
+              == {"decode": "2", "hmac": "1", "log": "1", "total": "2"} and stage_lines["log"][1] == "1.000",
+              "Summary has one line per stage counting messages, repeated marks summed"),
+        check(lines[-2] == "   slow #1 nemo/tools/1/start 8.000 ms: hmac 6.000, decode 2.000"
+              and lines[-1] == "   slow #2 nemo/tools/2/end 2.000 ms: decode 1.000, log 1.000",
+              "Slowest messages listed with their stage breakdown"),
+        check(stages["envelope"] == 1 and stages["hmac"] == 1 and stages["total"] == 1,
+              f"One envelope and one hmac span for a signed message: {dict(stages)}"),
+    ]
+    return all(results)
+
+def test_config_reload_rotation():
+    """Test that a config reload rotating MQTT_HMAC_KEY keeps the old key valid only within the window"""
+    print_header("Config Reload Key Rotation Test")
+    
+    import codec
+    import main
+    from hmac_keyring import sign_payload
+    from tracing import NULL_TRACE
+    
+    settings = {'MQTT_HMAC_KEY': 'old-key', 'HISTORY_DIR': '', 'MQTT_HMAC_ROTATION_WINDOW_SECONDS': '0.3'}
+    server = main.NEMOToolServer(main.load_config(settings))
+    source = server.sources[0]
+    
+    def accepted(key):
+        envelope = sign_payload(key, json.dumps({"tool_id": 9, "tool_name": "asher"}))
+        return server._handle_nemo_message("nemo/tools/9/enabled", codec.dumps(envelope).encode(), NULL_TRACE, source)
+    
+    server.apply_config(main.load_config(dict(settings, MQTT_HMAC_KEY='new-key', INGEST_TOOL_RATE_LIMIT='7')))
+    in_window = (accepted('new-key'), accepted('old-key'), accepted('other-key'))
+    time.sleep(0.4)
+    after_window = (accepted('new-key'), accepted('old-key'))
+    
+    results = [
+        check(in_window == (True, True, False), f"New and old key accepted inside the rotation window: {in_window}"),
+        check(after_window == (True, False), f"Old key rejected once the window has passed: {after_window}"),
+        check(server.config['mqtt_hmac_key'] == 'new-key' and server.admission.tool_rate == 7,
+              "Reloaded config swapped in and applied without a restart"),
+    ]
+    return all(results)
+
+def test_sampling_profiler():
+    """Test that a profile samples other threads into a folded-stack file and only one runs at a time"""
+    print_header("Sampling Profiler Test")
+    
+    from profiler import SamplingProfiler
+    
+    stop = threading.Event()
+    
+    def busy_loop():
+        while not stop.is_set():
+            sum(range(1000))
+    
+    worker = threading.Thread(target=busy_loop, name="busy-worker", daemon=True)
+    worker.start()
+    with tempfile.TemporaryDirectory() as output_dir:
+        profiler = SamplingProfiler(output_dir=output_dir, interval=0.005, max_seconds=0.3)
+        first = profiler.start(5, reason="test")
+        second = profiler.start(5, reason="test")
+        deadline = time.monotonic() + 2.0
+        while profiler.running() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        stop.set()
+        lines = []
+        if profiler.last_path:
+            with open(profiler.last_path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+    busy = [line for line in lines if line.startswith("busy-worker;") and "busy_loop (test_system.py:" in line]
+    
+    results = [
+        check(first and not second, "Second profile refused while one is running"),
+        check(not profiler.running(), "Profile capped at max_seconds and finished"),
+        check(bool(busy) and all(line.rsplit(" ", 1)[1].isdigit() for line in lines),
+              f"Folded stacks name the busy thread and its function ({len(lines)} stacks)"),
+    ]
+    return all(results)
+
+# Tests that need no running broker, server or hardware
+HERMETIC_TESTS = ("Message Parsing", "Import Time", "Admission Control", "Admission Tool Rate Burst",
+                  "Outbound Publisher", "Resync Engine", "Event Ordering", "Forwarding Correlator",
+                  "Load Generator Ordering", "Admin Topic Auth", "Payload Encoding",
+                  "Fleet Registry", "NEMO Sources", "Utilization Tracker", "Status Templates",
+                  "Span Tracing", "Config Reload Key Rotation", "Sampling Profiler",
+                  "Hermetic Forward Path")
+
+def run_all_tests(hermetic_only=False):
+    """Run all system tests (only self-contained ones when hermetic_only is set)"""
     print_header("NEMO Tool Display - System Test Suite")
     print(f"Test started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
@@ -275,9 +1110,29 @@ def run_all_tests():
         ("System Processes", test_system_processes),
         ("Port Connectivity", test_ports),
         ("Message Parsing", test_message_parsing),
+        ("Import Time", test_import_time),
+        ("Admission Control", test_admission_control),
+        ("Admission Tool Rate Burst", test_admission_tool_rate_burst),
+        ("Outbound Publisher", test_outbound_publisher),
+        ("Resync Engine", test_resync_engine),
+        ("Event Ordering", test_event_ordering),
+        ("Forwarding Correlator", test_forwarding_correlator),
+        ("Load Generator Ordering", test_load_generator_ordering),
+        ("Admin Topic Auth", test_admin_topics),
+        ("Payload Encoding", test_payload_encoding),
+        ("Fleet Registry", test_fleet_registry),
+        ("NEMO Sources", test_nemo_sources),
+        ("Utilization Tracker", test_utilization_tracker),
+        ("Status Templates", test_status_templates),
+        ("Span Tracing", test_span_tracing),
+        ("Config Reload Key Rotation", test_config_reload_rotation),
+        ("Sampling Profiler", test_sampling_profiler),
+        ("Hermetic Forward Path", test_forward_path_inprocess),
         ("NEMO Connection", test_nemo_connection),
         ("ESP32 Connection", test_esp32_connection)
     ]
+    if hermetic_only:
+        tests = [(name, func) for name, func in tests if name in HERMETIC_TESTS]
     
     results = {}
     for test_name, test_func in tests:
@@ -309,5 +1164,5 @@ def run_all_tests():
         return False
 
 if __name__ == "__main__":
-    success = run_all_tests()
+    success = run_all_tests(hermetic_only="--hermetic" in sys.argv[1:])
     sys.exit(0 if success else 1)
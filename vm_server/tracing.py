@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Per-stage span tracing for the NEMO Tool Display VM server
+Each forwarded message records one span per stage (decode, envelope, hmac, parse,
+normalize, serialize, publish, ...) with monotonic nanosecond timestamps into a
+fixed-size ring buffer. A dump writes the buffer as a Chrome trace file (Perfetto,
+chrome://tracing) and logs per-stage percentiles plus the slowest messages
+"""
+
+import itertools
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import codec
+
+logger = logging.getLogger(__name__)
+
+# Messages broken down stage by stage in the dump log
+SLOWEST_TRACES = 5
+
+
+class SpanRing:
+    """Fixed-size span buffer that never takes a lock.
+
+    Writers claim a slot with next() on an itertools.count (atomic under the GIL) and
+    store one tuple into it, so the NEMO network thread, the admission worker and the
+    publisher can all record concurrently; the oldest spans are overwritten.
+    Span tuple: (trace_id, stage, start_ns, duration_ns, topic).
+    """
+
+    def __init__(self, capacity: int = 8192):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._slots: List[Optional[tuple]] = [None] * capacity
+        self._cursor = itertools.count()
+
+    def record(self, span: tuple):
+        self._slots[next(self._cursor) % self.capacity] = span
+
+    def snapshot(self) -> List[tuple]:
+        """Current contents (copied; order by start time is up to the caller)"""
+        return [span for span in list(self._slots) if span is not None]
+
+
+class MessageTrace:
+    """Spans for one message: each mark() closes the stage that ran since the previous mark"""
+
+    __slots__ = ("ring", "trace_id", "topic", "started_ns", "_last_ns")
+
+    def __init__(self, ring: SpanRing, trace_id: int, topic: str):
+        self.ring = ring
+        self.trace_id = trace_id
+        self.topic = topic
+        self.started_ns = self._last_ns = time.perf_counter_ns()
+
+    def mark(self, stage: str):
+        now = time.perf_counter_ns()
+        self.ring.record((self.trace_id, stage, self._last_ns, now - self._last_ns, self.topic))
+        self._last_ns = now
+
+    def skip(self):
+        """Restart the clock without recording (time not owned by any stage)"""
+        self._last_ns = time.perf_counter_ns()
+
+    def finish(self):
+        """Record the whole message as a "total" span"""
+        now = time.perf_counter_ns()
+        self.ring.record((self.trace_id, "total", self.started_ns, now - self.started_ns, self.topic))
+
+
+class _NullTrace:
+    """Stand-in when tracing is off or the caller has no trace"""
+
+    __slots__ = ()
+
+    def mark(self, stage: str):
+        pass
+
+    def skip(self):
+        pass
+
+    def finish(self):
+        pass
+
+
+NULL_TRACE = _NullTrace()
+
+
+class SpanTracer:
+    """Hands out MessageTraces over one shared ring; capacity 0 disables tracing"""
+
+    def __init__(self, capacity: int = 8192, output_dir: str = "traces"):
+        self.ring = SpanRing(capacity) if capacity > 0 else None
+        self.output_dir = output_dir
+        self._ids = itertools.count(1)
+
+    @property
+    def enabled(self) -> bool:
+        return self.ring is not None
+
+    def begin(self, topic: str):
+        if self.ring is None:
+            return NULL_TRACE
+        return MessageTrace(self.ring, next(self._ids), topic)
+
+    def dump(self) -> Optional[str]:
+        """Write the buffered spans to ``<output_dir>/trace-<timestamp>.json`` and log a summary"""
+        if self.ring is None:
+            logger.warning("🧵 Trace dump requested but tracing is disabled (TRACE_BUFFER_SPANS=0)")
+            return None
+        spans = sorted(self.ring.snapshot(), key=lambda span: span[2])
+        if not spans:
+            logger.info("🧵 Trace dump: no spans recorded yet")
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"trace-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+        origin = spans[0][2]
+        events = [
+            {
+                "name": stage, "ph": "X", "pid": 1, "tid": trace_id,
+                "ts": (start - origin) / 1000, "dur": duration / 1000,
+                "args": {"topic": topic},
+            }
+            for trace_id, stage, start, duration, topic in spans
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(codec.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+        logger.info(f"🧵 Trace dump: {len(spans)} spans -> {path}")
+        for line in summarize(spans):
+            logger.info(line)
+        return path
+
+
+def _percentile(sorted_values: List[int], pct: float) -> int:
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(spans: List[tuple]) -> List[str]:
+    """Per-stage p50/p99/max (ms) and the slowest messages split by stage.
+    A stage marked more than once for a message (e.g. log) counts once, with its summed time."""
+    by_trace: Dict[int, Dict[str, int]] = {}
+    topics: Dict[int, str] = {}
+    for trace_id, stage, _start, duration, topic in spans:
+        stages = by_trace.setdefault(trace_id, {})
+        stages[stage] = stages.get(stage, 0) + duration
+        topics[trace_id] = topic
+    by_stage: Dict[str, List[int]] = {}
+    for stages in by_trace.values():
+        for stage, duration in stages.items():
+            by_stage.setdefault(stage, []).append(duration)
+
+    lines = ["   stage        count     p50 ms     p99 ms     max ms"]
+    for stage, durations in sorted(by_stage.items(), key=lambda item: -sum(item[1])):
+        durations.sort()
+        lines.append(
+            f"   {stage:<10} {len(durations):>7} {_percentile(durations, 50) / 1e6:>10.3f} "
+            f"{_percentile(durations, 99) / 1e6:>10.3f} {durations[-1] / 1e6:>10.3f}"
+        )
+
+    totals = {trace_id: sum(ns for stage, ns in stages.items() if stage != "total")
+              for trace_id, stages in by_trace.items()}
+    for trace_id in sorted(totals, key=totals.get, reverse=True)[:SLOWEST_TRACES]:
+        stages = by_trace[trace_id]
+        breakdown = ", ".join(f"{stage} {ns / 1e6:.3f}" for stage, ns in sorted(stages.items(), key=lambda item: -item[1])
+                              if stage != "total")
+        lines.append(f"   slow #{trace_id} {topics[trace_id]} {totals[trace_id] / 1e6:.3f} ms: {breakdown}")
+    return lines
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Streaming tool utilization for the NEMO Tool Display VM server
+Accumulates in-use, idle and disabled seconds per tool from the start/end/enabled/
+disabled events the server already forwards, into hourly and daily buckets kept in
+fixed-size array rings. Reports are read straight from the counters at any time,
+without replaying history
+"""
+
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+IN_USE, IDLE, DISABLED = 0, 1, 2
+STATE_NAMES = ("in_use", "idle", "disabled")
+# NEMO event -> state the tool is in from then on
+EVENT_STATES = {"start": IN_USE, "end": IDLE, "enabled": IDLE, "idle": IDLE, "disabled": DISABLED}
+
+# Ring sizes: hourly buckets cover two days, daily buckets five weeks
+HOURS = 48
+DAYS = 35
+# Event timestamps further ahead of the server clock than this are treated as "now"
+MAX_CLOCK_SKEW = 60.0
+
+
+class BucketRing:
+    """``size`` buckets of 3 state counters (seconds) for consecutive periods of ``period`` seconds.
+
+    Slot ``n % size`` holds period ``n``; ``ids`` records which period a slot holds,
+    so a slot is zeroed when it is reused for a newer period.
+    """
+
+    __slots__ = ("period", "size", "ids", "seconds")
+
+    def __init__(self, period: int, size: int):
+        self.period = period
+        self.size = size
+        self.ids = array("q", [-1]) * size
+        self.seconds = array("d", [0.0]) * (size * 3)
+
+    def add(self, state: int, start: float, end: float):
+        """Spread [start, end) over the periods it covers (only the last ``size`` are kept)"""
+        start = max(start, (int(end // self.period) - self.size + 1) * self.period)
+        while start < end:
+            n = int(start // self.period)
+            stop = min(end, (n + 1) * self.period)
+            slot = n % self.size
+            if self.ids[slot] != n:
+                self.ids[slot] = n
+                base = slot * 3
+                self.seconds[base] = self.seconds[base + 1] = self.seconds[base + 2] = 0.0
+            self.seconds[slot * 3 + state] += stop - start
+            start = stop
+
+    def copy(self) -> "BucketRing":
+        ring = BucketRing(self.period, self.size)
+        ring.ids, ring.seconds = array("q", self.ids), array("d", self.seconds)
+        return ring
+
+    def totals(self, n: int) -> List[float]:
+        """[in_use, idle, disabled] seconds of period ``n`` (zeros if not held)"""
+        slot = n % self.size
+        if self.ids[slot] != n:
+            return [0.0, 0.0, 0.0]
+        return list(self.seconds[slot * 3:slot * 3 + 3])
+
+
+class ToolUtilization:
+    """Current state of one tool and its hourly/daily rings"""
+
+    __slots__ = ("state", "since", "hours", "days", "events")
+
+    def __init__(self):
+        self.state: Optional[int] = None
+        self.since = 0.0
+        self.hours = BucketRing(3600, HOURS)
+        self.days = BucketRing(86400, DAYS)
+        self.events = 0
+
+
+def _block(seconds: List[float]) -> dict:
+    in_use, idle, disabled = seconds
+    block = {name: int(round(value)) for name, value in zip(STATE_NAMES, seconds)}
+    # Share of the time the tool was available (in use or idle) that it was in use
+    block["utilization"] = round(in_use / (in_use + idle), 3) if in_use + idle else None
+    return block
+
+
+class UtilizationTracker:
+    """Per-tool utilization counters fed by on_event().
+
+    Time is bucketed in local time (``utc_offset_hours``, the display timezone) so
+    daily buckets start at local midnight. Time before a tool's first event is not
+    counted; the open interval since a tool's last event is included in every report.
+    """
+
+    def __init__(self, utc_offset_hours: float = 0):
+        self.offset = utc_offset_hours * 3600
+        self.tools: Dict[str, ToolUtilization] = {}
+        self._lock = threading.Lock()
+        self.stats = {"events": 0, "clamped": 0}
+
+    def _accrue(self, usage: ToolUtilization, until: float):
+        if usage.state is not None and until > usage.since:
+            start, end = usage.since + self.offset, until + self.offset
+            usage.hours.add(usage.state, start, end)
+            usage.days.add(usage.state, start, end)
+        usage.since = max(usage.since, until)
+
+    def _rings(self, usage: ToolUtilization, now: float):
+        """Hourly/daily rings including the open interval, without moving ``since``
+        (so an event that arrives a little late is still counted from its own timestamp)"""
+        if usage.state is None or now <= usage.since:
+            return usage.hours, usage.days
+        hours, days = usage.hours.copy(), usage.days.copy()
+        start, end = usage.since + self.offset, now + self.offset
+        hours.add(usage.state, start, end)
+        days.add(usage.state, start, end)
+        return hours, days
+
+    def on_event(self, tool_id, event: str, when: Optional[float] = None, now: Optional[float] = None) -> bool:
+        """Apply one NEMO event (``when`` = its timestamp); True if the tool's state changed"""
+        state = EVENT_STATES.get(event)
+        if state is None:
+            return False
+        now = time.time() if now is None else now
+        when = now if when is None or when > now + MAX_CLOCK_SKEW else when
+        with self._lock:
+            usage = self.tools.get(str(tool_id))
+            if usage is None:
+                usage = self.tools[str(tool_id)] = ToolUtilization()
+                usage.since = when
+            elif when < usage.since:
+                # Older than time already counted; count it from there instead
+                self.stats["clamped"] += 1
+                when = usage.since
+            self._accrue(usage, when)
+            changed = usage.state != state
+            usage.state = state
+            usage.events += 1
+            self.stats["events"] += 1
+        return changed
+
+    def _report(self, tool_id: str, usage: ToolUtilization, now: float, hours: int, days: int) -> dict:
+        hour_ring, day_ring = self._rings(usage, now)
+        local = now + self.offset
+        hour, day = int(local // 3600), int(local // 86400)
+        hourly = [hour_ring.totals(n) for n in range(hour - hours + 1, hour + 1)]
+        daily = [day_ring.totals(n) for n in range(day - days + 1, day + 1)]
+        last_24h = [sum(h[i] for h in hourly[-24:]) for i in range(3)]
+        return {
+            "tool_id": tool_id,
+            "state": STATE_NAMES[usage.state] if usage.state is not None else None,
+            "since": int(usage.since),
+            "updated": int(now),
+            "last_24h": _block(last_24h),
+            "today": _block(daily[-1]),
+            # Oldest first; [in_use, idle, disabled] seconds; *_start is the UTC epoch of the first bucket
+            "hour_start": (hour - hours + 1) * 3600 - int(self.offset),
+            "hourly": [[int(round(s)) for s in h] for h in hourly],
+            "day_start": (day - days + 1) * 86400 - int(self.offset),
+            "daily": [[int(round(s)) for s in d] for d in daily],
+        }
+
+    def tool_report(self, tool_id, now: Optional[float] = None, hours: int = 24, days: int = 7) -> Optional[dict]:
+        """Counters for one tool up to now (last ``hours`` hourly and ``days`` daily buckets)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            usage = self.tools.get(str(tool_id))
+            if usage is None:
+                return None
+            return self._report(str(tool_id), usage, now, min(hours, HOURS), min(days, DAYS))
+
+    def reports(self, now: Optional[float] = None, hours: int = 24, days: int = 7) -> List[dict]:
+        now = time.time() if now is None else now
+        with self._lock:
+            return [self._report(tool_id, usage, now, min(hours, HOURS), min(days, DAYS))
+                    for tool_id, usage in self.tools.items()]
+
+    def summary_report(self, now: Optional[float] = None) -> dict:
+        """Last-24h and today figures for every tool (one small payload for dashboards)"""
+        reports = self.reports(now, hours=24, days=1)
+        return {
+            "updated": int(time.time() if now is None else now),
+            "tools": {r["tool_id"]: {"state": r["state"], "last_24h": r["last_24h"], "today": r["today"]}
+                      for r in reports},
+        }